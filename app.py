@@ -1,50 +1,181 @@
-from dash import Dash, html, dcc
+from dash import Dash, DiskcacheManager, html, dcc
+from flask import Response, g, jsonify, request, send_file
+from urllib.parse import urlparse
 import dash
+import diskcache
+import json
+import os
+import time
+import uuid
+
+from utils.batch import TEST_FILES, run_test
+from utils.jobs import job_result_path, job_status
+from utils.lazy import WARMUP, warm_up
+from utils.metrics import configure_logging, record_callback, registry, render_prometheus
+from utils.store import DATA_DIR
+from utils.uploads import MAX_CHUNK_BYTES, UploadError, uploads
+
+# Structured JSON logs on stderr
+configure_logging()
+
+# Report generators run as background jobs, tracked in a disk cache shared by all workers
+background_callback_manager = DiskcacheManager(diskcache.Cache(os.path.join(DATA_DIR, "jobs")))
 
 # Initialize Dash app with multi-page support and callback exception suppression
 app = Dash(
     __name__,
     use_pages=True,
-    suppress_callback_exceptions=True
+    suppress_callback_exceptions=True,
+    background_callback_manager=background_callback_manager
 )
 server = app.server
 
-# App layout
-app.layout = html.Div([
 
-    # Header with logo and navigation
-    html.Div([
-        # Logo (on the left)
-        html.Img(src="/assets/moore-logo.svg", className="logo"),
-        html.Link(rel='icon', href='/assets/moore-logo.ico', type='image/x-icon'),
+# Chunked, resumable uploads: POST /upload starts one, PUT /upload/<id>?offset=N
+# appends a chunk, and GET /upload/<id> reports how much has been received
+@server.route("/upload", methods=["POST"])
+def start_upload():
+    body = request.get_json(silent=True) or {}
+    try:
+        return jsonify(uploads.create(body.get("filename"), body.get("size", -1)))
+    except (UploadError, TypeError, ValueError) as e:
+        return str(e), 400
+
+
+@server.route("/upload/<upload_id>", methods=["GET", "PUT"])
+def upload_chunk(upload_id):
+    try:
+        if request.method == "PUT":
+            if (request.content_length or 0) > MAX_CHUNK_BYTES:
+                return "Chunk is too large", 413
+            offset = int(request.args.get("offset", -1))
+            return jsonify(uploads.append(upload_id, offset, request.get_data()))
+        return jsonify(uploads.status(upload_id))
+    except (UploadError, ValueError) as e:
+        return str(e), 400
+
+
+# Finished results are streamed from disk rather than base64-encoded into a callback
+# response. Conditional responses answer Range and If-None-Match requests, so an
+# interrupted download resumes where it stopped.
+@server.route("/download/<session_id>/<job>")
+def download_result(session_id, job):
+    try:
+        meta = job_status(session_id, job)
+        path = job_result_path(session_id, job)
+    except ValueError:
+        return "No such result", 404
+    if not meta or meta["state"] != "done" or path is None:
+        return "No such result", 404
+    return send_file(path, as_attachment=True, download_name=meta["filename"], conditional=True, max_age=0)
+
+
+PAGE_PATHS = {page["relative_path"] for page in dash.page_registry.values()}
+
+
+# JSON API for the same tests as the pages, on files sent through /upload.
+# Body: {"files": {role: upload id}, "mapping": {...}, "options": {...}, "limit": rows per sheet}
+API_ROW_LIMIT = 1000
+
+
+@server.route("/api/<test>", methods=["POST"])
+def run_api_test(test):
+    if test not in TEST_FILES:
+        return jsonify(error=f"Unknown test: {test}"), 404
+    body = request.get_json(silent=True) or {}
+    started = time.perf_counter()
+    try:
+        limit = int(body.get("limit", API_ROW_LIMIT))
+        if limit < 0:
+            raise ValueError("limit must not be negative")
+        files = {role: {"id": upload_id} for role, upload_id in (body.get("files") or {}).items()}
+        for ref in files.values():
+            uploads.path(ref["id"])
+        sheets, info = run_test(test, files, body.get("mapping") or {}, body.get("options"))
+    except (UploadError, KeyError, TypeError, ValueError) as e:
+        return jsonify(error=str(e)), 400
+
+    return jsonify(
+        test=test,
+        seconds=round(time.perf_counter() - started, 4),
+        **info,
+        sheets={
+            name: {"rows": len(frame),
+                   "records": json.loads(frame.head(limit).to_json(orient="records", date_format="iso"))}
+            for name, frame in sheets.items()
+        }
+    )
+
+
+# Every Dash callback request is timed and counted, labelled by its outputs and page
+@server.before_request
+def start_timer():
+    g.started = time.perf_counter()
 
-        # Page links (on the right)
+
+@server.after_request
+def record_callback_metrics(response):
+    if request.path.endswith("/_dash-update-component") and "started" in g:
+        page = urlparse(request.referrer or "").path or "/"
+        # Only registered pages become labels, so arbitrary URLs can't grow the series count
+        if page not in PAGE_PATHS:
+            page = "other"
+        record_callback(request.get_json(silent=True) or {}, page, response.status_code,
+                        time.perf_counter() - g.started, poll="cacheKey" in request.args)
+    return response
+
+
+# Prometheus scrape endpoint, summed over all workers and background jobs
+@server.route("/metrics")
+def metrics():
+    return Response(render_prometheus(registry.collect()), mimetype="text/plain; version=0.0.4")
+
+
+# App layout (a function, so each new browser session gets its own session id)
+def serve_layout():
+    return html.Div([
+
+        # Per-tab session id; pages key their server-side datasets on it
+        dcc.Store(id="session-id", data=uuid.uuid4().hex, storage_type="session"),
+
+        # Header with logo and navigation
         html.Div([
-            dcc.Link(
-                f"{page['name']}",
-                href=page["relative_path"],
-                className='menu-item'
-            )
-            for page in dash.page_registry.values()
-        ], className='menu'),
-    ], className="header"),
-
-    html.Hr(),
-
-    # Page content will be rendered here
-    dash.page_container,
-
-    # Footer
-    html.Div([
+            # Logo (on the left)
+            html.Img(src="/assets/moore-logo.svg", className="logo"),
+            html.Link(rel='icon', href='/assets/moore-logo.ico', type='image/x-icon'),
+
+            # Page links (on the right)
+            html.Div([
+                dcc.Link(
+                    f"{page['name']}",
+                    href=page["relative_path"],
+                    className='menu-item'
+                )
+                for page in dash.page_registry.values()
+            ], className='menu'),
+        ], className="header"),
+
         html.Hr(),
-        html.H4("Support:"),
-        html.H5("Address:"),
-        html.H5("Silver Stream Business Park, 10 Muswell Road, Bryanston, Sandton, 2191"),
-        html.H5("Email:"),
-        html.H5("Harrys@mooreinfinity.com"),
-    ], className="footer")
-])
-
-# Run the app
+
+        # Page content will be rendered here
+        dash.page_container,
+
+        # Footer
+        html.Div([
+            html.Hr(),
+            html.H4("Support:"),
+            html.H5("Address:"),
+            html.H5("Silver Stream Business Park, 10 Muswell Road, Bryanston, Sandton, 2191"),
+            html.H5("Email:"),
+            html.H5("Harrys@mooreinfinity.com"),
+        ], className="footer")
+    ])
+
+
+app.layout = serve_layout
+
+# Run the app (under gunicorn, warm-up starts from gunicorn.conf.py)
 if __name__ == '__main__':
+    if WARMUP:
+        warm_up()
     app.run_server(debug=True)
@@ -0,0 +1,147 @@
+// Streams uploaded files to the server's /upload route in chunks, so page
+// callbacks only ever carry the returned upload reference, never the file.
+// Chunks are sliced from the File itself: dcc.Upload would first read the whole
+// file into a base64 data URL, so its drop and file-picker events are taken
+// here, before React sees them. The filename and button callbacks on those
+// references also run here.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    uploads: {
+        push: async function (file, options) {
+            const CHUNK_BYTES = 4 * 1024 * 1024;
+            const MAX_RETRIES = 5;
+            const filename = file.name;
+
+            const report = function (text) {
+                if (options.status && window.dash_clientside.set_props) {
+                    window.dash_clientside.set_props(options.status, {children: text});
+                }
+            };
+
+            // Reject unsupported files before anything is read or sent
+            const types = (options.accept || "").split(",").filter(Boolean);
+            if (types.length && !types.some(function (type) { return filename.toLowerCase().endsWith(type); })) {
+                report("❌ " + filename + " is not a supported file type (" + types.join(", ") + ")");
+                return null;
+            }
+            const maxBytes = Number(options.maxBytes || 0);
+            if (maxBytes && file.size > maxBytes) {
+                report("❌ " + filename + " is too large (limit " + Math.floor(maxBytes / (1024 * 1024)) + " MB)");
+                return null;
+            }
+
+            const created = await fetch("/upload", {
+                method: "POST",
+                headers: {"Content-Type": "application/json"},
+                body: JSON.stringify({filename: filename, size: file.size})
+            });
+            if (!created.ok) {
+                report("❌ Upload failed: " + (await created.text()));
+                return null;
+            }
+            let status = await created.json();
+
+            let retries = 0;
+            while (!status.complete) {
+                const offset = status.received;
+                try {
+                    const response = await fetch("/upload/" + status.id + "?offset=" + offset, {
+                        method: "PUT",
+                        headers: {"Content-Type": "application/octet-stream"},
+                        body: file.slice(offset, offset + CHUNK_BYTES)
+                    });
+                    if (!response.ok) {
+                        throw new Error(await response.text());
+                    }
+                    status = await response.json();
+                    retries = 0;
+                } catch (err) {
+                    // Resume from whatever the server actually received
+                    if (++retries > MAX_RETRIES) {
+                        report("❌ Upload failed: " + err.message);
+                        return null;
+                    }
+                    await new Promise(function (resolve) { setTimeout(resolve, 500 * retries); });
+                    status = await (await fetch("/upload/" + status.id)).json();
+                }
+                report("⏳ Uploading " + filename + ": " +
+                       Math.floor(100 * status.received / Math.max(status.size, 1)) + "%");
+            }
+
+            return {id: status.id, filename: status.filename, size: status.size};
+        },
+
+        // Files dropped on or picked in one upload box, pushed in turn. The box's
+        // reference store gets the one reference, or with multiple files the list
+        // of them; if any file fails nothing from this drop is stored.
+        pushFiles: async function (files, options) {
+            const multiple = options.multiple === "true";
+            const refs = [];
+            for (const file of (multiple ? files : files.slice(0, 1))) {
+                const ref = await window.dash_clientside.uploads.push(file, options);
+                if (!ref) {
+                    return null;
+                }
+                refs.push(ref);
+            }
+            window.dash_clientside.set_props(options.ref, {data: multiple ? refs : refs[0]});
+            return refs;
+        },
+
+        // Capture-phase handler for drop and change events anywhere on the page
+        intercept: function (event) {
+            const box = event.target && event.target.closest ? event.target.closest("[data-upload-ref]") : null;
+            if (!box) {
+                return false;
+            }
+            const picked = event.type === "drop" ? event.dataTransfer && event.dataTransfer.files : event.target.files;
+            const files = Array.from(picked || []);
+            if (!files.length) {
+                return false;
+            }
+            event.preventDefault();
+            event.stopPropagation();
+            if (event.type === "drop") {
+                // The drop never reaches the drop zone, so end its drag highlight
+                event.target.dispatchEvent(new Event("dragleave", {bubbles: true}));
+            } else {
+                // Picking the same file again fires another change
+                event.target.value = "";
+            }
+            window.dash_clientside.uploads.pushFiles(files, {
+                ref: box.dataset.uploadRef,
+                status: box.dataset.uploadStatus,
+                accept: box.dataset.uploadAccept,
+                maxBytes: box.dataset.uploadMaxBytes,
+                multiple: box.dataset.uploadMultiple
+            });
+            return true;
+        },
+
+        // References of a multiple-file box's latest drop, added to those already uploaded
+        append: function (added, current) {
+            if (!added) {
+                return window.dash_clientside.no_update;
+            }
+            return (current || []).concat(added);
+        },
+
+        // A failed push leaves its error message in place
+        uploaded: function (upload) {
+            if (!upload) {
+                return window.dash_clientside.no_update;
+            }
+            if (Array.isArray(upload)) {
+                return "✅ Uploaded: " + upload.map(function (ref) { return ref.filename; }).join(", ");
+            }
+            return "✅ Uploaded: " + upload.filename;
+        },
+
+        // True (button disabled) until every upload has a reference
+        missing: function (...uploads) {
+            return !uploads.every(Boolean);
+        }
+    }
+});
+
+window.addEventListener("drop", window.dash_clientside.uploads.intercept, true);
+window.addEventListener("change", window.dash_clientside.uploads.intercept, true);
@@ -0,0 +1,20 @@
+// Result files are served by the /download route rather than sent through a
+// callback. An <a download> click fetches one without leaving the page, and
+// a failed request shows as a failed download instead of an error page.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    downloads: {
+        start: function (url) {
+            if (!url) {
+                return window.dash_clientside.no_update;
+            }
+            const link = document.createElement("a");
+            link.href = url;
+            link.download = "";
+            document.body.appendChild(link);
+            link.click();
+            link.remove();
+            // Clears the URL store, so the same URL downloads again next time
+            return true;
+        }
+    }
+});
@@ -0,0 +1,80 @@
+"""Run the TB vs TB, inventory, GL trace and duplicate journal tests over many clients without the UI.
+
+    python batch.py clients.json --workers 8 --output results/
+
+The config lists one entry per client and test. File paths are relative to
+the config file. Mappings give the source column for each canonical column,
+either per file role or once for all of a test's files, and can be shared
+by name:
+
+    {
+      "mappings": {
+        "sage": {"ACCOUNT CODE": "Account", "ACCOUNT NAME": "Name", "AMOUNT": "Balance"},
+        "sage-gl": {"ACCOUNT CODE": "Acc", "ACCOUNT NAME": "Name", "TRANSACTION DATE": "Date",
+                    "TRANSACTION SOURCE": "Source", "LEAD SHEET NUMBER": "Lead", "AMOUNT": "Amount",
+                    "TRANSACTION NUMBER": "Journal", "DOCUMENT NUMBER": "Document"}
+      },
+      "clients": [
+        {"name": "acme", "test": "tb", "mapping": "sage",
+         "files": {"current": "acme/tb_2025.xlsx", "prior": "acme/tb_2024.xlsx", "gl": "acme/gl.csv"}},
+        {"name": "acme", "test": "inventory", "options": {"tolerance": 1},
+         "files": {"current": "acme/stock_2025.csv", "prior": "acme/stock_2024.csv", "movement": "acme/moves.csv"},
+         "mapping": {"ITEM CODE": "SKU", "ITEM NAME": "Description", "QUANTITY": "Qty"}},
+        {"name": "acme", "test": "gl", "options": {"leads": [[100, 200], [300, 400]]},
+         "files": {"gl": "acme/gl.csv"}, "mapping": "sage-gl"},
+        {"name": "acme", "test": "duplicates", "options": {"days_apart": 3},
+         "files": {"gl": "acme/gl.csv"}, "mapping": "sage-gl"}
+      ]
+    }
+
+Each client's result is written to the output directory as an Excel
+workbook, or as a zip of CSV or Parquet files with "format": "csv" or
+"parquet" (set per client or for the whole config), with a summary.json and
+summary.csv of per-client status, rows and stage timings.
+The exit status is non-zero if any client failed.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+from utils.batch import load_config, run_batch
+from utils.loaders import CPUS
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("config", help="JSON batch config")
+    parser.add_argument("--output", help="directory for results and the summary (default: config's output)")
+    parser.add_argument("--workers", type=int, help="parallel clients (default: config's workers, else usable cores)")
+    args = parser.parse_args(argv)
+
+    config, jobs = load_config(args.config)
+    output = args.output or config.get("output", "batch_results")
+    workers = args.workers or config.get("workers") or CPUS
+
+    def report(summary):
+        detail = summary["error"] or f"{summary.get('rows', 0):,} rows"
+        print(f"{summary['status']:<7}{summary['client']:<24}{summary['test']:<11}"
+              f"{summary['seconds']:>8.2f}s  {detail}", flush=True)
+
+    started = time.perf_counter()
+    summaries = run_batch(jobs, output, workers=workers, on_result=report)
+    elapsed = time.perf_counter() - started
+
+    with open(os.path.join(output, "summary.json"), "w") as f:
+        json.dump({"seconds": round(elapsed, 4), "workers": workers, "clients": summaries}, f, indent=2)
+    # Sheet row counts vary by test, so they stay in the JSON summary only
+    table = pd.json_normalize([{k: v for k, v in s.items() if k != "sheets"} for s in summaries])
+    table.to_csv(os.path.join(output, "summary.csv"), index=False)
+
+    failed = sum(s["status"] != "done" for s in summaries)
+    print(f"{len(summaries) - failed} done, {failed} failed in {elapsed:.1f}s on {workers} workers")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
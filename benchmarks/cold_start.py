@@ -0,0 +1,102 @@
+"""Cold-start budget: how long a fresh worker takes to import the app and serve its first page.
+
+Run from the repository root:
+
+    python -m benchmarks.cold_start
+    MOORE_LAZY_IMPORTS=0 python -m benchmarks.cold_start --runs 3
+
+Each run starts a new interpreter, imports app (which registers every page),
+then requests the index, layout and callback map. It also times the
+background warm-up of the data libraries. The median of the runs is checked
+against the "cold_start" budget in thresholds.json. With lazy imports on,
+the run also fails if importing the app loaded any of the heavy modules.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+THRESHOLDS_PATH = os.path.join(ROOT, "benchmarks", "thresholds.json")
+
+# Runs in the fresh interpreter; prints one JSON line of timings
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app
+from utils.lazy import HEAVY_MODULES, LAZY_IMPORTS, warm_up
+imported = time.perf_counter()
+loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+client = app.server.test_client()
+for path in ("/", "/_dash-layout", "/_dash-dependencies"):
+    assert client.get(path).status_code == 200, path
+served = time.perf_counter()
+warm_up().join()
+warmed = time.perf_counter()
+print(json.dumps({"import_seconds": imported - started, "first_request_seconds": served - imported,
+                  "warm_up_seconds": warmed - served, "lazy": LAZY_IMPORTS, "loaded_at_import": loaded}))
+"""
+
+METRICS = ["process_seconds", "import_seconds", "first_request_seconds", "warm_up_seconds"]
+
+
+def probe(env):
+    started = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, env=env, check=True,
+                         capture_output=True, text=True).stdout
+    result = json.loads(out.strip().splitlines()[-1])
+    result["process_seconds"] = time.perf_counter() - started
+    return result
+
+
+def check_budget(summary, budget):
+    # thresholds.json: {"cold_start": {metric: seconds}}
+    failures = [f"{metric} {summary[metric]:.3f}s > {limit}s"
+                for metric, limit in budget.items() if summary.get(metric, 0) > limit]
+    if summary["lazy"] and summary["loaded_at_import"]:
+        failures.append(f"importing the app loaded {', '.join(summary['loaded_at_import'])}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="write the runs and their median as JSON")
+    parser.add_argument("--thresholds", default=THRESHOLDS_PATH)
+    args = parser.parse_args(argv)
+
+    scratch = tempfile.mkdtemp(prefix="moore-cold-start-")
+    env = dict(os.environ, MOORE_DATA_DIR=scratch, PYTHONDONTWRITEBYTECODE="1")
+    try:
+        # A discarded first run fills the OS file cache, so the measured runs compare like with like
+        probe(env)
+        runs = [probe(env) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    summary = {metric: round(statistics.median(r[metric] for r in runs), 4) for metric in METRICS}
+    summary["lazy"] = runs[-1]["lazy"]
+    summary["loaded_at_import"] = sorted({name for r in runs for name in r["loaded_at_import"]})
+    print("  ".join(f"{metric} {summary[metric]:.2f}s" for metric in METRICS),
+          f" ({'lazy' if summary['lazy'] else 'eager'} imports, median of {args.runs})")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "summary": summary, "runs": runs}, f, indent=2)
+
+    failures = []
+    if args.thresholds and os.path.exists(args.thresholds):
+        with open(args.thresholds) as f:
+            failures = check_budget(summary, json.load(f).get("cold_start", {}))
+    for failure in failures:
+        print("REGRESSION:", failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+"""Synthetic-data benchmarks for the TB vs TB, Inventory and GL trace pipelines.
+
+Run from the repository root:
+
+    python -m benchmarks.run --sizes 10000 100000
+    python -m benchmarks.run --pages gl --sizes 1000000 --leads 40 --txns-per-lead 5000
+
+Each page's pipeline is timed stage by stage (decode, parse, map, trace,
+write) with the peak RSS seen during the stage. Results are written as JSON;
+the run exits non-zero when a result breaks a budget in thresholds.json or is
+slower than --baseline by more than --max-slowdown.
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import pandas as pd
+import psutil
+
+# The app's stores are created at import time, so point them at a scratch directory first
+SCRATCH_DIR = tempfile.mkdtemp(prefix="moore-bench-")
+os.environ.setdefault("MOORE_DATA_DIR", SCRATCH_DIR)
+
+from benchmarks.synthetic import (GL_HEADERS, INVENTORY_HEADERS, TB_HEADERS, make_gl,  # noqa: E402
+                                  make_inventory_set, make_tb_set)
+from utils.cache import parsed_frames  # noqa: E402
+from utils.exports import DEFAULT_EXPORT_FORMAT, EXPORT_FORMATS, export_filename, write_export  # noqa: E402
+from utils.inventory import INVENTORY_COLUMNS, inventory_rollforward  # noqa: E402
+from utils.loaders import read_upload, read_uploads  # noqa: E402
+from utils.schema import compact, from_minor_units  # noqa: E402
+from utils.tb import TB_COLUMNS, tb_rollforward  # noqa: E402
+from utils.trace import GL_COLUMNS, trace_lead_pair  # noqa: E402
+from utils.uploads import MAX_CHUNK_BYTES, uploads  # noqa: E402
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000, 5_000_000]
+PAGES = ["tb", "inventory", "gl"]
+THRESHOLDS_PATH = os.path.join(os.path.dirname(__file__), "thresholds.json")
+# How often the memory sampler polls RSS, in seconds
+SAMPLE_INTERVAL = 0.01
+NOISE_SECONDS = 0.1
+
+
+class StageTimer:
+    """Times named stages and tracks the peak RSS reached inside each one."""
+
+    def __init__(self):
+        self.process = psutil.Process()
+        self.stages = {}
+        self._peak = 0
+        self._sampling = False
+
+    def _sample(self):
+        while self._sampling:
+            self._peak = max(self._peak, self.process.memory_info().rss)
+            time.sleep(SAMPLE_INTERVAL)
+
+    def run(self, name, func, *args, **kwargs):
+        self._peak = self.process.memory_info().rss
+        self._sampling = True
+        sampler = threading.Thread(target=self._sample, daemon=True)
+        sampler.start()
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            self._sampling = False
+            sampler.join()
+            self._peak = max(self._peak, self.process.memory_info().rss)
+            self.stages[name] = {"seconds": round(elapsed, 4), "peak_rss_mb": round(self._peak / 2**20, 1)}
+
+
+def _data_url(df):
+    # What the browser hands dcc.Upload: the whole csv as a base64 data URL
+    return "data:text/csv;base64," + base64.b64encode(df.to_csv(index=False).encode()).decode()
+
+
+def _decode_and_store(data_url, filename):
+    # The old callbacks decoded the data URL; the upload route now stores chunks
+    data = base64.b64decode(data_url.split(",", 1)[1])
+    status = uploads.create(filename, len(data))
+    for offset in range(0, len(data), MAX_CHUNK_BYTES):
+        status = uploads.append(status["id"], offset, data[offset:offset + MAX_CHUNK_BYTES])
+    return {"id": status["id"], "filename": filename, "size": status["size"]}
+
+
+def _map(df, headers, columns, label):
+    df = df.rename(columns={source: target for target, source in headers.items()}, copy=False)
+    return compact(df[columns], label)
+
+
+def _write_result(results, fmt):
+    path = os.path.join(SCRATCH_DIR, export_filename("result", fmt))
+    write_export({name: from_minor_units(frame) for name, frame in results.items()}, path, fmt)
+    return os.path.getsize(path)
+
+
+def _roll_forward_case(timer, files, headers, columns, engine, fmt):
+    urls = [_data_url(df) for df in files]
+    refs = timer.run("decode", lambda: [_decode_and_store(url, f"file{i}.csv") for i, url in enumerate(urls)])
+    frames = timer.run("parse", lambda: read_uploads(*[(ref, list(headers.values())) for ref in refs]))
+    mapped = timer.run("map", lambda: [_map(df, headers, columns, "bench") for df in frames])
+    results = timer.run("trace", engine, *mapped)
+    timer.run("write", _write_result, results, fmt)
+    return {"input_rows": [len(df) for df in files]}
+
+
+def bench_tb(timer, rows, args):
+    files = make_tb_set(rows, seed=args.seed)
+    return _roll_forward_case(timer, files, TB_HEADERS, TB_COLUMNS, tb_rollforward, args.format)
+
+
+def bench_inventory(timer, rows, args):
+    files = make_inventory_set(rows, seed=args.seed)
+    return _roll_forward_case(timer, files, INVENTORY_HEADERS, INVENTORY_COLUMNS, inventory_rollforward,
+                              args.format)
+
+
+def bench_gl(timer, rows, args):
+    gl = make_gl(rows, leads=args.leads, txns_per_lead=args.txns_per_lead, seed=args.seed)
+    leads = sorted(gl[GL_HEADERS["LEAD SHEET NUMBER"]].unique())[:2]
+    url = _data_url(gl)
+    del gl
+
+    ref = timer.run("decode", _decode_and_store, url, "gl.csv")
+    df = timer.run("parse", read_upload, ref, columns=list(GL_HEADERS.values()))
+    df = timer.run("map", _map, df, GL_HEADERS, GL_COLUMNS, "GL")
+    results = timer.run("trace", trace_lead_pair, df, *leads)
+    sheets = dict(zip(["Existence-Found", "Existence-Not-Found", "Completeness-Found", "Completeness-NoTFound"],
+                      results))
+    timer.run("write", _write_result, sheets, args.format)
+    return {"input_rows": [rows], "leads": args.leads, "txns_per_lead": args.txns_per_lead}
+
+
+BENCHES = {"tb": bench_tb, "inventory": bench_inventory, "gl": bench_gl}
+
+
+def run_case(page, rows, args):
+    parsed_frames.clear()
+    timer = StageTimer()
+    info = BENCHES[page](timer, rows, args)
+    result = {
+        "page": page,
+        "rows": rows,
+        "stages": timer.stages,
+        "total_seconds": round(sum(s["seconds"] for s in timer.stages.values()), 4),
+        "peak_rss_mb": max(s["peak_rss_mb"] for s in timer.stages.values()),
+    }
+    result.update(info)
+    return result
+
+
+def check_thresholds(results, thresholds):
+    # thresholds.json: {page: {rows: {"total_seconds": budget, "peak_rss_mb": budget}}}
+    failures = []
+    for result in results:
+        budget = thresholds.get(result["page"], {}).get(str(result["rows"]), {})
+        for metric, limit in budget.items():
+            if result[metric] > limit:
+                failures.append(f"{result['page']} @ {result['rows']} rows: {metric} {result[metric]} > {limit}")
+    return failures
+
+
+def check_baseline(results, baseline, max_slowdown):
+    previous = {(r["page"], r["rows"]): r for r in baseline["results"]}
+    failures = []
+    for result in results:
+        before = previous.get((result["page"], result["rows"]))
+        if before is None:
+            continue
+        for stage, timing in result["stages"].items():
+            old = before["stages"].get(stage, {}).get("seconds")
+            # Differences under NOISE_SECONDS are scheduling noise, not regressions
+            if old and timing["seconds"] - old > NOISE_SECONDS and timing["seconds"] > old * max_slowdown:
+                failures.append(f"{result['page']} @ {result['rows']} rows: {stage} "
+                                f"{timing['seconds']:.3f}s vs {old:.3f}s baseline")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", nargs="+", choices=PAGES, default=PAGES)
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES,
+                        help="GL / movement-report rows per case")
+    parser.add_argument("--leads", type=int, default=20, help="lead sheets in the synthetic GL")
+    parser.add_argument("--txns-per-lead", type=int, default=1000, help="journals per lead sheet")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default=DEFAULT_EXPORT_FORMAT,
+                        help="result file format written in the write stage")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--thresholds", default=THRESHOLDS_PATH)
+    parser.add_argument("--baseline", help="earlier results file to compare stage timings against")
+    parser.add_argument("--max-slowdown", type=float, default=1.25)
+    args = parser.parse_args(argv)
+
+    results = []
+    try:
+        for rows in args.sizes:
+            for page in args.pages:
+                result = run_case(page, rows, args)
+                results.append(result)
+                stages = "  ".join(f"{name} {s['seconds']:.2f}s" for name, s in result["stages"].items())
+                print(f"{page:<10}{rows:>10,} rows  {stages}  total {result['total_seconds']:.2f}s  "
+                      f"peak {result['peak_rss_mb']:.0f} MB", flush=True)
+    finally:
+        shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "cpus": os.cpu_count(),
+        "args": vars(args),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    failures = []
+    if args.thresholds and os.path.exists(args.thresholds):
+        with open(args.thresholds) as f:
+            failures += check_thresholds(results, json.load(f))
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures += check_baseline(results, json.load(f), args.max_slowdown)
+    for failure in failures:
+        print("REGRESSION:", failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+# Column names as a client export might have them, so the mapping step has work to do
+GL_HEADERS = {
+    "ACCOUNT CODE": "GL Account",
+    "ACCOUNT NAME": "Account Description",
+    "TRANSACTION DATE": "Posting Date",
+    "TRANSACTION SOURCE": "Source",
+    "LEAD SHEET NUMBER": "Lead Sheet",
+    "AMOUNT": "Amount",
+    "TRANSACTION NUMBER": "Journal No",
+    "DOCUMENT NUMBER": "Document No",
+}
+TB_HEADERS = {"ACCOUNT CODE": "Account", "ACCOUNT NAME": "Account Name", "AMOUNT": "Closing Balance"}
+INVENTORY_HEADERS = {"ITEM CODE": "SKU", "ITEM NAME": "Description", "QUANTITY": "Qty"}
+
+SOURCES = np.array(["AP", "AR", "GJ", "PAY", "INV", "FA"])
+
+
+def _amounts(rng, n, scale=5000):
+    return np.round(rng.lognormal(0, 1.5, n) * scale / 10 * rng.choice([-1, 1], n), 2)
+
+
+def _accounts(rng, leads, accounts):
+    # Each account belongs to one (numbered) lead sheet
+    codes = np.arange(100000, 100000 + accounts)
+    return pd.DataFrame({
+        "code": codes,
+        "name": [f"Account {c}" for c in codes],
+        "lead": (np.arange(leads) + 1)[rng.integers(0, leads, accounts)] * 10,
+    })
+
+
+def make_gl(rows, leads=20, txns_per_lead=1000, accounts=None, seed=0):
+    # Lines are spread over leads * txns_per_lead journals; each journal mostly
+    # posts within its own lead sheet and crosses into others a third of the time
+    rng = np.random.default_rng(seed)
+    accounts = accounts or max(leads * 5, rows // 200)
+    chart = _accounts(rng, leads, accounts)
+    by_lead = chart.groupby("lead").indices
+    lead_names = np.array(sorted(by_lead))
+
+    txns = max(1, leads * txns_per_lead)
+    txn = rng.integers(0, txns, rows)
+    home = txn % len(lead_names)
+    cross = rng.random(rows) < 1 / 3
+    lead_idx = np.where(cross, rng.integers(0, len(lead_names), rows), home)
+
+    # Pick an account inside the chosen lead sheet
+    sizes = np.array([len(by_lead[name]) for name in lead_names])
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    ordered = np.concatenate([by_lead[name] for name in lead_names])
+    account = ordered[offsets[lead_idx] + (rng.random(rows) * sizes[lead_idx]).astype(np.int64)]
+
+    dates = pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 365, rows), unit="D")
+    gl = pd.DataFrame({
+        "ACCOUNT CODE": chart["code"].values[account],
+        "ACCOUNT NAME": chart["name"].values[account],
+        "TRANSACTION DATE": dates.strftime("%Y-%m-%d"),
+        "TRANSACTION SOURCE": SOURCES[txn % len(SOURCES)],
+        "LEAD SHEET NUMBER": lead_names[lead_idx],
+        "AMOUNT": _amounts(rng, rows),
+        "TRANSACTION NUMBER": txn.astype(str),
+        "DOCUMENT NUMBER": np.char.add("D", rng.integers(0, rows, rows).astype(str)),
+    })
+    return gl.rename(columns=GL_HEADERS)
+
+
+def make_tb_set(rows, accounts=None, seed=0):
+    # Current TB, prior TB and a GL of `rows` lines that mostly roll forward;
+    # a few accounts are added, dropped or off by a small amount
+    rng = np.random.default_rng(seed)
+    accounts = accounts or max(100, rows // 100)
+    chart = _accounts(rng, 1, accounts)
+
+    prior = pd.DataFrame({"ACCOUNT CODE": chart["code"], "ACCOUNT NAME": chart["name"],
+                          "AMOUNT": _amounts(rng, accounts, 50000)})
+    gl = pd.DataFrame({"ACCOUNT CODE": rng.choice(chart["code"].values, rows),
+                       "AMOUNT": _amounts(rng, rows)})
+    gl["ACCOUNT NAME"] = "Account " + gl["ACCOUNT CODE"].astype(str)
+
+    current = prior.copy()
+    current["AMOUNT"] = np.round(current["AMOUNT"] + current["ACCOUNT CODE"].map(
+        gl.groupby("ACCOUNT CODE")["AMOUNT"].sum()).fillna(0), 2)
+    changed = rng.random(accounts) < 0.01
+    current.loc[changed, "AMOUNT"] += 1
+    current = current[rng.random(accounts) > 0.005]
+
+    return (current.rename(columns=TB_HEADERS), prior.rename(columns=TB_HEADERS),
+            gl[["ACCOUNT CODE", "ACCOUNT NAME", "AMOUNT"]].rename(columns=TB_HEADERS))
+
+
+def make_inventory_set(rows, items=None, seed=0):
+    # Current stock, prior stock and a movement report of `rows` lines
+    rng = np.random.default_rng(seed)
+    items = items or max(100, rows // 10)
+    codes = np.char.add("SKU", np.arange(items).astype(str))
+
+    prior = pd.DataFrame({"ITEM CODE": codes, "ITEM NAME": np.char.add("Item ", codes),
+                          "QUANTITY": rng.integers(0, 1000, items)})
+    movement = pd.DataFrame({"ITEM CODE": rng.choice(codes, rows),
+                             "QUANTITY": rng.integers(-20, 21, rows)})
+    movement["ITEM NAME"] = "Item " + movement["ITEM CODE"]
+
+    current = prior.copy()
+    current["QUANTITY"] += current["ITEM CODE"].map(
+        movement.groupby("ITEM CODE")["QUANTITY"].sum()).fillna(0).astype(np.int64)
+    current.loc[rng.random(items) < 0.01, "QUANTITY"] += 3
+
+    return (current.rename(columns=INVENTORY_HEADERS), prior.rename(columns=INVENTORY_HEADERS),
+            movement[["ITEM CODE", "ITEM NAME", "QUANTITY"]].rename(columns=INVENTORY_HEADERS))
@@ -0,0 +1,18 @@
+import os
+
+# Cores this process may run on; cpu_count() reports the host's inside a container
+CPUS = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+# Session datasets are shared through local disk (utils/store.py), so any worker
+# can serve any request. Each worker imports pandas and pyarrow on warm-up, and
+# parse processes are capped server-wide (MOORE_PARSE_WORKERS), so the default
+# stays at two to fit a 512 MB instance; set WEB_CONCURRENCY to run more on larger ones.
+workers = int(os.environ.get("WEB_CONCURRENCY", min(2, CPUS)))
+
+
+def post_worker_init(worker):
+    # Pages import pandas and friends lazily; load them in the background now
+    # the worker is up, rather than inside the first user's request
+    from utils.lazy import WARMUP, warm_up
+    if WARMUP:
+        warm_up()
@@ -1,8 +1,12 @@
 import dash
-from dash import html, dcc, Output, Input, State
-import pandas as pd
-import io
-import base64
+from dash import html, dcc, Output, Input, State, ClientsideFunction
+
+from utils.exports import DEFAULT_EXPORT_FORMAT, export_filename, export_options, write_export
+from utils.jobs import JobProgress, download_url, last_result_view
+from utils.inventory import DEFAULT_TOLERANCE, inventory_rollforward, map_inventory_columns
+from utils.loaders import prefetch_upload, read_uploads, sniff_upload, upload_key
+from utils.mappings import remember_mapping, suggest_mapping
+from utils.uploads import upload_box
 
 # ✅ Register the page correctly with a nice menu label
 dash.register_page(__name__, name="Inventory", path="/inventory")
@@ -13,61 +17,22 @@ layout = html.Div([
 
     # Upload 1: Current Year Inventory
     html.Div([
-        dcc.Upload(
-            id='upload-inventory-1',
-            children=html.Div(['Drag or Select CURRENT Year Inventory Report']),
-            style={
-                'width': '48%',
-                'height': '60px',
-                'lineHeight': '60px',
-                'borderWidth': '1px',
-                'borderStyle': 'dashed',
-                'borderRadius': '5px',
-                'textAlign': 'center',
-                'margin': '10px'
-            },
-            multiple=False
-        ),
+        upload_box('upload-inventory-1', 'Drag or Select CURRENT Year Inventory Report', 'upload-inventory-1-ref', 'inventory-name-1'),
+        dcc.Store(id='upload-inventory-1-ref'),
         html.Div(id='inventory-name-1', style={"marginLeft": "10px", "color": "green"})
     ]),
 
     # Upload 2: Prior Year Inventory
     html.Div([
-        dcc.Upload(
-            id='upload-inventory-2',
-            children=html.Div(['Drag or Select PRIOR Year Inventory Report']),
-            style={
-                'width': '48%',
-                'height': '60px',
-                'lineHeight': '60px',
-                'borderWidth': '1px',
-                'borderStyle': 'dashed',
-                'borderRadius': '5px',
-                'textAlign': 'center',
-                'margin': '10px'
-            },
-            multiple=False
-        ),
+        upload_box('upload-inventory-2', 'Drag or Select PRIOR Year Inventory Report', 'upload-inventory-2-ref', 'inventory-name-2'),
+        dcc.Store(id='upload-inventory-2-ref'),
         html.Div(id='inventory-name-2', style={"marginLeft": "10px", "color": "green"})
     ]),
 
     # Upload 3: Movement Report
     html.Div([
-        dcc.Upload(
-            id='upload-inventory-3',
-            children=html.Div(['Drag or Select MOVEMENT Report']),
-            style={
-                'width': '48%',
-                'height': '60px',
-                'lineHeight': '60px',
-                'borderWidth': '1px',
-                'borderStyle': 'dashed',
-                'borderRadius': '5px',
-                'textAlign': 'center',
-                'margin': '10px'
-            },
-            multiple=False
-        ),
+        upload_box('upload-inventory-3', 'Drag or Select MOVEMENT Report', 'upload-inventory-3-ref', 'inventory-name-3'),
+        dcc.Store(id='upload-inventory-3-ref'),
         html.Div(id='inventory-name-3', style={"marginLeft": "10px", "color": "green"})
     ]),
 
@@ -76,87 +41,92 @@ layout = html.Div([
     html.Div(id="inventory-column-mapping-2"),
     html.Div(id="inventory-column-mapping-3"),
 
+    # Quantity variances at or below this still count as rolling forward
+    html.Div([
+        html.Label("Quantity Tolerance", style={"marginRight": "10px"}),
+        dcc.Input(id="inventory-tolerance", type="number", min=0, value=DEFAULT_TOLERANCE)
+    ], style={"marginTop": "20px"}),
+
+    dcc.RadioItems(id="inventory-export-format", options=export_options(), value=DEFAULT_EXPORT_FORMAT,
+                   inline=True, style={"marginTop": "20px"}),
+
     # Download Button
     html.Button("Download Result", id="inventory-download-btn", n_clicks=0, disabled=True, style={"marginTop": "20px"}),
+    html.Button("Cancel", id="inventory-cancel-btn", n_clicks=0, disabled=True, style={"marginTop": "20px", "marginLeft": "10px"}),
 
     dcc.Loading(
         id="inventory-loading-spinner",
         type="default",
-        children=html.Div(id="inventory-download-status", style={"marginTop": "10px", "color": "#0074D9"})
+        overlay_style={"visibility": "visible"},
+        children=html.Div([
+            html.Div(id="inventory-download-progress", style={"marginTop": "10px", "color": "#0074D9"}),
+            html.Div(id="inventory-download-status", style={"marginTop": "10px", "color": "#0074D9"})
+        ])
     ),
 
-    dcc.Download(id="inventory-download-excel")
+    html.Div(id="inventory-last-result", style={"marginTop": "10px"}),
+
+    dcc.Store(id="inventory-download-url")
 ])
 
 # Callbacks
-@dash.callback(Output('inventory-name-1', 'children'), Input('upload-inventory-1', 'filename'), prevent_initial_call=True)
-def update_inventory_name1(name):
-    return f"✅ Uploaded: {name}" if name else ""
-
-@dash.callback(Output('inventory-name-2', 'children'), Input('upload-inventory-2', 'filename'), prevent_initial_call=True)
-def update_inventory_name2(name):
-    return f"✅ Uploaded: {name}" if name else ""
-
-@dash.callback(Output('inventory-name-3', 'children'), Input('upload-inventory-3', 'filename'), prevent_initial_call=True)
-def update_inventory_name3(name):
-    return f"✅ Uploaded: {name}" if name else ""
-
-@dash.callback(
+# Each upload box streams its file to the upload route; callbacks below only see its reference
+for i in (1, 2, 3):
+    dash.clientside_callback(
+        ClientsideFunction(namespace="uploads", function_name="uploaded"),
+        Output(f'inventory-name-{i}', 'children'),
+        Input(f'upload-inventory-{i}-ref', 'data'),
+        prevent_initial_call=True
+    )
+
+dash.clientside_callback(
+    ClientsideFunction(namespace="uploads", function_name="missing"),
     Output("inventory-download-btn", "disabled"),
-    Input("upload-inventory-1", "contents"),
-    Input("upload-inventory-2", "contents"),
-    Input("upload-inventory-3", "contents"),
+    Input("upload-inventory-1-ref", "data"),
+    Input("upload-inventory-2-ref", "data"),
+    Input("upload-inventory-3-ref", "data"),
     prevent_initial_call=True
 )
-def toggle_download_button(file1, file2, file3):
-    return not all([file1, file2, file3])
-
-# Helpers for column detection
-def parse_columns(contents):
-    decoded = base64.b64decode(contents.split(',')[1])
-    df = pd.read_excel(io.BytesIO(decoded), engine='openpyxl')
-    return df.columns.tolist()
-
-@dash.callback(Output("inventory-column-mapping-1", "children"), Input('upload-inventory-1', 'contents'), prevent_initial_call=True)
-def show_mapping_1(contents):
-    if contents:
-        cols = parse_columns(contents)
-        return html.Div([
-            html.H5("Map Columns for Current Year Inventory"),
-            dcc.Dropdown(id='item-code-dropdown-1', options=[{'label': c, 'value': c} for c in cols], placeholder="Select Item Code"),
-            dcc.Dropdown(id='item-name-dropdown-1', options=[{'label': c, 'value': c} for c in cols], placeholder="Select Item Name"),
-            dcc.Dropdown(id='quantity-dropdown-1', options=[{'label': c, 'value': c} for c in cols], placeholder="Select Quantity")
-        ])
 
-@dash.callback(Output("inventory-column-mapping-2", "children"), Input('upload-inventory-2', 'contents'), prevent_initial_call=True)
-def show_mapping_2(contents):
-    if contents:
-        cols = parse_columns(contents)
-        return html.Div([
-            html.H5("Map Columns for Prior Year Inventory"),
-            dcc.Dropdown(id='item-code-dropdown-2', options=[{'label': c, 'value': c} for c in cols], placeholder="Select Item Code"),
-            dcc.Dropdown(id='item-name-dropdown-2', options=[{'label': c, 'value': c} for c in cols], placeholder="Select Item Name"),
-            dcc.Dropdown(id='quantity-dropdown-2', options=[{'label': c, 'value': c} for c in cols], placeholder="Select Quantity")
-        ])
-
-@dash.callback(Output("inventory-column-mapping-3", "children"), Input('upload-inventory-3', 'contents'), prevent_initial_call=True)
-def show_mapping_3(contents):
-    if contents:
-        cols = parse_columns(contents)
-        return html.Div([
-            html.H5("Map Columns for Movement Report"),
-            dcc.Dropdown(id='item-code-dropdown-3', options=[{'label': c, 'value': c} for c in cols], placeholder="Select Item Code"),
-            dcc.Dropdown(id='item-name-dropdown-3', options=[{'label': c, 'value': c} for c in cols], placeholder="Select Item Name"),
-            dcc.Dropdown(id='quantity-dropdown-3', options=[{'label': c, 'value': c} for c in cols], placeholder="Select Quantity")
-        ])
+# Column mapping for an upload, filled in from a saved profile for its
+# header layout or else the closest header names
+def mapping_view(upload, i, title):
+    cols, _ = sniff_upload(upload)
+    mapping, saved = suggest_mapping("inventory", cols)
+    if saved:
+        # Known layout: parse just the mapped columns before the report is asked for
+        prefetch_upload(upload, list(mapping.values()))
+    options = [{'label': c, 'value': c} for c in cols]
+    return html.Div([
+        html.H5(f"Map Columns for {title}"),
+        html.Div("✅ Saved mapping for this layout applied" if saved else "", style={"color": "green"}),
+        dcc.Dropdown(id=f'item-code-dropdown-{i}', options=options, value=mapping["ITEM CODE"], placeholder="Select Item Code"),
+        dcc.Dropdown(id=f'item-name-dropdown-{i}', options=options, value=mapping["ITEM NAME"], placeholder="Select Item Name"),
+        dcc.Dropdown(id=f'quantity-dropdown-{i}', options=options, value=mapping["QUANTITY"], placeholder="Select Quantity")
+    ])
+
+@dash.callback(Output("inventory-column-mapping-1", "children"), Input('upload-inventory-1-ref', 'data'), prevent_initial_call=True)
+def show_mapping_1(upload):
+    if upload:
+        return mapping_view(upload, 1, "Current Year Inventory")
+
+@dash.callback(Output("inventory-column-mapping-2", "children"), Input('upload-inventory-2-ref', 'data'), prevent_initial_call=True)
+def show_mapping_2(upload):
+    if upload:
+        return mapping_view(upload, 2, "Prior Year Inventory")
+
+@dash.callback(Output("inventory-column-mapping-3", "children"), Input('upload-inventory-3-ref', 'data'), prevent_initial_call=True)
+def show_mapping_3(upload):
+    if upload:
+        return mapping_view(upload, 3, "Movement Report")
 
 @dash.callback(
-    Output("inventory-download-excel", "data"),
+    Output("inventory-download-url", "data"),
     Output("inventory-download-status", "children"),
     Input("inventory-download-btn", "n_clicks"),
-    State("upload-inventory-1", "contents"),
-    State("upload-inventory-2", "contents"),
-    State("upload-inventory-3", "contents"),
+    State("upload-inventory-1-ref", "data"),
+    State("upload-inventory-2-ref", "data"),
+    State("upload-inventory-3-ref", "data"),
     State('item-code-dropdown-1', 'value'),
     State('item-name-dropdown-1', 'value'),
     State('quantity-dropdown-1', 'value'),
@@ -166,29 +136,68 @@ def show_mapping_3(contents):
     State('item-code-dropdown-3', 'value'),
     State('item-name-dropdown-3', 'value'),
     State('quantity-dropdown-3', 'value'),
+    State("inventory-tolerance", "value"),
+    State("session-id", "data"),
+    State("inventory-export-format", "value"),
+    background=True,
+    progress=Output("inventory-download-progress", "children"),
+    running=[
+        (Output("inventory-cancel-btn", "disabled"), False, True),
+        (Output("inventory-download-progress", "style"), {"display": "block"}, {"display": "none"}),
+    ],
+    cancel=[Input("inventory-cancel-btn", "n_clicks")],
     prevent_initial_call=True
 )
-def generate_inventory_excel(n_clicks, file1, file2, file3,
+def generate_inventory_excel(set_progress, n_clicks, file1, file2, file3,
                              code1, name1, qty1,
                              code2, name2, qty2,
-                             code3, name3, qty3):
-    def parse(contents):
-        return pd.read_excel(io.BytesIO(base64.b64decode(contents.split(',')[1])), engine='openpyxl')
-
+                             code3, name3, qty3, tolerance, session_id, export_format):
     if not all([file1, file2, file3, code1, name1, qty1, code2, name2, qty2, code3, name3, qty3]):
         return None, "❌ Please upload all files and map all columns."
 
+    progress = JobProgress(set_progress, session_id, "inventory_result")
     try:
-        df1 = parse(file1).rename(columns={code1: "ITEM CODE", name1: "ITEM NAME", qty1: "QUANTITY"})
-        df2 = parse(file2).rename(columns={code2: "ITEM CODE", name2: "ITEM NAME", qty2: "QUANTITY"})
-        df3 = parse(file3).rename(columns={code3: "ITEM CODE", name3: "ITEM NAME", qty3: "QUANTITY"})
-
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            df1.to_excel(writer, index=False, sheet_name='Current Inventory')
-            df2.to_excel(writer, index=False, sheet_name='Prior Inventory')
-            df3.to_excel(writer, index=False, sheet_name='Movement Report')
-        output.seek(0)
-        return dcc.send_bytes(output.getvalue(), filename="inventory_result.xlsx"), "✅ Excel file ready for download."
+        progress.stage("decode")
+        for upload in (file1, file2, file3):
+            upload_key(upload)
+
+        progress.stage("parse")
+        df1, df2, df3 = read_uploads(
+            (file1, [code1, name1, qty1]),
+            (file2, [code2, name2, qty2]),
+            (file3, [code3, name3, qty3]),
+        )
+        progress.rows(df1, df2, df3)
+
+        progress.stage("map")
+        df1 = map_inventory_columns(df1, code1, name1, qty1, "Current Inventory")
+        df2 = map_inventory_columns(df2, code2, name2, qty2, "Prior Inventory")
+        df3 = map_inventory_columns(df3, code3, name3, qty3, "Movement Report")
+
+        progress.stage("trace")
+        results = inventory_rollforward(df1, df2, df3, tolerance=tolerance or DEFAULT_TOLERANCE)
+
+        # The mappings worked, so the next upload with the same layouts is mapped already
+        for upload, selected in ((file1, [code1, name1, qty1]), (file2, [code2, name2, qty2]),
+                                 (file3, [code3, name3, qty3])):
+            remember_mapping("inventory", upload, selected)
+
+        progress.stage("write")
+        filename = export_filename("inventory_result", export_format)
+        progress.done(filename, lambda path: write_export(results, path, export_format))
+        return download_url(session_id, "inventory_result"), f"✅ {filename} ready for download."
     except Exception as e:
+        progress.failed(str(e))
         return None, f"❌ Error: {str(e)}"
+
+# Offer the last finished result again, e.g. after a page refresh
+@dash.callback(Output("inventory-last-result", "children"), Input("inventory-download-status", "children"), State("session-id", "data"))
+def show_last_inventory_result(status, session_id):
+    return last_result_view(session_id, "inventory_result")
+
+dash.clientside_callback(
+    ClientsideFunction(namespace="downloads", function_name="start"),
+    Output("inventory-download-url", "clear_data"),
+    Input("inventory-download-url", "data"),
+    prevent_initial_call=True
+)
@@ -1,8 +1,13 @@
 import dash
-from dash import html, dcc, Output, Input, State
-import pandas as pd
-import io
-import base64
+from dash import html, dcc, Output, Input, State, ClientsideFunction
+
+from utils.exports import DEFAULT_EXPORT_FORMAT, export_filename, export_options, write_export
+from utils.jobs import JobProgress, download_url, last_result_view
+from utils.loaders import is_large_upload, iter_upload_chunks, prefetch_upload, read_uploads, sniff_upload, upload_key
+from utils.mappings import remember_mapping, suggest_mapping
+from utils.schema import from_minor_units
+from utils.tb import map_tb_columns, tb_rollforward, tb_rollforward_chunked
+from utils.uploads import upload_box
 
 # Register the page
 dash.register_page(__name__, path='/tb-tb', name="TB vs TB")
@@ -14,61 +19,22 @@ layout = html.Div([
 
     # Upload 1: Current Year TB
     html.Div([
-        dcc.Upload(
-            id='upload-file-1',
-            children=html.Div(['Drag or Select CURRENT Year Trial Balance']),
-            style={
-                'width': '48%',
-                'height': '60px',
-                'lineHeight': '60px',
-                'borderWidth': '1px',
-                'borderStyle': 'dashed',
-                'borderRadius': '5px',
-                'textAlign': 'center',
-                'margin': '10px'
-            },
-            multiple=False
-        ),
+        upload_box('upload-file-1', 'Drag or Select CURRENT Year Trial Balance', 'upload-file-1-ref', 'file-name-1'),
+        dcc.Store(id='upload-file-1-ref'),
         html.Div(id='file-name-1', style={"marginLeft": "10px", "color": "green"})
     ]),
 
     # Upload 2: Prior Year TB
     html.Div([
-        dcc.Upload(
-            id='upload-file-2',
-            children=html.Div(['Drag or Select PRIOR Year Trial Balance']),
-            style={
-                'width': '48%',
-                'height': '60px',
-                'lineHeight': '60px',
-                'borderWidth': '1px',
-                'borderStyle': 'dashed',
-                'borderRadius': '5px',
-                'textAlign': 'center',
-                'margin': '10px'
-            },
-            multiple=False
-        ),
+        upload_box('upload-file-2', 'Drag or Select PRIOR Year Trial Balance', 'upload-file-2-ref', 'file-name-2'),
+        dcc.Store(id='upload-file-2-ref'),
         html.Div(id='file-name-2', style={"marginLeft": "10px", "color": "green"})
     ]),
 
     # Upload 3: General Ledger
     html.Div([
-        dcc.Upload(
-            id='upload-file-3',
-            children=html.Div(['Drag or Select GENERAL LEDGER']),
-            style={
-                'width': '48%',
-                'height': '60px',
-                'lineHeight': '60px',
-                'borderWidth': '1px',
-                'borderStyle': 'dashed',
-                'borderRadius': '5px',
-                'textAlign': 'center',
-                'margin': '10px'
-            },
-            multiple=False
-        ),
+        upload_box('upload-file-3', 'Drag or Select GENERAL LEDGER', 'upload-file-3-ref', 'file-name-3'),
+        dcc.Store(id='upload-file-3-ref'),
         html.Div(id='file-name-3', style={"marginLeft": "10px", "color": "green"})
     ]),
 
@@ -77,114 +43,104 @@ layout = html.Div([
     html.Div(id="column-mapping-2"),
     html.Div(id="column-mapping-3"),
 
+    dcc.RadioItems(id="export-format", options=export_options(), value=DEFAULT_EXPORT_FORMAT,
+                   inline=True, style={"marginTop": "20px"}),
     html.Button("Download Result", id="download-btn", n_clicks=0, disabled=True, style={"marginTop": "20px"}),
+    html.Button("Cancel", id="cancel-btn", n_clicks=0, disabled=True, style={"marginTop": "20px", "marginLeft": "10px"}),
 
-    # Loading spinner and status message
+    # Loading spinner, stage progress and status message
     dcc.Loading(
         id="loading-spinner",
         type="default",  # Show default spinner
-        children=html.Div(id="download-status", style={"marginTop": "10px", "color": "#0074D9"})
+        overlay_style={"visibility": "visible"},  # Keep the progress readout visible while loading
+        children=html.Div([
+            html.Div(id="download-progress", style={"marginTop": "10px", "color": "#0074D9"}),
+            html.Div(id="download-status", style={"marginTop": "10px", "color": "#0074D9"})
+        ])
     ),
 
-    dcc.Download(id="download-excel")
-])
-
-# Display filenames after upload
-@dash.callback(
-    Output('file-name-1', 'children'),
-    Input('upload-file-1', 'filename'),
-    prevent_initial_call=True
-)
-def update_filename1(name):
-    return f"✅ Uploaded: {name}" if name else ""
+    # Result of the last run in this session, kept across page refreshes
+    html.Div(id="last-result", style={"marginTop": "10px"}),
 
-@dash.callback(
-    Output('file-name-2', 'children'),
-    Input('upload-file-2', 'filename'),
-    prevent_initial_call=True
-)
-def update_filename2(name):
-    return f"✅ Uploaded: {name}" if name else ""
+    # Set to the finished result's download URL, which the browser then fetches
+    dcc.Store(id="download-url")
+])
 
-@dash.callback(
-    Output('file-name-3', 'children'),
-    Input('upload-file-3', 'filename'),
-    prevent_initial_call=True
-)
-def update_filename3(name):
-    return f"✅ Uploaded: {name}" if name else ""
+# Each upload box streams its file to the upload route; callbacks below only see
+# its reference. Display filenames after upload (in the browser, no server round trip)
+for i in (1, 2, 3):
+    dash.clientside_callback(
+        ClientsideFunction(namespace="uploads", function_name="uploaded"),
+        Output(f'file-name-{i}', 'children'),
+        Input(f'upload-file-{i}-ref', 'data'),
+        prevent_initial_call=True
+    )
 
 # Enable download button only when all files are uploaded
-@dash.callback(
+dash.clientside_callback(
+    ClientsideFunction(namespace="uploads", function_name="missing"),
     Output("download-btn", "disabled"),
-    Input("upload-file-1", "contents"),
-    Input("upload-file-2", "contents"),
-    Input("upload-file-3", "contents"),
+    Input("upload-file-1-ref", "data"),
+    Input("upload-file-2-ref", "data"),
+    Input("upload-file-3-ref", "data"),
     prevent_initial_call=True
 )
-def toggle_download_button(file1, file2, file3):
-    return not all([file1, file2, file3])
 
-# Display column mappings for each file after upload
+def mapping_view(upload, i, title):
+    columns, _ = sniff_upload(upload)
+    mapping, saved = suggest_mapping("tb", columns)
+    if saved and not is_large_upload(upload):
+        # Known layout: parse just the mapped columns before the report is asked for
+        prefetch_upload(upload, list(mapping.values()))
+    options = [{'label': col, 'value': col} for col in columns]
+    return html.Div([
+        html.H5(f"Map Columns for {title}"),
+        html.Div("✅ Saved mapping for this layout applied" if saved else "", style={"color": "green"}),
+        dcc.Dropdown(id=f'account-code-dropdown-{i}', options=options, value=mapping["ACCOUNT CODE"], placeholder="Select Account Code"),
+        dcc.Dropdown(id=f'account-name-dropdown-{i}', options=options, value=mapping["ACCOUNT NAME"], placeholder="Select Account Name"),
+        dcc.Dropdown(id=f'amount-dropdown-{i}', options=options, value=mapping["AMOUNT"], placeholder="Select Amount")
+    ])
+
+# Display column mappings for each file after upload, filled in from a saved
+# profile for the file's header layout or else the closest header names
 @dash.callback(
     Output("column-mapping-1", "children"),
-    Input('upload-file-1', 'contents'),
+    Input('upload-file-1-ref', 'data'),
     prevent_initial_call=True
 )
-def display_column_mapping_1(contents):
-    if contents is None:
+def display_column_mapping_1(upload):
+    if upload is None:
         return ""
-    df = pd.read_excel(io.BytesIO(base64.b64decode(contents.split(',')[1])), engine='openpyxl')
-    columns = df.columns.tolist()
-    return html.Div([
-        html.H5("Map Columns for Current Year Trial Balance"),
-        dcc.Dropdown(id='account-code-dropdown-1', options=[{'label': col, 'value': col} for col in columns], placeholder="Select Account Code"),
-        dcc.Dropdown(id='account-name-dropdown-1', options=[{'label': col, 'value': col} for col in columns], placeholder="Select Account Name"),
-        dcc.Dropdown(id='amount-dropdown-1', options=[{'label': col, 'value': col} for col in columns], placeholder="Select Amount")
-    ])
+    return mapping_view(upload, 1, "Current Year Trial Balance")
 
 @dash.callback(
     Output("column-mapping-2", "children"),
-    Input('upload-file-2', 'contents'),
+    Input('upload-file-2-ref', 'data'),
     prevent_initial_call=True
 )
-def display_column_mapping_2(contents):
-    if contents is None:
+def display_column_mapping_2(upload):
+    if upload is None:
         return ""
-    df = pd.read_excel(io.BytesIO(base64.b64decode(contents.split(',')[1])), engine='openpyxl')
-    columns = df.columns.tolist()
-    return html.Div([
-        html.H5("Map Columns for Prior Year Trial Balance"),
-        dcc.Dropdown(id='account-code-dropdown-2', options=[{'label': col, 'value': col} for col in columns], placeholder="Select Account Code"),
-        dcc.Dropdown(id='account-name-dropdown-2', options=[{'label': col, 'value': col} for col in columns], placeholder="Select Account Name"),
-        dcc.Dropdown(id='amount-dropdown-2', options=[{'label': col, 'value': col} for col in columns], placeholder="Select Amount")
-    ])
+    return mapping_view(upload, 2, "Prior Year Trial Balance")
 
 @dash.callback(
     Output("column-mapping-3", "children"),
-    Input('upload-file-3', 'contents'),
+    Input('upload-file-3-ref', 'data'),
     prevent_initial_call=True
 )
-def display_column_mapping_3(contents):
-    if contents is None:
+def display_column_mapping_3(upload):
+    if upload is None:
         return ""
-    df = pd.read_excel(io.BytesIO(base64.b64decode(contents.split(',')[1])), engine='openpyxl')
-    columns = df.columns.tolist()
-    return html.Div([
-        html.H5("Map Columns for General Ledger"),
-        dcc.Dropdown(id='account-code-dropdown-3', options=[{'label': col, 'value': col} for col in columns], placeholder="Select Account Code"),
-        dcc.Dropdown(id='account-name-dropdown-3', options=[{'label': col, 'value': col} for col in columns], placeholder="Select Account Name"),
-        dcc.Dropdown(id='amount-dropdown-3', options=[{'label': col, 'value': col} for col in columns], placeholder="Select Amount")
-    ])
+    return mapping_view(upload, 3, "General Ledger")
 
 # Generate download file and show status
 @dash.callback(
-    Output("download-excel", "data"),
+    Output("download-url", "data"),
     Output("download-status", "children"),
     Input("download-btn", "n_clicks"),
-    State("upload-file-1", "contents"),
-    State("upload-file-2", "contents"),
-    State("upload-file-3", "contents"),
+    State("upload-file-1-ref", "data"),
+    State("upload-file-2-ref", "data"),
+    State("upload-file-3-ref", "data"),
     State('account-code-dropdown-1', 'value'),
     State('account-name-dropdown-1', 'value'),
     State('amount-dropdown-1', 'value'),
@@ -194,17 +150,21 @@ def display_column_mapping_3(contents):
     State('account-code-dropdown-3', 'value'),
     State('account-name-dropdown-3', 'value'),
     State('amount-dropdown-3', 'value'),
+    State("session-id", "data"),
+    State("export-format", "value"),
+    background=True,
+    progress=Output("download-progress", "children"),
+    running=[
+        (Output("cancel-btn", "disabled"), False, True),
+        (Output("download-progress", "style"), {"display": "block"}, {"display": "none"}),
+    ],
+    cancel=[Input("cancel-btn", "n_clicks")],
     prevent_initial_call=True
 )
-def generate_excel(n_clicks, curr_tb_content, prior_tb_content, gl_content,
+def generate_excel(set_progress, n_clicks, curr_tb_content, prior_tb_content, gl_content,
                    curr_account_code, curr_account_name, curr_amount,
                    prior_account_code, prior_account_name, prior_amount,
-                   gl_account_code, gl_account_name, gl_amount):
-
-    def parse_contents(contents):
-        content_type, content_string = contents.split(',')
-        decoded = base64.b64decode(content_string)
-        return pd.read_excel(io.BytesIO(decoded), engine="openpyxl")
+                   gl_account_code, gl_account_name, gl_amount, session_id, export_format):
 
     # Ensure all files and mappings are provided
     if not all([curr_tb_content, prior_tb_content, gl_content,
@@ -213,33 +173,77 @@ def generate_excel(n_clicks, curr_tb_content, prior_tb_content, gl_content,
                 gl_account_code, gl_account_name, gl_amount]):
         return None, "❌ Please upload all files and map columns before downloading."
 
+    progress = JobProgress(set_progress, session_id, "tb_result")
     try:
-        curr_tb = parse_contents(curr_tb_content)
-        prior_tb = parse_contents(prior_tb_content)
-        gl = parse_contents(gl_content)
+        progress.stage("decode")
+        for upload in (curr_tb_content, prior_tb_content, gl_content):
+            upload_key(upload)
+
+        # Only the mapped columns are read, with the files parsed side by side.
+        # A ledger too large for memory is streamed in chunks instead.
+        progress.stage("parse")
+        gl_columns = [gl_account_code, gl_account_name, gl_amount]
+        large_gl = is_large_upload(gl_content)
+        parses = [
+            (curr_tb_content, [curr_account_code, curr_account_name, curr_amount]),
+            (prior_tb_content, [prior_account_code, prior_account_name, prior_amount]),
+        ]
+        if not large_gl:
+            parses.append((gl_content, gl_columns))
+        frames = read_uploads(*parses)
+        progress.rows(*frames)
 
         # Apply mappings
-        curr_tb = curr_tb.rename(columns={curr_account_code: "ACCOUNT CODE",
-                                          curr_account_name: "ACCOUNT NAME",
-                                          curr_amount: "AMOUNT"})
+        progress.stage("map")
+        curr_tb = map_tb_columns(frames[0], curr_account_code, curr_account_name, curr_amount, "Current TB")
+        prior_tb = map_tb_columns(frames[1], prior_account_code, prior_account_name, prior_amount, "Prior TB")
+
+        # prior + GL movement = current, per account
+        if large_gl:
+            def gl_chunks():
+                for chunk in iter_upload_chunks(gl_content, columns=gl_columns):
+                    progress.rows(chunk)
+                    yield map_tb_columns(chunk, *gl_columns, "General Ledger")
+
+            progress.stage("trace")
+            results = tb_rollforward_chunked(curr_tb, prior_tb, gl_chunks())
+        else:
+            gl = map_tb_columns(frames[2], *gl_columns, "General Ledger")
+            progress.stage("trace")
+            results = tb_rollforward(curr_tb, prior_tb, gl)
+
+        # The mappings worked, so the next upload with the same layouts is mapped already
+        for upload, selected in ((curr_tb_content, [curr_account_code, curr_account_name, curr_amount]),
+                                 (prior_tb_content, [prior_account_code, prior_account_name, prior_amount]),
+                                 (gl_content, gl_columns)):
+            remember_mapping("tb", upload, selected)
+
+        # Stream the sheets to a file in the session store
+        progress.stage("write")
+        filename = export_filename("result", export_format)
+        sheets = {sheet_name: from_minor_units(frame) for sheet_name, frame in results.items()}
+        progress.done(filename, lambda path: write_export(sheets, path, export_format))
+        return download_url(session_id, "tb_result"), f"✅ {filename} ready for download."
 
-        prior_tb = prior_tb.rename(columns={prior_account_code: "ACCOUNT CODE",
-                                            prior_account_name: "ACCOUNT NAME",
-                                            prior_amount: "AMOUNT"})
+    except Exception as e:
+        progress.failed(str(e))
+        return None, f"❌ Error: {str(e)}"
 
-        gl = gl.rename(columns={gl_account_code: "ACCOUNT CODE",
-                                gl_account_name: "ACCOUNT NAME",
-                                gl_amount: "AMOUNT"})
 
-        # Output to Excel
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            curr_tb.to_excel(writer, index=False, sheet_name='Current TB')
-            prior_tb.to_excel(writer, index=False, sheet_name='Prior TB')
-            gl.to_excel(writer, index=False, sheet_name='General Ledger')
-        output.seek(0)
+# Offer the last finished result again, e.g. after a page refresh
+@dash.callback(
+    Output("last-result", "children"),
+    Input("download-status", "children"),
+    State("session-id", "data")
+)
+def show_last_result(status, session_id):
+    return last_result_view(session_id, "tb_result")
 
-        return dcc.send_bytes(output.getvalue(), filename="result.xlsx"), "✅ Excel file ready for download."
 
-    except Exception as e:
-        return None, f"❌ Error: {str(e)}"
+# Fetch the result in the browser, then clear the URL so the next run fetches again
+dash.clientside_callback(
+    ClientsideFunction(namespace="downloads", function_name="start"),
+    Output("download-url", "clear_data"),
+    Input("download-url", "data"),
+    prevent_initial_call=True
+)
@@ -1,118 +1,238 @@
 import dash
-from dash import html, dcc, Output, Input, State, callback_context, dash_table
-import pandas as pd
-import io
-import base64
-import difflib
+from dash import html, dcc, Output, Input, State, ClientsideFunction, callback_context, dash_table
+import logging
+import shutil
+
+from utils.exports import DEFAULT_EXPORT_FORMAT, export_filename, export_options, write_export
+from utils.jobs import JobProgress, download_url, job_result_path, last_result_view
+from utils.journals import DEFAULT_DAYS_APART, journal_duplicates, journal_frame
+from utils.ledger import GLLedger, ledger_key
+from utils.loaders import is_large_upload, iter_upload_chunks, read_upload, sniff_upload, upload_key
+from utils.mappings import remember_mapping, suggest_mapping
+from utils.results import TRACE_RESULTS, trace_results
+from utils.schema import compact, from_minor_units
+from utils.store import datasets
+from utils.tables import query_frame
+from utils.trace import (
+    GL_COLUMNS, LEAD, TXN, GLIndex, map_gl_columns, trace_cell, trace_lead_pair_chunked, trace_matrix
+)
+from utils.uploads import upload_box
 
 dash.register_page(__name__, path="/gl_mapping", name="GL Mapping")
 
-stored_data = {"gl_df": None, "lead_column": None}
+# The four trace outputs: session dataset name and workbook sheet
+TRACE_SHEETS = list(zip(TRACE_RESULTS, [
+    "Existence-Found", "Existence-Not-Found", "Completeness-Found", "Completeness-NoTFound"
+]))
+PREVIEW_PAGE_SIZE = 20
+
+logger = logging.getLogger(__name__)
 
 layout = html.Div([
     html.H2("Upload General Ledger and Map Columns"),
 
     html.Div([
-        dcc.Upload(
-            id='upload-gl',
-            children=html.Div(['Drag or Select General Ledger']),
-            style={
-                'width': '48%',
-                'height': '60px',
-                'lineHeight': '60px',
-                'borderWidth': '1px',
-                'borderStyle': 'dashed',
-                'borderRadius': '5px',
-                'textAlign': 'center',
-                'margin': '10px'
-            },
-            multiple=False
-        ),
-        html.Div(id='gl-file-name', style={"marginLeft": "10px", "color": "green"})
+        upload_box('upload-gl', 'Drag or Select General Ledger (one or more files, e.g. monthly extracts)',
+                   'upload-gl-new', 'gl-file-name', multiple=True),
+        # References of the latest drop, and of every GL file uploaded so far
+        dcc.Store(id='upload-gl-new'),
+        dcc.Store(id='upload-gl-refs'),
+        html.Div(id='gl-file-name', style={"marginLeft": "10px", "color": "green"}),
+        html.Button("Clear GL Files", id="gl-clear-btn", n_clicks=0, style={"marginLeft": "10px"}),
+        html.Div(id='gl-ledger-summary', style={"marginLeft": "10px"})
     ]),
 
     html.Div(id="column-mapping", style={"marginTop": "20px"}),
     html.Div(id="trace-options", style={"marginTop": "20px"}),
 
-    html.Button("Download Trace Excel", id="gl-download-btn", n_clicks=0, style={"marginTop": "20px"}, disabled=True),
+    dcc.RadioItems(id="gl-export-format", options=export_options(), value=DEFAULT_EXPORT_FORMAT,
+                   inline=True, style={"marginTop": "20px"}),
+    html.Button("Download Trace Results", id="gl-download-btn", n_clicks=0, style={"marginTop": "20px"}, disabled=True),
+    html.Button("Cancel", id="gl-cancel-btn", n_clicks=0, style={"marginTop": "20px", "marginLeft": "10px"}, disabled=True),
 
     dcc.Loading(
         id="gl-loading-spinner",
         type="default",
-        children=html.Div(id="gl-download-status", style={"marginTop": "10px", "color": "#0074D9"})
+        overlay_style={"visibility": "visible"},
+        children=html.Div([
+            html.Div(id="gl-download-progress", style={"marginTop": "10px", "color": "#0074D9"}),
+            html.Div(id="gl-download-status", style={"marginTop": "10px", "color": "#0074D9"})
+        ])
+    ),
+
+    html.Div(id="gl-last-result", style={"marginTop": "10px"}),
+
+    dcc.Store(id="gl-download-url"),
+
+    html.Button("Build Trace Matrix", id="trace-matrix-btn", n_clicks=0, style={"marginTop": "20px"}, disabled=True),
+
+    dcc.Loading(
+        id="trace-matrix-spinner",
+        type="default",
+        children=html.Div(id="trace-matrix", style={"marginTop": "20px"})
     ),
 
-    dcc.Download(id="gl-download-excel"),
+    html.Div(id="trace-matrix-detail", style={"marginTop": "20px"}),
 
-    html.Div(id="trace-preview", style={"marginTop": "40px"})
+    # Lines posted twice: exact duplicates, and near-duplicates a few days apart
+    # or with a transposed document number
+    html.Div([
+        html.H5("Duplicate Journals"),
+        html.Label("Days apart for near-duplicates:"),
+        dcc.Input(id="dup-days", type="number", min=0, step=1, value=DEFAULT_DAYS_APART,
+                  style={"marginLeft": "10px", "width": "80px"}),
+        html.Br(),
+        html.Button("Find Duplicate Journals", id="dup-btn", n_clicks=0, style={"marginTop": "10px"}, disabled=True),
+        html.Button("Cancel", id="dup-cancel-btn", n_clicks=0, style={"marginTop": "10px", "marginLeft": "10px"},
+                    disabled=True),
+        dcc.Loading(
+            id="dup-loading-spinner",
+            type="default",
+            overlay_style={"visibility": "visible"},
+            children=html.Div([
+                html.Div(id="dup-progress", style={"marginTop": "10px", "color": "#0074D9"}),
+                html.Div(id="dup-status", style={"marginTop": "10px", "color": "#0074D9"})
+            ])
+        ),
+        html.Div(id="dup-last-result", style={"marginTop": "10px"}),
+        dcc.Store(id="dup-download-url")
+    ], style={"marginTop": "40px"}),
+
+    # Preview of the last trace; the server sends one filtered, sorted page at a time
+    html.Div([
+        html.H5("Trace Preview"),
+        dcc.RadioItems(
+            id="trace-preview-sheet",
+            options=[{"label": sheet, "value": name} for name, sheet in TRACE_SHEETS],
+            value=TRACE_SHEETS[0][0],
+            inline=True
+        ),
+        html.Div(id="trace-preview-count", style={"margin": "10px 0"}),
+        dash_table.DataTable(
+            id="trace-preview-table",
+            columns=[],
+            data=[],
+            page_action="custom",
+            page_current=0,
+            page_size=PREVIEW_PAGE_SIZE,
+            sort_action="custom",
+            sort_mode="multi",
+            sort_by=[],
+            filter_action="custom",
+            filter_query=""
+        )
+    ], id="trace-preview", style={"marginTop": "40px"})
 ])
 
 
-@dash.callback(
+# The upload box streams each drop to the upload route; callbacks below only see
+# the references, each drop's added to the ledger's
+dash.clientside_callback(
+    ClientsideFunction(namespace="uploads", function_name="append"),
+    Output('upload-gl-refs', 'data'),
+    Input('upload-gl-new', 'data'),
+    State('upload-gl-refs', 'data'),
+    prevent_initial_call=True
+)
+
+# Display the filenames after upload, in the browser
+dash.clientside_callback(
+    ClientsideFunction(namespace="uploads", function_name="uploaded"),
     Output('gl-file-name', 'children', allow_duplicate=True),
-    Input('upload-gl', 'filename'),
+    Input('upload-gl-refs', 'data'),
+    prevent_initial_call=True
+)
+
+# Start the ledger again from the next files dropped
+dash.clientside_callback(
+    """function (n_clicks) { return [null, "", ""]; }""",
+    Output('upload-gl-refs', 'data', allow_duplicate=True),
+    Output('gl-file-name', 'children', allow_duplicate=True),
+    Output('gl-ledger-summary', 'children', allow_duplicate=True),
+    Input('gl-clear-btn', 'n_clicks'),
     prevent_initial_call=True
 )
-def update_gl_filename(name):
-    return f"✅ Uploaded: {name}" if name else ""
 
 
 @dash.callback(
     Output('column-mapping', 'children'),
     Output("gl-download-btn", "disabled"),
-    Input('upload-gl', 'contents'),
+    Output("trace-matrix-btn", "disabled"),
+    Output("dup-btn", "disabled"),
+    Input('upload-gl-refs', 'data'),
     prevent_initial_call=True
 )
-def generate_column_mapping(gl_content):
-    def parse_contents(contents):
-        _, content_string = contents.split(',')
-        decoded = base64.b64decode(content_string)
-        return pd.read_excel(io.BytesIO(decoded), engine="openpyxl")
+def generate_column_mapping(gl_uploads):
+    if not gl_uploads:
+        return "", True, True, True
 
     try:
-        gl_df = parse_contents(gl_content)
-        stored_data["gl_df"] = gl_df
-        detected_columns = gl_df.columns.tolist()
-
-        required_columns = [
-            "ACCOUNT CODE", "ACCOUNT NAME", "TRANSACTION DATE", "TRANSACTION SOURCE",
-            "LEAD SHEET NUMBER", "AMOUNT", "TRANSACTION NUMBER", "DOCUMENT NUMBER"
-        ]
-
-        dropdowns = []
-        for col in required_columns:
-            closest_match = difflib.get_close_matches(col, detected_columns, n=1, cutoff=0.5)
-            preselected = closest_match[0] if closest_match else None
+        # Only the header is needed here; the full GL is parsed once a lead column is chosen.
+        # Monthly extracts share a layout, so the first file's header stands for all.
+        detected_columns, _ = sniff_upload(gl_uploads[0])
+
+        # A saved profile for this header layout fills in every column, which
+        # selects the lead column and so goes straight on to the parse
+        mapping, saved = suggest_mapping("gl", detected_columns)
+
+        dropdowns = [html.Div("✅ Saved mapping for this layout applied" if saved else "", style={"color": "green"})]
+        for col in GL_COLUMNS:
             dropdowns.append(html.Div([
                 html.Label(f"Select column for: {col}"),
                 dcc.Dropdown(
                     id=f"dropdown-{col}",
                     options=[{'label': c, 'value': c} for c in detected_columns],
                     placeholder=f"Select {col}",
-                    value=preselected,
+                    value=mapping[col],
                     style={"width": "50%"}
                 )
             ], style={"marginBottom": "20px"}))
 
-        return dropdowns, False
+        return dropdowns, False, False, False
 
     except Exception as e:
-        return html.Div([f"❌ Error: {str(e)}"]), True
+        return html.Div([f"❌ Error: {str(e)}"]), True, True, True
+
+
+def lead_values(gl_upload, lead_col):
+    # Lead sheet numbers in one file, before the rest of its columns are mapped
+    if is_large_upload(gl_upload):
+        # Too large to index in memory: collect the leads chunk by chunk
+        values = set()
+        for chunk in iter_upload_chunks(gl_upload, columns=[lead_col]):
+            values.update(chunk[lead_col].dropna().unique())
+        return values
+    return set(read_upload(gl_upload, columns=[lead_col])[lead_col].dropna().unique())
 
 
 @dash.callback(
     Output("trace-options", "children"),
+    Output("gl-ledger-summary", "children", allow_duplicate=True),
     Input("dropdown-LEAD SHEET NUMBER", "value"),
+    State("upload-gl-refs", "data"),
+    State("session-id", "data"),
+    [State(f"dropdown-{col}", "value") for col in GL_COLUMNS],
     prevent_initial_call=True
 )
-def show_trace_dropdowns(lead_col):
-    if not lead_col or stored_data["gl_df"] is None:
-        return ""
+def show_trace_dropdowns(lead_col, gl_uploads, session_id, selected):
+    if not lead_col or not gl_uploads:
+        return "", ""
 
     try:
-        stored_data["lead_column"] = lead_col
-        unique_leads = stored_data["gl_df"][lead_col].dropna().unique()
-        options = [{"label": str(val), "value": str(val)} for val in sorted(unique_leads)]
+        summary = ""
+        if len(gl_uploads) > 1 and all(selected):
+            # Several files: add any new ones to the session's ledger
+            ledger = GLLedger.sync(session_id, gl_uploads, selected)
+            unique_leads = ledger.lead_values()
+            summary = f"Ledger: {ledger.summary()}"
+        elif len(gl_uploads) > 1 or is_large_upload(gl_uploads[0]):
+            unique_leads = sorted(set().union(*(lead_values(upload, lead_col) for upload in gl_uploads)))
+        elif all(selected):
+            # Fully mapped: build (or reuse) the session's lead/transaction index
+            unique_leads = load_index(session_id, gl_uploads[0], selected)[0].lead_values()
+        else:
+            unique_leads = sorted(lead_values(gl_uploads[0], lead_col))
+        options = [{"label": str(val), "value": str(val)} for val in unique_leads]
 
         return html.Div([
             html.H5("Trace Between Lead Sheets"),
@@ -125,69 +245,66 @@ def show_trace_dropdowns(lead_col):
                 html.Label("Lead to trace TO:"),
                 dcc.Dropdown(id="lead-to", options=options, placeholder="Select destination lead")
             ], style={"marginBottom": "10px", "width": "50%"})
-        ])
+        ]), summary
 
     except Exception as e:
-        return html.Div([f"❌ Error generating trace options: {str(e)}"])
-
-
-def trace_transactions_between_leads(df, lead_from, lead_to):
-    lead_to = int(lead_to)
-    lead_from = int(lead_from)
-    df = df.copy()
-    required = [
-        "ACCOUNT CODE", "ACCOUNT NAME", "TRANSACTION DATE", "TRANSACTION SOURCE",
-        "LEAD SHEET NUMBER", "AMOUNT", "TRANSACTION NUMBER", "DOCUMENT NUMBER"
-    ]
-    for col in required:
-        if col not in df.columns:
-            raise ValueError(f"Missing column: {col}")
-
-    df_from = df[df["LEAD SHEET NUMBER"] == lead_from]
-    df_to = df[df["LEAD SHEET NUMBER"] == lead_to]
-
-    pivot_from = df_from.groupby("TRANSACTION NUMBER").agg({
-        "DOCUMENT NUMBER": "count",
-        "AMOUNT": "sum"
-    })
-
-    pivot_to = df_to.groupby("TRANSACTION NUMBER").agg({
-        "DOCUMENT NUMBER": "count",
-        "AMOUNT": "sum"
-    })
-
-    matched_amounts = []
-    matched_counts = []
-    for txn in pivot_from.index:
-        if txn in pivot_to.index:
-            matched_amounts.append(pivot_to.loc[txn, "AMOUNT"])
-            matched_counts.append(pivot_to.loc[txn, "DOCUMENT NUMBER"])
-        else:
-            matched_amounts.append(0)
-            matched_counts.append(0)
-
-    pivot_from[f'AMOUNT_CL_SUM_{lead_to}'] = matched_amounts
-    pivot_from[f'NO_OF_RECS_{lead_to}'] = matched_counts
-    pivot_from['DIFFERENCE'] = pivot_from["AMOUNT"] + pivot_from[f'AMOUNT_CL_SUM_{lead_to}']
-
-    not_found = pivot_from[pivot_from[f'NO_OF_RECS_{lead_to}'] == 0]
-    not_found_txns = not_found.index
-    not_found_frame = df[df["TRANSACTION NUMBER"].isin(not_found_txns)]
-    not_found_frame = not_found_frame[df["LEAD SHEET NUMBER"] != lead_from]
-
-    summary = not_found_frame.groupby(["LEAD SHEET NUMBER", "ACCOUNT NAME"]).agg(
-        NUMBER_OF_RECORDS=("AMOUNT", "count"),
-        AMOUNT=("AMOUNT", "sum")
-    ).reset_index()
-
-    return pivot_from.reset_index(), summary
+        return html.Div([f"❌ Error generating trace options: {str(e)}"]), ""
+
+
+def load_gl(session_id, gl_upload, selected, progress=None):
+    # The mapped GL is kept in the session's dataset store, so any worker can
+    # serve later requests for the same upload and mapping without parsing it
+    source = {"upload": upload_key(gl_upload), "mapping": selected}
+    if datasets.get_meta(session_id, "gl") == source:
+        df = datasets.get_frame(session_id, "gl")
+        if df is not None:
+            return df
+
+    # Only the mapped columns (or ones already named like a required column) are read
+    df = read_upload(gl_upload, columns=[c for c in selected if c is not None] + GL_COLUMNS)
+    if progress is not None:
+        progress.stage("map")
+    df = compact(map_gl_columns(df, selected), "GL")
+    datasets.put_frame(session_id, "gl", df, meta=source)
+    return df
+
+
+def gl_chunks(gl_upload, selected, progress=None):
+    # The mapped GL one chunk at a time, for ledgers too large to load whole
+    for chunk in iter_upload_chunks(gl_upload, columns=[c for c in selected if c is not None] + GL_COLUMNS):
+        if progress is not None:
+            progress.rows(chunk)
+        yield compact(map_gl_columns(chunk, selected), "GL")
+
+
+def load_index(session_id, gl_upload, selected, progress=None):
+    # Lead and transaction aggregates over the mapped GL, built once per upload
+    # and mapping and kept in the session's dataset store; the GL itself is
+    # only loaded to build them
+    source = {"upload": upload_key(gl_upload), "mapping": selected}
+    meta = datasets.get_meta(session_id, "gl_index")
+    if meta is not None and meta["source"] == source:
+        frames = {name: datasets.get_frame(session_id, name) for name in GLIndex.FRAMES}
+        if all(frame is not None for frame in frames.values()):
+            return GLIndex.from_frames(frames), meta["rows"]
+
+    if progress is not None:
+        progress.stage("parse")
+    df = load_gl(session_id, gl_upload, selected, progress)
+    index = GLIndex.build(df)
+    for name, frame in index.frames().items():
+        datasets.put_frame(session_id, name, frame)
+    datasets.put_meta(session_id, "gl_index", {"source": source, "rows": len(df)})
+    return index, len(df)
 
 
 @dash.callback(
-    Output("gl-download-excel", "data", allow_duplicate=True),
+    Output("gl-download-url", "data"),
     Output("gl-download-status", "children", allow_duplicate=True),
     Input("gl-download-btn", "n_clicks"),
-    State("upload-gl", "contents"),
+    State("upload-gl-refs", "data"),
+    State("session-id", "data"),
+    State("gl-export-format", "value"),
     State("dropdown-ACCOUNT CODE", "value"),
     State("dropdown-ACCOUNT NAME", "value"),
     State("dropdown-TRANSACTION DATE", "value"),
@@ -198,9 +315,16 @@ def trace_transactions_between_leads(df, lead_from, lead_to):
     State("dropdown-DOCUMENT NUMBER", "value"),
     State("lead-from", "value"),
     State("lead-to", "value"),
+    background=True,
+    progress=Output("gl-download-progress", "children"),
+    running=[
+        (Output("gl-cancel-btn", "disabled"), False, True),
+        (Output("gl-download-progress", "style"), {"display": "block"}, {"display": "none"}),
+    ],
+    cancel=[Input("gl-cancel-btn", "n_clicks")],
     prevent_initial_call=True
 )
-def generate_gl_excel(n_clicks, gl_content, *cols):
+def generate_gl_excel(set_progress, n_clicks, gl_uploads, session_id, export_format, *cols):
     if not callback_context.triggered:
         return dash.no_update, dash.no_update
 
@@ -209,65 +333,286 @@ def generate_gl_excel(n_clicks, gl_content, *cols):
         lead, amt, txn_num, doc_num, from_lead, to_lead
     ) = cols
 
-    def parse(contents):
-        content_type, content_string = contents.split(',')
-        decoded = base64.b64decode(content_string)
-        return pd.read_excel(io.BytesIO(decoded), engine="openpyxl")
+    progress = JobProgress(set_progress, session_id, "gl_result")
+    try:
+        progress.stage("decode")
+        if not gl_uploads:
+            raise ValueError("No general ledger files uploaded")
+        gl_upload = gl_uploads[0]
+        source = upload_key(gl_upload) if len(gl_uploads) == 1 else ledger_key(gl_uploads)
+        selected = [acc_code, acc_name, txn_date, txn_source, lead, amt, txn_num, doc_num]
+
+        # The same files, mapping and lead pair (in either direction) were traced before
+        results = trace_results.get(source, selected, from_lead, to_lead)
+        if results is None and len(gl_uploads) > 1:
+            # Only files new to the session's ledger are parsed; the trace reads
+            # the per-file aggregates of the two leads
+            progress.stage("parse")
+            ledger = GLLedger.sync(session_id, gl_uploads, selected, progress)
+            progress.stage("trace")
+            results = [from_minor_units(result).rename(columns=str) for result in ledger.trace(from_lead, to_lead)]
+            trace_results.put(source, selected, from_lead, to_lead, results)
+        elif results is None and is_large_upload(gl_upload):
+            # Two streamed passes, holding only the running aggregates; each
+            # pass counts its rows, so the first one alone is kept as the total
+            progress.stage("trace")
+            results = [from_minor_units(result).rename(columns=str) for result in trace_lead_pair_chunked(
+                lambda: gl_chunks(gl_upload, selected, progress if progress.row_count == 0 else None),
+                from_lead, to_lead)]
+            trace_results.put(source, selected, from_lead, to_lead, results)
+        elif results is None:
+            # The index's aggregates answer any lead pair without the GL's rows
+            index, rows = load_index(session_id, gl_upload, selected, progress)
+            progress.row_count += rows
+
+            # Run trace logic
+            progress.stage("trace")
+            results = [from_minor_units(result).rename(columns=str) for result in index.trace(from_lead, to_lead)]
+            trace_results.put(source, selected, from_lead, to_lead, results)
+
+        # The mapping worked, so the next upload with the same layout is mapped already
+        remember_mapping("gl", gl_upload, selected)
+
+        # Kept for the in-page preview
+        for (name, _), result in zip(TRACE_SHEETS, results):
+            datasets.put_frame(session_id, name, result)
+
+        # Stream the sheets to a file, unless this direction and format were already written
+        progress.stage("write")
+        filename = export_filename("trace_results", export_format)
+        cached = trace_results.export_path(source, selected, from_lead, to_lead, export_format)
+        if cached is not None:
+            progress.done(filename, lambda path: shutil.copyfile(cached, path))
+        else:
+            sheets = {sheet_name: result for (_, sheet_name), result in zip(TRACE_SHEETS, results)}
+            progress.done(filename, lambda path: write_export(sheets, path, export_format))
+            trace_results.put_export(source, selected, from_lead, to_lead, export_format,
+                                     lambda path: shutil.copyfile(job_result_path(session_id, "gl_result"), path))
+        return download_url(session_id, "gl_result"), f"✅ {filename} ready for download."
+
+    except Exception as e:
+        logger.exception("GL trace failed")
+        progress.failed(str(e))
+        return None, f"❌ Error: {str(e)}"
+
 
+# Offer the last finished trace again, e.g. after a page refresh
+@dash.callback(
+    Output("gl-last-result", "children"),
+    Input("gl-download-status", "children"),
+    State("session-id", "data")
+)
+def show_last_gl_result(status, session_id):
+    return last_result_view(session_id, "gl_result")
+
+
+dash.clientside_callback(
+    ClientsideFunction(namespace="downloads", function_name="start"),
+    Output("gl-download-url", "clear_data"),
+    Input("gl-download-url", "data"),
+    prevent_initial_call=True
+)
+
+
+@dash.callback(
+    Output("trace-matrix", "children"),
+    Output("trace-matrix-detail", "children", allow_duplicate=True),
+    Input("trace-matrix-btn", "n_clicks"),
+    State("upload-gl-refs", "data"),
+    State("session-id", "data"),
+    [State(f"dropdown-{col}", "value") for col in GL_COLUMNS],
+    prevent_initial_call=True
+)
+def build_trace_matrix(n_clicks, gl_uploads, session_id, selected):
+    try:
+        if not gl_uploads:
+            raise ValueError("no general ledger uploaded")
+        if len(gl_uploads) > 1:
+            # The ledger's per-file postings, added up; kept for drilling into a cell
+            # under their own name, as "postings" belongs to the single-file index
+            postings = GLLedger.sync(session_id, gl_uploads, selected).all_postings()
+            postings_name = "ledger_postings"
+            datasets.put_frame(session_id, postings_name, postings.reset_index())
+        elif is_large_upload(gl_uploads[0]):
+            raise ValueError("the ledger is too large to hold in memory; trace lead sheet pairs one at a time")
+        else:
+            # The index's postings let any cell be drilled into without another pass over the GL
+            postings = load_index(session_id, gl_uploads[0], selected)[0].all_postings()
+            postings_name = "postings"
+        matrix = trace_matrix(postings)
+        # The meta names the postings frame a cell is drilled into
+        datasets.put_frame(session_id, "trace_matrix", matrix.reset_index(), meta={"postings": postings_name})
+
+        rows = from_minor_units(matrix.reset_index())
+        rows["id"] = range(len(rows))
+        return html.Div([
+            html.H5(f"Trace Matrix: {len(rows)} lead sheet pairs share transactions"),
+            html.P("Select a row to drill into that pair."),
+            dash_table.DataTable(
+                id="trace-matrix-table",
+                columns=[{"name": c, "id": c} for c in rows.columns if c != "id"],
+                data=rows.to_dict("records"),
+                sort_action="native",
+                filter_action="native",
+                page_size=20
+            )
+        ]), ""
+
+    except Exception as e:
+        return html.Div([f"❌ Error building trace matrix: {str(e)}"]), ""
+
+
+@dash.callback(
+    Output("trace-matrix-detail", "children"),
+    Output("lead-from", "value"),
+    Output("lead-to", "value"),
+    Input("trace-matrix-table", "active_cell"),
+    State("session-id", "data"),
+    prevent_initial_call=True
+)
+def drill_trace_matrix(active_cell, session_id):
+    matrix = datasets.get_frame(session_id, "trace_matrix")
+    if not active_cell or matrix is None:
+        return dash.no_update, dash.no_update, dash.no_update
+
+    matrix = from_minor_units(matrix).set_index(["LEAD FROM", "LEAD TO"])
+    postings_name = (datasets.get_meta(session_id, "trace_matrix") or {}).get("postings", "postings")
+    postings = datasets.get_frame(session_id, postings_name)
+    if postings is None:
+        # Evicted from the session store since the matrix was built
+        return html.Div(["❌ The data behind this matrix has expired; build the trace matrix again."]), \
+            dash.no_update, dash.no_update
+    postings = postings.set_index([TXN, LEAD]).sort_index()
+    lead_from, lead_to = matrix.index[active_cell["row_id"]]
+    cell = matrix.iloc[active_cell["row_id"]]
+    found = from_minor_units(trace_cell(postings, lead_from, lead_to))
+
+    return html.Div([
+        html.H5(f"Lead {lead_from} → Lead {lead_to}"),
+        html.P(f"{int(cell['TRANSACTIONS'])} transactions, {int(cell['NO_OF_RECS'])} records, "
+               f"matched amount {cell['AMOUNT_CL_SUM']:,.2f}, difference {cell['DIFFERENCE']:,.2f}"),
+        dash_table.DataTable(
+            columns=[{"name": str(c), "id": str(c)} for c in found.columns],
+            data=found.rename(columns=str).to_dict("records"),
+            sort_action="native",
+            page_size=20
+        )
+    ]), str(lead_from), str(lead_to)
+
+
+def journal_lines(session_id, gl_uploads, selected, progress):
+    # Every file's lines as one frame of the journal columns; a file too large
+    # to load whole is read in chunks, keeping only those columns of each
+    pieces = []
+    # The same file uploaded twice is only read once, or all of it would be duplicates
+    for upload in {upload_key(upload): upload for upload in gl_uploads}.values():
+        if is_large_upload(upload):
+            pieces.append(journal_frame(gl_chunks(upload, selected, progress)))
+            continue
+        if len(gl_uploads) == 1:
+            df = load_gl(session_id, upload, selected)
+        else:
+            df = compact(map_gl_columns(
+                read_upload(upload, columns=[c for c in selected if c is not None] + GL_COLUMNS), selected), "GL")
+        progress.rows(df)
+        pieces.append(df)
+    return journal_frame(pieces)
+
+
+@dash.callback(
+    Output("dup-download-url", "data"),
+    Output("dup-status", "children", allow_duplicate=True),
+    Input("dup-btn", "n_clicks"),
+    State("upload-gl-refs", "data"),
+    State("session-id", "data"),
+    State("gl-export-format", "value"),
+    State("dup-days", "value"),
+    [State(f"dropdown-{col}", "value") for col in GL_COLUMNS],
+    background=True,
+    progress=Output("dup-progress", "children"),
+    running=[
+        (Output("dup-cancel-btn", "disabled"), False, True),
+        (Output("dup-progress", "style"), {"display": "block"}, {"display": "none"}),
+    ],
+    cancel=[Input("dup-cancel-btn", "n_clicks")],
+    prevent_initial_call=True
+)
+def find_duplicate_journals(set_progress, n_clicks, gl_uploads, session_id, export_format, days_apart, selected):
+    progress = JobProgress(set_progress, session_id, "duplicates_result")
     try:
-        df = parse(gl_content)
-
-        # Map the selected dropdown values to standard column names
-        mapping = {
-            acc_code: "ACCOUNT CODE",
-            acc_name: "ACCOUNT NAME",
-            txn_date: "TRANSACTION DATE",
-            txn_source: "TRANSACTION SOURCE",
-            lead: "LEAD SHEET NUMBER",
-            amt: "AMOUNT",
-            txn_num: "TRANSACTION NUMBER",
-            doc_num: "DOCUMENT NUMBER"
-        }
-
-        # Remove entries with None as keys (unselected dropdowns)
-        clean_mapping = {k: v for k, v in mapping.items() if k is not None}
-
-        # DEBUG: Print mapping info and original columns
-        print("Original columns:", df.columns.tolist())
-        print("User-selected mapping:", mapping)
-        print("Cleaned mapping used for renaming:", clean_mapping)
-
-        # Rename using the cleaned mapping
-        df = df.rename(columns=clean_mapping)
-
-        # DEBUG: Print columns after renaming
-        print("Columns after renaming:", df.columns.tolist())
-
-        required_cols = list(mapping.values())
-
-        # Check that all required columns exist
-        missing = [col for col in required_cols if col not in df.columns]
-        if missing:
-            raise ValueError(f"❌ Missing columns after renaming: {missing}")
-
-        # Select only the required columns
-        df = df[required_cols]
-
-        # Run trace logic
-        exist_found, exist_nf = trace_transactions_between_leads(df, from_lead, to_lead)
-        comp_found, comp_nf = trace_transactions_between_leads(df, to_lead, from_lead)
-
-        # Write to Excel in memory
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine="openpyxl") as writer:
-            exist_found.to_excel(writer, index=False, sheet_name="Existence-Found")
-            exist_nf.to_excel(writer, index=False, sheet_name="Existence-Not-Found")
-            comp_found.to_excel(writer, index=False, sheet_name="Completeness-Found")
-            comp_nf.to_excel(writer, index=False, sheet_name="Completeness-NoTFound")
-
-        output.seek(0)
-        return dcc.send_bytes(output.read(), filename="trace_results.xlsx"), "✅ Trace Excel ready for download."
+        progress.stage("decode")
+        if not gl_uploads:
+            raise ValueError("No general ledger files uploaded")
+        if days_apart is None or days_apart < 0:
+            raise ValueError("Days apart must be zero or more")
+
+        progress.stage("parse")
+        df = journal_lines(session_id, gl_uploads, selected, progress)
+
+        progress.stage("trace")
+        sheets = {name: from_minor_units(result) for name, result in journal_duplicates(df, days_apart).items()}
+        exact, near = sheets["Exact Duplicates"], sheets["Near Duplicates"]
+        remember_mapping("gl", gl_uploads[0], selected)
+
+        progress.stage("write")
+        filename = export_filename("duplicate_journals", export_format)
+        progress.done(filename, lambda path: write_export(sheets, path, export_format))
+        groups = exact["DUPLICATE GROUP"].nunique()
+        return download_url(session_id, "duplicates_result"), (
+            f"✅ {len(exact):,} lines in {groups:,} exact duplicate groups and {len(near):,} near-duplicate "
+            f"pairs found. {filename} ready for download.")
 
     except Exception as e:
-        print("Error during processing:", str(e))  # Debug log
+        logger.exception("Duplicate journal search failed")
+        progress.failed(str(e))
         return None, f"❌ Error: {str(e)}"
+
+
+# Offer the last duplicate search again, e.g. after a page refresh
+@dash.callback(
+    Output("dup-last-result", "children"),
+    Input("dup-status", "children"),
+    State("session-id", "data")
+)
+def show_last_duplicates_result(status, session_id):
+    return last_result_view(session_id, "duplicates_result")
+
+
+dash.clientside_callback(
+    ClientsideFunction(namespace="downloads", function_name="start"),
+    Output("dup-download-url", "clear_data"),
+    Input("dup-download-url", "data"),
+    prevent_initial_call=True
+)
+
+
+@dash.callback(
+    Output("trace-preview-table", "page_current"),
+    Input("trace-preview-sheet", "value"),
+    prevent_initial_call=True
+)
+def reset_trace_preview_page(sheet):
+    return 0
+
+
+@dash.callback(
+    Output("trace-preview-table", "data"),
+    Output("trace-preview-table", "columns"),
+    Output("trace-preview-table", "page_count"),
+    Output("trace-preview-count", "children"),
+    Input("gl-download-status", "children"),
+    Input("trace-preview-sheet", "value"),
+    Input("trace-preview-table", "page_current"),
+    Input("trace-preview-table", "page_size"),
+    Input("trace-preview-table", "sort_by"),
+    Input("trace-preview-table", "filter_query"),
+    State("session-id", "data")
+)
+def update_trace_preview(status, sheet, page_current, page_size, sort_by, filter_query, session_id):
+    result = datasets.get_frame(session_id, sheet) if session_id else None
+    if result is None:
+        return [], [], 1, "Run a trace to preview its results here."
+
+    rows, page_count = query_frame(result, filter_query, sort_by, page_current, page_size)
+    columns = [{"name": c, "id": c} for c in result.columns]
+    return rows, columns, page_count, f"{len(result):,} rows"
@@ -0,0 +1,71 @@
+import pandas as pd
+import pytest
+
+from utils.inventory import (
+    DISAPPEARED_ITEM, MOVEMENT_ONLY, NEW_ITEM, ROLLS_FORWARD, VARIANCE, inventory_rollforward, map_inventory_columns
+)
+
+
+def report(label, rows):
+    df = pd.DataFrame(rows, columns=["SKU", "Description", "Qty"])
+    return map_inventory_columns(df, "SKU", "Description", "Qty", label)
+
+
+def reports():
+    curr = report("Current Inventory", [("A1", "Bolt", 12), ("A2", "Nut", 7), ("A3", "Washer", 4), ("A4", "Pin", 3)])
+    prior = report("Prior Inventory", [("A1", "Bolt", 10), ("A2", "Nut", 10), ("A3", "Washer", 4), ("A5", "Rivet", 6)])
+    movement = report("Movement Report", [("A1", "In", 5), ("A1", "Out", -3), ("A2", "Out", -2), ("A6", "In", 1)])
+    return curr, prior, movement
+
+
+def by_item(results, sheet="Roll Forward"):
+    return results[sheet].set_index("ITEM CODE")
+
+
+def test_statuses():
+    rf = by_item(inventory_rollforward(*reports()))
+    assert rf["STATUS"].to_dict() == {
+        "A1": ROLLS_FORWARD, "A2": VARIANCE, "A3": ROLLS_FORWARD,
+        "A4": NEW_ITEM, "A5": DISAPPEARED_ITEM, "A6": MOVEMENT_ONLY,
+    }
+    assert rf.loc["A1", "MOVEMENT LINES"] == 2
+    assert rf.loc["A2", "EXPECTED QUANTITY"] == 8
+    assert rf.loc["A2", "VARIANCE"] == -1
+
+
+def test_sheets():
+    results = inventory_rollforward(*reports())
+    assert by_item(results, "Exceptions").index.tolist() == ["A2", "A4", "A5", "A6"]
+    assert by_item(results, "Variances").index.tolist() == ["A2"]
+    assert by_item(results, "New Items").index.tolist() == ["A4"]
+    assert by_item(results, "Disappeared Items").index.tolist() == ["A5"]
+
+
+def test_tolerance():
+    rf = by_item(inventory_rollforward(*reports(), tolerance=1))
+    assert rf.loc["A2", "STATUS"] == ROLLS_FORWARD
+
+
+def test_fractional_quantities():
+    # Float sums are rounded before comparing, so 0.1 + 0.2 rolls forward to 0.3
+    curr = report("Current Inventory", [("K1", "Oil", 0.3)])
+    prior = report("Prior Inventory", [("K1", "Oil", 0.1)])
+    movement = report("Movement Report", [("K1", "In", 0.2)])
+    assert by_item(inventory_rollforward(curr, prior, movement)).loc["K1", "STATUS"] == ROLLS_FORWARD
+
+
+def test_codes_match_across_types():
+    # 501, "501 " and 501.0 are one item, and repeated codes are summed
+    curr = report("Current Inventory", [(501, "Gear", 2), ("501 ", "Gear", 3)])
+    prior = report("Prior Inventory", [(501.0, "Gear", 4)])
+    movement = report("Movement Report", [("501", "In", 1)])
+    rf = by_item(inventory_rollforward(curr, prior, movement))
+    assert rf.index.tolist() == ["501"]
+    assert rf.loc["501", "CURRENT QUANTITY"] == 5
+    assert rf.loc["501", "STATUS"] == ROLLS_FORWARD
+
+
+def test_missing_columns():
+    with pytest.raises(ValueError, match="Missing columns in Movement Report"):
+        map_inventory_columns(pd.DataFrame({"SKU": ["A1"], "Qty": [1]}), "SKU", "Description", "Qty",
+                              "Movement Report")
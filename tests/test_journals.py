@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from utils.journals import journal_duplicates, journal_frame
+from utils.schema import compact
+
+
+def gl(**overrides):
+    df = pd.DataFrame({
+        "TRANSACTION NUMBER": [1, 2, 3, 4],
+        "DOCUMENT NUMBER": ["INV4521", "INV4521", "INV5421", "X1"],
+        "AMOUNT": [100.0, 100.0, 100.0, 250.0],
+        "ACCOUNT CODE": [1000, 1000, 1000, 2000],
+        "TRANSACTION DATE": pd.to_datetime(["2025-01-01", "2025-01-01", "2025-02-01", "2025-01-02"]),
+    })
+    return compact(df.assign(**overrides), "GL")
+
+
+def test_exact_and_transposed_duplicates():
+    sheets = journal_duplicates(journal_frame([gl()]))
+    assert sheets["Exact Duplicates"]["TRANSACTION NUMBER"].tolist() == ["1", "2"]
+    near = sheets["Near Duplicates"]
+    # Both copies of the duplicated line pair with the transposed one
+    assert near["REASON"].unique().tolist() == ["Transposed document number"]
+    pairs = {tuple(sorted(pair)) for pair in near[["TRANSACTION NUMBER", "MATCHED TRANSACTION NUMBER"]].values}
+    assert pairs == {("1", "3"), ("2", "3")}
+
+
+def test_blank_document_numbers():
+    # A GL without document numbers is valid; lines then match on account, date and amount
+    df = journal_frame([gl(**{"DOCUMENT NUMBER": np.nan})])
+    assert df["DOCUMENT NUMBER"].isna().all()
+    sheets = journal_duplicates(df)
+    assert sheets["Exact Duplicates"]["TRANSACTION NUMBER"].tolist() == ["1", "2"]
+    assert not (sheets["Near Duplicates"]["REASON"] == "Transposed document number").any()
+
+
+def test_keys_typed_differently_per_piece_match():
+    first = gl()
+    second = gl(**{"TRANSACTION NUMBER": [9, 9, 9, 9], "ACCOUNT CODE": ["1000", "1000", "1000", "2000 "]})
+    exact = journal_duplicates(journal_frame([first, second.iloc[:1]]))["Exact Duplicates"]
+    assert exact["TRANSACTION NUMBER"].tolist() == ["1", "2", "9"]
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import ledger, loaders
+from utils.ledger import GLLedger, _frame_name
+from utils.schema import compact
+from utils.store import DatasetStore
+from utils.trace import GL_COLUMNS, map_gl_columns, trace_lead_pair
+from utils.uploads import UploadStore
+
+SESSION = "c" * 32
+
+
+@pytest.fixture
+def stores(tmp_path, monkeypatch):
+    # Uploads, parses and session datasets kept under tmp_path for each test
+    uploads = UploadStore(str(tmp_path / "uploads"), 3600)
+    monkeypatch.setattr(loaders, "uploads", uploads)
+    monkeypatch.setattr(loaders, "parsed_store", DatasetStore(str(tmp_path / "parsed"), 3600, 1 << 30))
+    monkeypatch.setattr(ledger, "datasets", DatasetStore(str(tmp_path / "datasets"), 3600, 1 << 30))
+    # Count the files aggregated, so tests can tell which ones were read again
+    read = []
+    aggregate = ledger._file_aggregates
+
+    def counted(upload, selected, progress=None):
+        read.append(upload["filename"])
+        return aggregate(upload, selected, progress)
+    monkeypatch.setattr(ledger, "_file_aggregates", counted)
+    return uploads, read
+
+
+def month(seed, rows=800):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "ACCOUNT CODE": rng.integers(1000, 1020, rows),
+        "ACCOUNT NAME": [f"Account {i % 15}" for i in range(rows)],
+        "TRANSACTION DATE": "2025-01-01",
+        "TRANSACTION SOURCE": "GJ",
+        "LEAD SHEET NUMBER": rng.integers(1, 5, rows) * 100,
+        "AMOUNT": rng.normal(0, 100, rows).round(2),
+        # Transactions span months, as a journal posted across a month end does
+        "TRANSACTION NUMBER": rng.integers(0, 300, rows),
+        "DOCUMENT NUMBER": np.arange(rows) + seed * rows,
+    })
+
+
+def upload(uploads, df, filename):
+    data = df.to_csv(index=False).encode()
+    ref = uploads.create(filename, len(data))
+    uploads.append(ref["id"], 0, data)
+    return {"id": ref["id"], "filename": filename}
+
+
+def assert_traces(got, months):
+    df = compact(map_gl_columns(pd.concat(months, ignore_index=True), GL_COLUMNS), "GL")
+    for lead_a, lead_b in [(100, 200), (300, 400)]:
+        for e, g in zip(trace_lead_pair(df, lead_a, lead_b), got.trace(lead_a, lead_b)):
+            pd.testing.assert_frame_equal(e.reset_index(drop=True), g.reset_index(drop=True),
+                                          check_dtype=False, check_categorical=False)
+    assert got.rows() == len(df)
+    assert got.leads()["AMOUNT"].sum() == df["AMOUNT"].sum()
+
+
+def test_adding_a_file_reads_only_that_file(stores):
+    uploads, read = stores
+    jan, feb = month(1), month(2)
+    refs = [upload(uploads, jan, "jan.csv"), upload(uploads, feb, "feb.csv")]
+
+    GLLedger.sync(SESSION, refs[:1], GL_COLUMNS)
+    got = GLLedger.sync(SESSION, refs, GL_COLUMNS)
+    assert read == ["jan.csv", "feb.csv"]
+    assert_traces(got, [jan, feb])
+
+
+def test_removing_a_file(stores):
+    uploads, read = stores
+    jan, feb, mar = month(1), month(2), month(3)
+    refs = [upload(uploads, jan, "jan.csv"), upload(uploads, feb, "feb.csv"), upload(uploads, mar, "mar.csv")]
+
+    GLLedger.sync(SESSION, refs, GL_COLUMNS)
+    got = GLLedger.sync(SESSION, [refs[0], refs[2]], GL_COLUMNS)
+    assert read == ["jan.csv", "feb.csv", "mar.csv"]
+    assert [f["filename"] for f in got.files] == ["jan.csv", "mar.csv"]
+    assert_traces(got, [jan, mar])
+
+
+def test_duplicate_upload_counts_once(stores):
+    uploads, read = stores
+    jan, feb = month(1), month(2)
+    refs = [upload(uploads, jan, "jan.csv"), upload(uploads, feb, "feb.csv"), upload(uploads, jan, "jan (1).csv")]
+
+    got = GLLedger.sync(SESSION, refs, GL_COLUMNS)
+    assert read == ["jan.csv", "feb.csv"]
+    assert len(got.files) == 2
+    assert_traces(got, [jan, feb])
+
+
+def test_evicted_aggregates_are_rebuilt(stores):
+    uploads, read = stores
+    jan, feb = month(1), month(2)
+    refs = [upload(uploads, jan, "jan.csv"), upload(uploads, feb, "feb.csv")]
+
+    first = GLLedger.sync(SESSION, refs, GL_COLUMNS)
+    ledger.datasets.drop(SESSION, _frame_name(first.files[1]["key"], "postings"))
+    got = GLLedger.sync(SESSION, refs, GL_COLUMNS)
+    assert read == ["jan.csv", "feb.csv", "jan.csv", "feb.csv"]
+    assert_traces(got, [jan, feb])
@@ -0,0 +1,41 @@
+import pytest
+
+from utils.mappings import MATCHERS, header_fingerprint
+
+
+@pytest.mark.parametrize("kind, columns, expected", [
+    ("gl", ["Acc No", "Account Description", "Date", "Source", "Lead", "Amt", "Txn No", "Doc No"], {
+        "ACCOUNT CODE": "Acc No", "ACCOUNT NAME": "Account Description", "TRANSACTION DATE": "Date",
+        "TRANSACTION SOURCE": "Source", "LEAD SHEET NUMBER": "Lead", "AMOUNT": "Amt",
+        "TRANSACTION NUMBER": "Txn No", "DOCUMENT NUMBER": "Doc No",
+    }),
+    ("gl", ["AccountCode", "AccountName", "TransactionDate", "Source", "LeadSheet", "Amount", "TxnNumber",
+            "DocNumber"], {
+        "ACCOUNT CODE": "AccountCode", "ACCOUNT NAME": "AccountName", "TRANSACTION DATE": "TransactionDate",
+        "TRANSACTION SOURCE": "Source", "LEAD SHEET NUMBER": "LeadSheet", "AMOUNT": "Amount",
+        "TRANSACTION NUMBER": "TxnNumber", "DOCUMENT NUMBER": "DocNumber",
+    }),
+    ("tb", ["Account", "Name", "Balance"], {"ACCOUNT CODE": "Account", "ACCOUNT NAME": "Name", "AMOUNT": "Balance"}),
+    ("tb", ["Acct", "Acct Desc", "Closing Balance"],
+     {"ACCOUNT CODE": "Acct", "ACCOUNT NAME": "Acct Desc", "AMOUNT": "Closing Balance"}),
+    ("inventory", ["SKU", "Description", "Qty"], {"ITEM CODE": "SKU", "ITEM NAME": "Description", "QUANTITY": "Qty"}),
+])
+def test_suggested_mapping(kind, columns, expected):
+    assert MATCHERS[kind].match(tuple(columns)) == expected
+
+
+def test_codes_and_names_never_swap():
+    mapping = MATCHERS["gl"].match(("Account Description", "Acc No"))
+    assert mapping["ACCOUNT CODE"] == "Acc No"
+    assert mapping["ACCOUNT NAME"] == "Account Description"
+    # A numbered header is not a date, however much else it shares
+    assert MATCHERS["gl"].match(("Txn No",))["TRANSACTION DATE"] is None
+
+
+def test_unrelated_headers_left_blank():
+    assert MATCHERS["tb"].match(("Foo", "Bar")) == dict.fromkeys(["ACCOUNT CODE", "ACCOUNT NAME", "AMOUNT"])
+
+
+def test_fingerprint_ignores_spelling_not_order():
+    assert header_fingerprint(["Account_Code ", "AMT"]) == header_fingerprint(["account code", "amt"])
+    assert header_fingerprint(["a", "b"]) != header_fingerprint(["b", "a"])
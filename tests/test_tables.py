@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+
+from utils.tables import query_frame, split_filter_part
+
+FRAME = pd.DataFrame({
+    "ACCOUNT NAME": ["Bank", "bank charges", "Cash", "Debtors"],
+    "AMOUNT": [100.0, -20.0, 55.5, 300.0],
+})
+
+
+def names(filter_query):
+    records, _ = query_frame(FRAME, filter_query, page_size=10)
+    return [r["ACCOUNT NAME"] for r in records]
+
+
+@pytest.mark.parametrize("part, expected", [
+    ("{AMOUNT} s> 100", ("AMOUNT", "gt", 100.0, True)),
+    ("{AMOUNT} >= 100", ("AMOUNT", "ge", 100.0, None)),
+    ("{ACCOUNT NAME} scontains Bank", ("ACCOUNT NAME", "contains", "Bank", True)),
+    ("{ACCOUNT NAME} icontains bank", ("ACCOUNT NAME", "contains", "bank", False)),
+    ("{ACCOUNT NAME} i= cash", ("ACCOUNT NAME", "eq", "cash", False)),
+    ("{AMOUNT} ile 55.5", ("AMOUNT", "le", 55.5, False)),
+    ("{AMOUNT} sne 1", ("AMOUNT", "ne", 1.0, True)),
+    ("AMOUNT > 1", None),
+])
+def test_split_filter_part(part, expected):
+    assert split_filter_part(part) == expected
+
+
+def test_contains_case():
+    assert names("{ACCOUNT NAME} scontains Bank") == ["Bank"]
+    assert names("{ACCOUNT NAME} icontains BANK") == ["Bank", "bank charges"]
+    assert names("{ACCOUNT NAME} contains bank") == ["Bank", "bank charges"]
+
+
+def test_prefixed_comparisons():
+    assert names("{ACCOUNT NAME} i= cash") == ["Cash"]
+    assert names("{ACCOUNT NAME} s= cash") == []
+    assert names("{AMOUNT} s> 0 && {AMOUNT} ilt 60") == ["Cash"]
@@ -0,0 +1,88 @@
+import pandas as pd
+import pytest
+
+from utils.schema import from_minor_units
+from utils.tb import (
+    DROPPED_ACCOUNT, GL_ONLY, NEW_ACCOUNT, ROLLS_FORWARD, VARIANCE, map_tb_columns, tb_rollforward,
+    tb_rollforward_chunked
+)
+
+
+def tb(label, rows):
+    df = pd.DataFrame(rows, columns=["Account", "Name", "Balance"])
+    return map_tb_columns(df, "Account", "Name", "Balance", label)
+
+
+def trial_balances():
+    curr = tb("Current TB", [
+        (1000, "Cash", 150.00), (1100, "Debtors", 80.00), (1200, "Stock", 10.00), (1300, "Prepayments ", 5.00),
+    ])
+    prior = tb("Prior TB", [
+        (1000, "Cash", 100.00), (1100, "Debtors", 90.00), (1200, "stock", 10.00), (1400, "Accruals", -20.00),
+    ])
+    gl = tb("General Ledger", [
+        (1000, "Receipt", 30.00), (1000, "Receipt", 20.00), (1100, "Invoice", -5.00), (1500, "Suspense", 1.00),
+    ])
+    return curr, prior, gl
+
+
+def by_code(results, sheet="Roll Forward"):
+    return from_minor_units(results[sheet]).set_index("ACCOUNT CODE")
+
+
+def test_statuses():
+    rf = by_code(tb_rollforward(*trial_balances()))
+    assert rf["STATUS"].to_dict() == {
+        "1000": ROLLS_FORWARD, "1100": VARIANCE, "1200": ROLLS_FORWARD,
+        "1300": NEW_ACCOUNT, "1400": DROPPED_ACCOUNT, "1500": GL_ONLY,
+    }
+    assert rf.loc["1000", "GL LINES"] == 2
+    assert rf.loc["1100", "EXPECTED AMOUNT"] == 85.0
+    assert rf.loc["1100", "VARIANCE"] == -5.0
+
+
+def test_sheets():
+    results = tb_rollforward(*trial_balances())
+    assert by_code(results, "Variances").index.tolist() == ["1100", "1300", "1400", "1500"]
+    assert by_code(results, "New Accounts").index.tolist() == ["1300"]
+    assert by_code(results, "Dropped Accounts").index.tolist() == ["1400"]
+
+
+def test_name_mismatch_ignores_case_and_spaces():
+    gl = trial_balances()[2]
+    curr = tb("Current TB", [(1000, "Cash at Bank", 150.00), (1200, " STOCK", 10.00)])
+    prior = tb("Prior TB", [(1000, "Cash", 100.00), (1200, "stock", 10.00)])
+    mismatches = by_code(tb_rollforward(curr, prior, gl), "Name Mismatches")
+    assert mismatches.index.tolist() == ["1000"]
+
+
+def test_codes_match_across_types():
+    # 1000, "1000 " and 1000.0 are one account, and repeated codes are summed
+    curr = tb("Current TB", [("1000 ", "Cash", 60.00), ("1000", "Cash", 90.00)])
+    prior = tb("Prior TB", [(1000.0, "Cash", 100.00)])
+    gl = tb("General Ledger", [(1000, "Receipt", 50.00)])
+    rf = by_code(tb_rollforward(curr, prior, gl))
+    assert rf.loc["1000", "STATUS"] == ROLLS_FORWARD
+    assert rf.loc["1000", "CURRENT AMOUNT"] == 150.0
+
+
+def test_amounts_sum_exactly():
+    # Cents are summed as integers, so float noise never shows as a variance
+    curr = tb("Current TB", [(1000, "Cash", 0.30)])
+    prior = tb("Prior TB", [(1000, "Cash", 0.00)])
+    gl = tb("General Ledger", [(1000, "x", 0.10)] * 3)
+    assert by_code(tb_rollforward(curr, prior, gl)).loc["1000", "STATUS"] == ROLLS_FORWARD
+
+
+def test_chunked_matches_in_memory():
+    curr, prior, gl = trial_balances()
+    chunks = (gl.iloc[i:i + 1] for i in range(len(gl)))
+    expected = tb_rollforward(curr, prior, gl)
+    got = tb_rollforward_chunked(curr, prior, chunks)
+    for sheet in expected:
+        pd.testing.assert_frame_equal(expected[sheet].reset_index(drop=True), got[sheet].reset_index(drop=True))
+
+
+def test_missing_columns():
+    with pytest.raises(ValueError, match="Missing columns in Current TB"):
+        map_tb_columns(pd.DataFrame({"Account": [1], "Balance": [1.0]}), "Account", "Name", "Balance", "Current TB")
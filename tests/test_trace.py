@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.schema import compact
+from utils.store import DatasetStore
+from utils.trace import GLIndex, trace_lead_pair, trace_lead_pair_chunked, trace_transactions_between_leads
+
+
+def gl(rows=3000, seed=7):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "ACCOUNT CODE": rng.integers(1000, 1040, rows),
+        "ACCOUNT NAME": [f"Account {i % 30}" for i in range(rows)],
+        "TRANSACTION DATE": pd.Timestamp("2025-01-01"),
+        "TRANSACTION SOURCE": "GJ",
+        "LEAD SHEET NUMBER": rng.integers(1, 7, rows) * 100,
+        "AMOUNT": rng.normal(0, 100, rows).round(2),
+        "TRANSACTION NUMBER": rng.integers(0, 600, rows).astype(float),
+        "DOCUMENT NUMBER": np.arange(rows).astype(float),
+    })
+    # Gaps the trace has to tolerate: lines without a transaction, document
+    # number or account name, and a lead whose lines have no transaction at all
+    df.loc[::53, "TRANSACTION NUMBER"] = np.nan
+    df.loc[::31, "DOCUMENT NUMBER"] = np.nan
+    df.loc[::97, "ACCOUNT NAME"] = None
+    df.loc[df.index[-5:], ["LEAD SHEET NUMBER", "TRANSACTION NUMBER"]] = [900, np.nan]
+    return compact(df, "GL")
+
+
+def oracle(df, lead_a, lead_b):
+    # The original one-direction trace, run both ways
+    return trace_transactions_between_leads(df, lead_a, lead_b) + trace_transactions_between_leads(df, lead_b, lead_a)
+
+
+def assert_same(expected, got):
+    assert len(expected) == len(got)
+    for e, g in zip(expected, got):
+        pd.testing.assert_frame_equal(e.reset_index(drop=True), g.reset_index(drop=True),
+                                      check_dtype=False, check_categorical=False)
+
+
+@pytest.mark.parametrize("lead_a, lead_b", [(100, 200), (300, 600), (500, 100), (100, 900), (200, 800)])
+def test_pair_traces_match_the_original(lead_a, lead_b):
+    df = gl()
+    expected = oracle(df, lead_a, lead_b)
+
+    assert_same(expected, trace_lead_pair(df, lead_a, lead_b))
+    assert_same(expected, GLIndex.build(df).trace(lead_a, lead_b))
+
+    def chunks():
+        return (df.iloc[start:start + 701] for start in range(0, len(df), 701))
+    assert_same(expected, trace_lead_pair_chunked(chunks, lead_a, lead_b))
+
+
+def test_index_survives_a_store_round_trip(tmp_path):
+    df = gl()
+    store = DatasetStore(str(tmp_path), 3600, 1 << 30)
+    session_id = "a" * 32
+    for name, frame in GLIndex.build(df).frames().items():
+        store.put_frame(session_id, name, frame)
+    index = GLIndex.from_frames({name: store.get_frame(session_id, name) for name in GLIndex.FRAMES})
+
+    assert index.lead_values() == [100, 200, 300, 400, 500, 600, 900]
+    assert_same(oracle(df, 100, 200), index.trace(100, 200))
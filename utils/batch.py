@@ -0,0 +1,267 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from utils.exports import export_filename, write_export
+from utils.inventory import DEFAULT_TOLERANCE, INVENTORY_COLUMNS, inventory_rollforward, map_inventory_columns
+from utils.journals import DEFAULT_DAYS_APART, journal_duplicates, journal_frame
+from utils.loaders import OUT_OF_CORE_BYTES, is_large_upload, iter_chunks, iter_upload_chunks, parse_file, read_uploads
+from utils.schema import compact, from_minor_units
+from utils.tb import TB_COLUMNS, map_tb_columns, tb_rollforward, tb_rollforward_chunked
+from utils.trace import GL_COLUMNS, map_gl_columns, trace_lead_pair, trace_lead_pair_chunked
+
+# Files each test needs, by role
+TEST_FILES = {
+    "tb": ["current", "prior", "gl"],
+    "inventory": ["current", "prior", "movement"],
+    "gl": ["gl"],
+    "duplicates": ["gl"],
+}
+TRACE_SHEETS = ["Existence-Found", "Existence-Not-Found", "Completeness-Found", "Completeness-NoTFound"]
+# Excel's limit on sheet names
+MAX_SHEET_NAME = 31
+
+
+class Stopwatch:
+    """Wall time per stage of one run, in the order the stages ran."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings = {}
+        self._current = None
+        self._stage_started = None
+
+    def stage(self, name):
+        self.stop()
+        self._current, self._stage_started = name, time.perf_counter()
+
+    def stop(self):
+        if self._current is not None:
+            self.timings[self._current] = round(time.perf_counter() - self._stage_started, 4)
+        self._current = None
+
+    def total(self):
+        return round(time.perf_counter() - self.started, 4)
+
+
+def _read(files, sources):
+    # Batch runs name files on disk and already run clients in parallel; the
+    # JSON API passes upload references, parsed side by side on the shared pool
+    roles = list(sources)
+    if all(isinstance(files[role], dict) for role in roles):
+        frames = read_uploads(*[(files[role], sources[role]) for role in roles])
+        return dict(zip(roles, frames))
+    return {role: parse_file(files[role], columns=sources[role]) for role in roles}
+
+
+def _is_large(file):
+    if isinstance(file, dict):
+        return is_large_upload(file)
+    return os.path.getsize(file) >= OUT_OF_CORE_BYTES
+
+
+def _chunks(file, columns):
+    # A file too large to parse whole, a chunk of rows at a time
+    if isinstance(file, dict):
+        return iter_upload_chunks(file, columns=columns)
+    return iter_chunks(file, columns=columns)
+
+
+def _file_mapping(mapping, role, columns):
+    # A mapping is either per file role or one canonical -> source mapping for every file
+    mapping = mapping.get(role, mapping)
+    missing = [col for col in columns if not mapping.get(col)]
+    if missing:
+        raise ValueError(f"No mapping for {role} columns: {missing}")
+    return [mapping[col] for col in columns]
+
+
+def _check_files(test, files):
+    missing = [role for role in TEST_FILES[test] if not files.get(role)]
+    if missing:
+        raise ValueError(f"Missing files for {test}: {missing}")
+
+
+def run_tb(files, mapping, options, watch):
+    _check_files("tb", files)
+    sources = {role: _file_mapping(mapping, role, TB_COLUMNS) for role in TEST_FILES["tb"]}
+
+    # A ledger too large for memory is streamed, keeping only per-account totals
+    large_gl = _is_large(files["gl"])
+    roles = [role for role in TEST_FILES["tb"] if not (large_gl and role == "gl")]
+
+    watch.stage("parse")
+    frames = _read(files, {role: sources[role] for role in roles})
+    rows = sum(len(df) for df in frames.values())
+
+    watch.stage("map")
+    mapped = {role: map_tb_columns(frames[role], *sources[role], f"{role} TB") for role in roles}
+
+    watch.stage("trace")
+    if large_gl:
+        gl_rows = []
+
+        def gl_chunks():
+            for chunk in _chunks(files["gl"], sources["gl"]):
+                gl_rows.append(len(chunk))
+                yield map_tb_columns(chunk, *sources["gl"], "gl TB")
+
+        results = tb_rollforward_chunked(mapped["current"], mapped["prior"], gl_chunks())
+        rows += sum(gl_rows)
+    else:
+        results = tb_rollforward(mapped["current"], mapped["prior"], mapped["gl"])
+    return {name: from_minor_units(frame) for name, frame in results.items()}, rows
+
+
+def run_inventory(files, mapping, options, watch):
+    _check_files("inventory", files)
+    sources = {role: _file_mapping(mapping, role, INVENTORY_COLUMNS) for role in TEST_FILES["inventory"]}
+
+    watch.stage("parse")
+    frames = _read(files, sources)
+    rows = sum(len(df) for df in frames.values())
+
+    watch.stage("map")
+    mapped = {role: map_inventory_columns(frames[role], *sources[role], f"{role} inventory")
+              for role in TEST_FILES["inventory"]}
+
+    watch.stage("trace")
+    tolerance = options.get("tolerance", DEFAULT_TOLERANCE)
+    return inventory_rollforward(mapped["current"], mapped["prior"], mapped["movement"], tolerance), rows
+
+
+def run_gl_trace(files, mapping, options, watch):
+    _check_files("gl", files)
+    selected = _file_mapping(mapping, "gl", GL_COLUMNS)
+    pairs = options.get("leads") or []
+    if not pairs:
+        raise ValueError("No lead pairs to trace")
+
+    if _is_large(files["gl"]):
+        return _run_gl_trace_chunked(files["gl"], selected, pairs, watch)
+
+    watch.stage("parse")
+    df = _read(files, {"gl": selected})["gl"]
+
+    watch.stage("map")
+    df = compact(map_gl_columns(df, selected), "GL")
+
+    # Each pair gives existence (a -> b) and completeness (b -> a)
+    watch.stage("trace")
+    sheets = {}
+    for lead_a, lead_b in pairs:
+        for sheet, result in zip(TRACE_SHEETS, trace_lead_pair(df, lead_a, lead_b)):
+            sheets[f"{lead_a}-{lead_b} {sheet}"[:MAX_SHEET_NAME]] = from_minor_units(result)
+    return sheets, len(df)
+
+
+def _run_gl_trace_chunked(file, selected, pairs, watch):
+    # Two streamed passes over the ledger per pair, holding only running aggregates
+    rows = []
+
+    def gl_chunks():
+        rows.clear()
+        for chunk in _chunks(file, selected):
+            rows.append(len(chunk))
+            yield compact(map_gl_columns(chunk, selected), "GL")
+
+    watch.stage("trace")
+    sheets = {}
+    for lead_a, lead_b in pairs:
+        for sheet, result in zip(TRACE_SHEETS, trace_lead_pair_chunked(gl_chunks, lead_a, lead_b)):
+            sheets[f"{lead_a}-{lead_b} {sheet}"[:MAX_SHEET_NAME]] = from_minor_units(result)
+    return sheets, sum(rows)
+
+
+def run_duplicates(files, mapping, options, watch):
+    _check_files("duplicates", files)
+    selected = _file_mapping(mapping, "gl", GL_COLUMNS)
+
+    # Only the journal columns of each chunk are kept, so a large ledger is read in chunks
+    watch.stage("parse")
+    if _is_large(files["gl"]):
+        df = journal_frame(compact(map_gl_columns(chunk, selected), "GL") for chunk in _chunks(files["gl"], selected))
+    else:
+        df = journal_frame([compact(map_gl_columns(_read(files, {"gl": selected})["gl"], selected), "GL")])
+
+    watch.stage("trace")
+    sheets = journal_duplicates(df, options.get("days_apart", DEFAULT_DAYS_APART))
+    return {name: from_minor_units(frame) for name, frame in sheets.items()}, len(df)
+
+
+TESTS = {"tb": run_tb, "inventory": run_inventory, "gl": run_gl_trace, "duplicates": run_duplicates}
+
+
+def run_test(test, files, mapping, options=None):
+    # One test on one client's files; returns the result sheets and a timing summary
+    if test not in TESTS:
+        raise ValueError(f"Unknown test: {test}")
+    watch = Stopwatch()
+    sheets, rows = TESTS[test](files, mapping, options or {}, watch)
+    watch.stop()
+    return sheets, {"rows": rows, "stages": watch.timings}
+
+
+def run_client(job):
+    # Process-pool entry point: run one client's test and write its workbook.
+    # Failures are reported in the summary rather than raised, so one bad
+    # client doesn't stop the batch.
+    summary = {"client": job["client"], "test": job["test"], "status": "done", "error": None}
+    started = time.perf_counter()
+    try:
+        sheets, info = run_test(job["test"], job["files"], job["mapping"], job.get("options"))
+        summary.update(info)
+        write_started = time.perf_counter()
+        fmt = job.get("format", "xlsx")
+        path = os.path.join(job["output"], export_filename(f"{job['client']}_{job['test']}", fmt))
+        write_export(sheets, path, fmt)
+        summary["stages"]["write"] = round(time.perf_counter() - write_started, 4)
+        summary["output"] = path
+        summary["sheets"] = {name: len(frame) for name, frame in sheets.items()}
+    except Exception as e:
+        summary.update(status="failed", error=str(e))
+    summary["seconds"] = round(time.perf_counter() - started, 4)
+    summary["pid"] = os.getpid()
+    return summary
+
+
+def load_config(path):
+    # Jobs from a batch config; file paths are relative to the config file and a
+    # client's mapping may name an entry of the config's "mappings"
+    with open(path) as f:
+        config = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    mappings = config.get("mappings", {})
+
+    jobs = []
+    for client in config.get("clients", []):
+        mapping = client.get("mapping")
+        if isinstance(mapping, str):
+            if mapping not in mappings:
+                raise ValueError(f"Unknown mapping {mapping!r} for client {client.get('name')!r}")
+            mapping = mappings[mapping]
+        jobs.append({
+            "client": client["name"],
+            "test": client["test"],
+            "files": {role: os.path.join(base, file) for role, file in client.get("files", {}).items()},
+            "mapping": mapping or {},
+            "options": client.get("options", {}),
+            "format": client.get("format", config.get("format", "xlsx")),
+        })
+    return config, jobs
+
+
+def run_batch(jobs, output, workers=None, on_result=None):
+    # Independent clients run in parallel; summaries come back in job order
+    os.makedirs(output, exist_ok=True)
+    jobs = [dict(job, output=output) for job in jobs]
+    summaries = [None] * len(jobs)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_client, job): i for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            summary = future.result()
+            summaries[futures[future]] = summary
+            if on_result is not None:
+                on_result(summary)
+    return summaries
@@ -0,0 +1,60 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+# Byte budget for parsed uploads kept in memory by each worker
+PARSE_CACHE_BYTES = int(os.environ.get("MOORE_PARSE_CACHE_MB", "256")) * 1024 * 1024
+
+
+class FrameCache:
+    """LRU cache of DataFrames bounded by their in-memory size."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, df):
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            # Frames larger than the whole budget are never cached
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (df, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+parsed_frames = FrameCache(PARSE_CACHE_BYTES)
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
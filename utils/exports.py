@@ -0,0 +1,81 @@
+import io
+import zipfile
+
+from utils.lazy import lazy_import
+from utils.store import arrow_safe
+
+pa = lazy_import("pyarrow")
+pq = lazy_import("pyarrow.parquet")
+xlsxwriter = lazy_import("xlsxwriter")
+
+# Result formats offered by the pages: label and file extension
+EXPORT_FORMATS = {
+    "xlsx": ("Excel (.xlsx)", ".xlsx"),
+    "csv": ("CSV (.zip)", ".zip"),
+    "parquet": ("Parquet (.zip)", ".zip"),
+}
+DEFAULT_EXPORT_FORMAT = "xlsx"
+
+# Rows an Excel sheet holds, header included
+EXCEL_MAX_ROWS = 1_048_576
+# Rows turned into Python values at a time while a sheet is streamed out
+WRITE_CHUNK_ROWS = 10_000
+
+
+def export_options():
+    return [{"label": label, "value": fmt} for fmt, (label, _) in EXPORT_FORMATS.items()]
+
+
+def export_filename(stem, fmt):
+    return stem + EXPORT_FORMATS[fmt][1]
+
+
+def _write_xlsx(sheets, path):
+    too_large = [name for name, frame in sheets.items() if len(frame) >= EXCEL_MAX_ROWS]
+    if too_large:
+        raise ValueError(f"{', '.join(too_large)} has more rows than an Excel sheet holds; "
+                         f"export as CSV or Parquet instead")
+
+    # In constant-memory mode each row goes to disk once the next one starts,
+    # so rows are written strictly in order
+    workbook = xlsxwriter.Workbook(path, {
+        "constant_memory": True,
+        "default_date_format": "yyyy-mm-dd",
+        "remove_timezone": True,
+        "strings_to_urls": False,
+    })
+    try:
+        header = workbook.add_format({"bold": True, "border": 1, "align": "center"})
+        for name, frame in sheets.items():
+            sheet = workbook.add_worksheet(name)
+            sheet.write_row(0, 0, [str(c) for c in frame.columns], header)
+            for start in range(0, len(frame), WRITE_CHUNK_ROWS):
+                chunk = frame.iloc[start:start + WRITE_CHUNK_ROWS]
+                chunk = chunk.astype(object).where(chunk.notna(), None)
+                for row, values in enumerate(chunk.itertuples(index=False, name=None), start + 1):
+                    sheet.write_row(row, 0, values)
+    finally:
+        workbook.close()
+
+
+def _write_zip(sheets, path, fmt):
+    # One file per sheet. Parquet is compressed already, so it is stored as is.
+    compression = zipfile.ZIP_DEFLATED if fmt == "csv" else zipfile.ZIP_STORED
+    with zipfile.ZipFile(path, "w", compression=compression) as archive:
+        for name, frame in sheets.items():
+            with archive.open(f"{name}.{fmt}", "w", force_zip64=True) as member:
+                if fmt == "csv":
+                    with io.TextIOWrapper(member, encoding="utf-8", newline="") as text:
+                        frame.to_csv(text, index=False, chunksize=WRITE_CHUNK_ROWS)
+                else:
+                    pq.write_table(pa.Table.from_pandas(arrow_safe(frame), preserve_index=False), member)
+
+
+def write_export(sheets, path, fmt=DEFAULT_EXPORT_FORMAT):
+    # Writes {sheet name: frame} to a file, so the result never has to be held as bytes
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if fmt == "xlsx":
+        _write_xlsx(sheets, path)
+    else:
+        _write_zip(sheets, path, fmt)
@@ -0,0 +1,77 @@
+from utils.lazy import lazy_import
+from utils.schema import compact, totals_by_key
+
+np = lazy_import("numpy")
+
+INVENTORY_COLUMNS = ["ITEM CODE", "ITEM NAME", "QUANTITY"]
+
+# Variances at or below this many units still roll forward
+DEFAULT_TOLERANCE = 0
+# Float quantities are compared after rounding away summation noise
+QUANTITY_DECIMALS = 6
+
+ROLLS_FORWARD = "Rolls forward"
+VARIANCE = "Variance"
+NEW_ITEM = "New item"
+DISAPPEARED_ITEM = "Disappeared item"
+MOVEMENT_ONLY = "Movement only"
+
+
+def check_inventory_columns(df, label):
+    missing = [col for col in INVENTORY_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns in {label}: {missing}")
+
+
+def map_inventory_columns(df, code, name, qty, label):
+    # Uploaded columns renamed to the canonical inventory columns, then compacted
+    df = df.rename(columns={code: "ITEM CODE", name: "ITEM NAME", qty: "QUANTITY"}, copy=False)
+    check_inventory_columns(df, label)
+    return compact(df[INVENTORY_COLUMNS], label)
+
+
+def _by_item(df, label):
+    return totals_by_key(df, "ITEM CODE", "ITEM NAME", "QUANTITY", label)
+
+
+def inventory_rollforward(curr_stock, prior_stock, movement, tolerance=DEFAULT_TOLERANCE):
+    # prior + movement = current, per item
+    check_inventory_columns(curr_stock, "current inventory")
+    check_inventory_columns(prior_stock, "prior inventory")
+    check_inventory_columns(movement, "movement report")
+
+    curr = _by_item(curr_stock, "CURRENT")
+    prior = _by_item(prior_stock, "PRIOR")
+    moved = _by_item(movement, "MOVEMENT")
+
+    # Index joins are hash joins on the item key
+    rf = curr.join(prior, how="outer").join(moved, how="outer").sort_index()
+
+    in_curr = rf["CURRENT QUANTITY"].notna().to_numpy()
+    in_prior = rf["PRIOR QUANTITY"].notna().to_numpy()
+    for col in ("CURRENT QUANTITY", "PRIOR QUANTITY", "MOVEMENT QUANTITY"):
+        rf[col] = rf[col].astype("float64").fillna(0)
+    rf["MOVEMENT LINES"] = rf["MOVEMENT LINES"].fillna(0).astype("int64")
+
+    rf["EXPECTED QUANTITY"] = rf["PRIOR QUANTITY"] + rf["MOVEMENT QUANTITY"]
+    rf["VARIANCE"] = (rf["CURRENT QUANTITY"] - rf["EXPECTED QUANTITY"]).round(QUANTITY_DECIMALS)
+    within = (rf["VARIANCE"].abs() <= tolerance).to_numpy()
+    rf["STATUS"] = np.select(
+        [in_curr & ~in_prior, ~in_curr & in_prior, ~in_curr & ~in_prior, within],
+        [NEW_ITEM, DISAPPEARED_ITEM, MOVEMENT_ONLY, ROLLS_FORWARD],
+        default=VARIANCE
+    )
+
+    rf = rf.reset_index()[[
+        "ITEM CODE", "CURRENT NAME", "PRIOR NAME", "MOVEMENT NAME",
+        "PRIOR QUANTITY", "MOVEMENT QUANTITY", "EXPECTED QUANTITY", "CURRENT QUANTITY", "VARIANCE",
+        "STATUS", "MOVEMENT LINES"
+    ]]
+
+    return {
+        "Roll Forward": rf,
+        "Exceptions": rf[rf["STATUS"] != ROLLS_FORWARD],
+        "Variances": rf[rf["STATUS"] == VARIANCE],
+        "New Items": rf[rf["STATUS"] == NEW_ITEM],
+        "Disappeared Items": rf[rf["STATUS"] == DISAPPEARED_ITEM],
+    }
@@ -0,0 +1,122 @@
+import os
+import time
+
+from dash import html
+
+from utils.metrics import record_job
+from utils.store import datasets
+
+# Stages every report generator walks through, in order
+STAGES = ["decode", "parse", "map", "trace", "write"]
+
+STAGE_LABELS = {
+    "decode": "Reading uploads",
+    "parse": "Parsing files",
+    "map": "Applying column mappings",
+    "trace": "Computing results",
+    "write": "Writing result file",
+}
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobProgress:
+    """Progress of one background report job, mirrored into the session store.
+
+    The page gets each stage through Dash's set_progress; the session store
+    keeps the latest stage and the finished result file, so the result can be
+    offered again after a page refresh.
+    """
+
+    def __init__(self, set_progress, session_id, job, stages=STAGES):
+        self.set_progress = set_progress
+        self.session_id = session_id
+        self.job = job
+        self.stages = stages
+        self.started = time.time()
+        # Wall time per stage and input rows, reported to utils.metrics when the job ends
+        self.timings = {}
+        self.row_count = 0
+        self._current = None
+        self._stage_started = None
+
+    def _record(self, **fields):
+        meta = {"state": "running", "pid": os.getpid(), "started": self.started, "updated": time.time()}
+        meta.update(fields)
+        datasets.put_meta(self.session_id, self.job, meta)
+
+    def _end_stage(self):
+        if self._current is not None:
+            elapsed = time.perf_counter() - self._stage_started
+            self.timings[self._current] = self.timings.get(self._current, 0) + elapsed
+        self._current = None
+
+    def _finish(self, state):
+        self._end_stage()
+        record_job(self.job, state, time.time() - self.started, self.timings, self.row_count)
+
+    def stage(self, name):
+        step = self.stages.index(name) + 1
+        self._end_stage()
+        self._current, self._stage_started = name, time.perf_counter()
+        self._record(stage=name)
+        self.set_progress(f"⏳ {STAGE_LABELS[name]} ({step}/{len(self.stages)})...")
+
+    def done(self, filename, write):
+        # write(path) writes the result file straight into the session store
+        datasets.write_blob(self.session_id, self.job, write)
+        self._record(state="done", filename=filename, seconds=round(time.time() - self.started, 1))
+        self._finish("done")
+
+    def failed(self, message):
+        self._record(state="failed", error=message)
+        self._finish("failed")
+
+    def rows(self, *frames):
+        self.row_count += sum(len(frame) for frame in frames)
+
+
+def job_status(session_id, job):
+    # Latest record for a session's job; a running job whose process is gone was cancelled
+    meta = datasets.get_meta(session_id, job)
+    if meta and meta["state"] == "running" and not _pid_alive(meta["pid"]):
+        meta["state"] = "cancelled"
+    if meta and meta["state"] == "done" and datasets.blob_path(session_id, job) is None:
+        return None
+    return meta
+
+
+def job_result_path(session_id, job):
+    return datasets.blob_path(session_id, job)
+
+
+def download_url(session_id, job):
+    # Served by the /download route in app.py
+    return f"/download/{session_id}/{job}"
+
+
+def last_result_view(session_id, job):
+    # Shown when a page loads, so a finished report survives a refresh
+    if not session_id:
+        return ""
+    meta = job_status(session_id, job)
+    if meta is None:
+        return ""
+    if meta["state"] == "running":
+        return html.Div(f"⏳ A report is still being generated ({STAGE_LABELS[meta['stage']]}). Refresh to check again.")
+    if meta["state"] == "cancelled":
+        return html.Div("⚠️ The last report was cancelled.")
+    if meta["state"] == "failed":
+        return html.Div(f"❌ The last report failed: {meta['error']}")
+    return html.Div([
+        html.Span(f"Last result: {meta['filename']} ({meta['seconds']}s) "),
+        html.A("Download again", href=download_url(session_id, job), download=meta["filename"])
+    ])
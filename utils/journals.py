@@ -0,0 +1,171 @@
+import logging
+
+from utils.lazy import lazy_import
+from utils.schema import key_text
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+logger = logging.getLogger(__name__)
+
+TXN = "TRANSACTION NUMBER"
+DOC = "DOCUMENT NUMBER"
+DATE = "TRANSACTION DATE"
+
+# Mapped GL columns the duplicate tests read
+JOURNAL_COLUMNS = [TXN, DOC, "AMOUNT", "ACCOUNT CODE", DATE]
+# Lines agreeing on all of these are exact duplicates, whatever journal they were posted in
+DUPLICATE_KEY = ["ACCOUNT CODE", DATE, "AMOUNT", DOC]
+
+# Near-duplicates: same account and amount at most this many days apart
+DEFAULT_DAYS_APART = 3
+# Each line is compared with this many of its neighbours in sorted order, so
+# a block of many identical account/amount lines costs linear time, not quadratic
+NEIGHBOURS = 5
+
+SAME_AMOUNT = "Same account and amount"
+TRANSPOSED = "Transposed document number"
+
+
+def check_journal_columns(df):
+    missing = [col for col in JOURNAL_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {missing}")
+
+
+def journal_frame(pieces):
+    # Mapped GL files or chunks as one frame of the journal columns, with keys
+    # as text so a key typed differently by each piece still compares equal
+    df = pd.concat([piece[JOURNAL_COLUMNS] for piece in pieces], ignore_index=True)
+    for col in (TXN, DOC, "ACCOUNT CODE"):
+        # Only the distinct values are converted; -1 codes stay blank, as does
+        # a column with no values at all, e.g. a GL without document numbers
+        codes, values = pd.factorize(df[col])
+        text_codes, texts = pd.factorize(key_text(values))
+        if len(texts):
+            codes = np.where(codes >= 0, text_codes[np.maximum(codes, 0)], -1)
+        df[col] = pd.Categorical.from_codes(codes, texts)
+    return df
+
+
+def _hashable(series):
+    # Keys by category code, which stands for the value within one journal_frame,
+    # and nullable integers as plain int64, which pandas hashes without boxing
+    if series.dtype == "category":
+        return series.cat.codes
+    if pd.api.types.is_extension_array_dtype(series) and pd.api.types.is_integer_dtype(series):
+        return series.to_numpy("int64", na_value=np.iinfo("int64").min)
+    return series
+
+
+def _row_hashes(df, columns):
+    # One 64-bit hash per row, computed column-wise without Python-level loops
+    values = pd.DataFrame({col: _hashable(df[col]) for col in columns})
+    return pd.util.hash_pandas_object(values, index=False).values
+
+
+def exact_duplicates(df):
+    # Lines sharing account, date, amount and document number, numbered by group
+    check_journal_columns(df)
+    lines = df[df["AMOUNT"].notna() & df["ACCOUNT CODE"].notna()]
+    hashes = _row_hashes(lines, DUPLICATE_KEY)
+    candidates = pd.Series(hashes).duplicated(keep=False).values
+    # Equal hashes are confirmed on the values, over the candidate rows only
+    rows = lines[candidates]
+    confirmed = rows.duplicated(DUPLICATE_KEY, keep=False).values
+    rows = rows[confirmed]
+
+    groups, _ = pd.factorize(hashes[candidates][confirmed])
+    rows = rows.assign(**{"DUPLICATE GROUP": groups + 1})
+    rows["GROUP SIZE"] = rows.groupby("DUPLICATE GROUP")["DUPLICATE GROUP"].transform("size")
+    return rows.sort_values(["DUPLICATE GROUP", TXN], kind="stable").reset_index(drop=True)
+
+
+def _neighbour_pairs(block, order_key, keep):
+    # Sorted-neighbourhood blocking: sort by block, then order_key, and pair
+    # each row with the next NEIGHBOURS rows of its block for which keep(left, right)
+    order = np.lexsort((order_key, block))
+    block = block[order]
+    left, right = [], []
+    for k in range(1, NEIGHBOURS + 1):
+        same = np.flatnonzero(block[k:] == block[:-k])
+        if not len(same):
+            break
+        a, b = order[same], order[same + k]
+        ok = keep(a, b)
+        left.append(a[ok])
+        right.append(b[ok])
+    if not left:
+        return np.array([], dtype=int), np.array([], dtype=int)
+    return np.concatenate(left), np.concatenate(right)
+
+
+def _is_transposition(a, b):
+    # Equal but for two neighbouring characters swapped, as in 10234 / 10324
+    if len(a) != len(b):
+        return False
+    diff = [i for i, (x, y) in enumerate(zip(a, b)) if x != y]
+    return len(diff) == 2 and diff[1] == diff[0] + 1 and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]]
+
+
+def near_duplicates(df, days_apart=DEFAULT_DAYS_APART):
+    # Pairs of lines in different journals that look like the same entry posted
+    # twice: same account and amount within days_apart days, or same account
+    # and amount with the document number's digits transposed
+    check_journal_columns(df)
+    lines = df[df["AMOUNT"].notna() & df["ACCOUNT CODE"].notna()].reset_index(drop=True)
+    # Only account/amount blocks with more than one line can hold a pair
+    block = _row_hashes(lines, ["ACCOUNT CODE", "AMOUNT"])
+    lines = lines[pd.Series(block).duplicated(keep=False).values].reset_index(drop=True)
+    block = _row_hashes(lines, ["ACCOUNT CODE", "AMOUNT"])
+    exact = _row_hashes(lines, DUPLICATE_KEY)
+    txns = pd.factorize(lines[TXN])[0]
+
+    def other_journal(a, b):
+        # Exact duplicates are reported on their own; -1 is a blank transaction number
+        return (exact[a] != exact[b]) & ((txns[a] != txns[b]) | (txns[a] < 0))
+
+    # Same account and amount, close in date
+    dates = pd.to_datetime(lines[DATE], errors="coerce").values.astype("datetime64[D]").astype("int64")
+    dated = ~pd.isna(lines[DATE]).values
+    limit = int(days_apart)
+    close_a, close_b = _neighbour_pairs(
+        np.where(dated, block, 0), dates,
+        lambda a, b: dated[a] & dated[b] & (np.abs(dates[b] - dates[a]) <= limit) & other_journal(a, b))
+
+    # Same account and amount, document numbers that are anagrams; the
+    # anagram signature is computed once per distinct document number
+    doc_codes, distinct = pd.factorize(lines[DOC].astype(object))
+    distinct = [str(doc) for doc in distinct]
+    signatures = np.array(["".join(sorted(doc)) for doc in distinct] + [""], dtype=object)[doc_codes]
+    doc_block = pd.util.hash_array(signatures) ^ block
+    has_doc = doc_codes >= 0
+    text = np.array(list(distinct) + [""], dtype=object)[doc_codes]
+    swap_a, swap_b = _neighbour_pairs(
+        np.where(has_doc, doc_block, 0), doc_codes,
+        lambda a, b: has_doc[a] & has_doc[b] & (doc_codes[a] != doc_codes[b]) & other_journal(a, b)
+        & np.array([_is_transposition(text[i], text[j]) for i, j in zip(a, b)], dtype=bool))
+
+    pairs = [(SAME_AMOUNT, close_a, close_b), (TRANSPOSED, swap_a, swap_b)]
+    # The few paired lines drop the ledger-wide categories, which are slow to compare
+    keys = {col: object for col in (TXN, DOC, "ACCOUNT CODE")}
+    frames = []
+    for reason, a, b in pairs:
+        first = lines.take(a).astype(keys).reset_index(drop=True)
+        second = lines.take(b).astype(keys).reset_index(drop=True)
+        frame = pd.DataFrame({"REASON": reason, "ACCOUNT CODE": first["ACCOUNT CODE"], "AMOUNT": first["AMOUNT"]})
+        for col in (TXN, DOC, DATE):
+            frame[col] = first[col]
+            frame[f"MATCHED {col}"] = second[col]
+        frame["DAYS APART"] = np.abs(dates[b] - dates[a])
+        frame.loc[~(dated[a] & dated[b]), "DAYS APART"] = np.nan
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def journal_duplicates(df, days_apart=DEFAULT_DAYS_APART):
+    # Result sheets for the duplicate journal test
+    exact = exact_duplicates(df)
+    near = near_duplicates(df, days_apart)
+    logger.info("Found %d exact duplicate lines and %d near-duplicate pairs", len(exact), len(near))
+    return {"Exact Duplicates": exact, "Near Duplicates": near}
@@ -0,0 +1,53 @@
+import importlib
+import logging
+import os
+import sys
+import threading
+import time
+import types
+
+logger = logging.getLogger(__name__)
+
+# MOORE_LAZY_IMPORTS=0 imports the data libraries at startup, as before
+LAZY_IMPORTS = os.environ.get("MOORE_LAZY_IMPORTS", "1") != "0"
+# MOORE_WARMUP=0 leaves them to be imported by the first callback that needs them
+WARMUP = os.environ.get("MOORE_WARMUP", "1") != "0"
+
+# What the report callbacks import on first use, in dependency order
+HEAVY_MODULES = ["numpy", "pandas", "pyarrow", "pyarrow.feather", "pyarrow.parquet", "openpyxl", "xlsxwriter"]
+
+
+class LazyModule(types.ModuleType):
+    """Stands in for a module until one of its attributes is first used."""
+
+    def __getattr__(self, attr):
+        # The import system's module locks make a first use from several threads safe
+        module = importlib.import_module(self.__name__)
+        # Later lookups then find the module's attributes without coming here
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_import(name):
+    # Use as "pd = lazy_import('pandas')" in place of "import pandas as pd"
+    if not LAZY_IMPORTS or name in sys.modules:
+        return importlib.import_module(name)
+    return LazyModule(name)
+
+
+def warm_up(modules=HEAVY_MODULES):
+    # Import the heavy modules on a background thread once the server is up,
+    # so the first report doesn't wait for them. A callback that arrives
+    # first simply imports what it needs itself.
+    def run():
+        started = time.perf_counter()
+        for name in modules:
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                logger.warning("Warm-up could not import %s", name)
+        logger.info("Warmed up imports in %.2fs", time.perf_counter() - started)
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
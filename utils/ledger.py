@@ -0,0 +1,172 @@
+import hashlib
+import logging
+
+from utils.lazy import lazy_import
+from utils.loaders import is_large_upload, iter_upload_chunks, read_upload, upload_key
+from utils.schema import compact
+from utils.store import datasets
+from utils.tb import account_movement, combine_movement
+from utils.trace import GL_COLUMNS, LEAD, TXN, account_name_totals, gl_postings, map_gl_columns, trace_lead_pair_totals
+
+pd = lazy_import("pandas")
+
+logger = logging.getLogger(__name__)
+
+
+def _sum(frames, by):
+    return pd.concat(frames).groupby(level=by, observed=True).sum()
+
+
+# Aggregates kept for each file, and how the aggregates of two parts add up
+AGGREGATES = {
+    "postings": lambda frames: _sum(frames, [TXN, LEAD]),
+    "totals": lambda frames: _sum(frames, [TXN, LEAD, "ACCOUNT NAME"]),
+    "leads": lambda frames: _sum(frames, [LEAD]),
+    "accounts": combine_movement,
+}
+# Index each aggregate is stored without, as Feather keeps columns only
+INDEXES = {
+    "postings": [TXN, LEAD],
+    "totals": [TXN, LEAD, "ACCOUNT NAME"],
+    "leads": [LEAD],
+    "accounts": ["ACCOUNT CODE"],
+}
+
+
+def _aggregates(gl):
+    return {
+        "postings": gl_postings(gl),
+        "totals": account_name_totals(gl).set_index(INDEXES["totals"]),
+        "leads": gl.groupby(LEAD, observed=True).agg(LINES=("AMOUNT", "size"), AMOUNT=("AMOUNT", "sum")),
+        "accounts": account_movement(gl),
+    }
+
+
+def _file_aggregates(upload, selected, progress=None):
+    # One pass over a file, in chunks if it is too large to parse whole
+    columns = [c for c in selected if c is not None] + GL_COLUMNS
+    pieces = iter_upload_chunks(upload, columns=columns) if is_large_upload(upload) else \
+        [read_upload(upload, columns=columns)]
+    aggregates = None
+    rows = 0
+    for piece in pieces:
+        rows += len(piece)
+        if progress is not None:
+            progress.rows(piece)
+        part = _aggregates(compact(map_gl_columns(piece, selected), "GL"))
+        aggregates = part if aggregates is None else \
+            {name: combine([aggregates[name], part[name]]) for name, combine in AGGREGATES.items()}
+    if aggregates is None:
+        raise ValueError(f"{upload.get('filename')} has no rows")
+    return aggregates, rows
+
+
+def ledger_key(gl_uploads):
+    # Content hash of the set of files making up a ledger, whatever order they were added in
+    keys = sorted({upload_key(upload) for upload in gl_uploads})
+    return hashlib.sha256("\0".join(keys).encode()).hexdigest()
+
+
+def _frame_name(key, name):
+    return f"ledger_{key[:24]}_{name}"
+
+
+class GLLedger:
+    """A session's GL made of one or more uploaded files, such as monthly extracts.
+
+    Each file is parsed and aggregated once, when it is first added, and its
+    aggregates are kept in the session's dataset store: postings per
+    (transaction, lead), totals per (transaction, lead, account name), and
+    totals per lead and per account. The ledger-wide lead and account totals
+    grow by the new file's own; a trace reads the per-file aggregates of the
+    leads involved, so adding a month never reads the earlier ones again.
+    """
+
+    META = "gl_ledger"
+
+    def __init__(self, session_id, meta):
+        self.session_id = session_id
+        self.mapping = meta["mapping"]
+        self.files = meta["files"]
+
+    @classmethod
+    def _stored(cls, session_id, selected):
+        meta = datasets.get_meta(session_id, cls.META)
+        if meta is None or meta["mapping"] != selected:
+            return []
+        # A file whose aggregates were evicted is read again
+        names = [_frame_name(f["key"], name) for f in meta["files"] for name in AGGREGATES]
+        names += ["ledger_leads", "ledger_accounts"]
+        if not all(datasets.has_frame(session_id, name) for name in names):
+            return []
+        return meta["files"]
+
+    @classmethod
+    def sync(cls, session_id, gl_uploads, selected, progress=None):
+        # Bring the session's ledger in line with the uploaded files: new files
+        # are aggregated and added, removed ones dropped
+        if not gl_uploads:
+            raise ValueError("No general ledger files uploaded")
+        uploads = {}
+        for upload in gl_uploads:
+            # The same file uploaded twice is only counted once
+            uploads.setdefault(upload_key(upload), upload)
+
+        stored = cls._stored(session_id, selected)
+        files = [f for f in stored if f["key"] in uploads]
+        added = {}
+        for key, upload in uploads.items():
+            if any(f["key"] == key for f in files):
+                continue
+            aggregates, rows = _file_aggregates(upload, selected, progress)
+            for name, frame in aggregates.items():
+                datasets.put_frame(session_id, _frame_name(key, name), frame.reset_index())
+            files.append({"key": key, "filename": upload.get("filename"), "rows": rows})
+            added[key] = aggregates
+            logger.info("Added %s to the session ledger: %d rows", upload.get("filename"), rows)
+
+        ledger = cls(session_id, {"mapping": selected, "files": files})
+        kept = len(files) - len(added)
+        if added or kept < len(stored):
+            if stored and kept == len(stored):
+                # Only additions: the new files' totals are added to the ledger's
+                sources = [{"leads": ledger.leads(), "accounts": ledger.accounts()}, *added.values()]
+            else:
+                sources = [added.get(f["key"]) or ledger._file_totals(f["key"]) for f in files]
+            for name in ("leads", "accounts"):
+                total = AGGREGATES[name]([source[name] for source in sources])
+                datasets.put_frame(session_id, f"ledger_{name}", total.reset_index())
+            datasets.put_meta(session_id, cls.META, {"mapping": selected, "files": files})
+        return ledger
+
+    def _file_frame(self, key, name):
+        return datasets.get_frame(self.session_id, _frame_name(key, name)).set_index(INDEXES[name])
+
+    def _file_totals(self, key):
+        return {name: self._file_frame(key, name) for name in ("leads", "accounts")}
+
+    def _frames(self, name):
+        return [datasets.get_frame(self.session_id, _frame_name(f["key"], name)) for f in self.files]
+
+    def leads(self):
+        return datasets.get_frame(self.session_id, "ledger_leads").set_index(INDEXES["leads"])
+
+    def accounts(self):
+        return datasets.get_frame(self.session_id, "ledger_accounts").set_index(INDEXES["accounts"])
+
+    def lead_values(self):
+        return sorted(self.leads().index.dropna().tolist())
+
+    def rows(self):
+        return sum(f["rows"] for f in self.files)
+
+    def trace(self, lead_a, lead_b):
+        return trace_lead_pair_totals(self._frames("postings"), self._frames("totals"), lead_a, lead_b)
+
+    def all_postings(self):
+        frames = [frame.set_index(INDEXES["postings"]) for frame in self._frames("postings")]
+        return AGGREGATES["postings"](frames).sort_index()
+
+    def summary(self):
+        return (f"{len(self.files)} files, {self.rows():,} rows, {len(self.leads()):,} lead sheets, "
+                f"{len(self.accounts()):,} accounts")
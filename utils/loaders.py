@@ -0,0 +1,310 @@
+import contextlib
+import fcntl
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.cache import parsed_frames
+from utils.lazy import lazy_import
+from utils.store import DATA_DIR, arrow_safe, parsed_store
+from utils.uploads import uploads
+
+pd = lazy_import("pandas")
+openpyxl = lazy_import("openpyxl")
+pq = lazy_import("pyarrow.parquet")
+
+logger = logging.getLogger(__name__)
+
+# Rows returned alongside the header when sniffing an upload
+PREVIEW_ROWS = 5
+
+# Cores this process may run on; cpu_count() reports the host's inside a container
+CPUS = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+# Parse processes the whole server may run at once, across workers and background jobs
+PARSE_WORKERS = int(os.environ.get("MOORE_PARSE_WORKERS", min(4, CPUS)))
+
+# Uploads at least this large are streamed in chunks rather than parsed whole
+OUT_OF_CORE_BYTES = int(os.environ.get("MOORE_OUT_OF_CORE_MB", 512)) * 1024 * 1024
+# Rows per chunk when streaming
+CHUNK_ROWS = int(os.environ.get("MOORE_CHUNK_ROWS", 250_000))
+
+# Leading bytes of each supported format; anything else is read as csv
+MAGIC = {
+    b"PK\x03\x04": "xlsx",
+    b"\x1f\x8b": "csv.gz",
+    b"PAR1": "parquet",
+}
+
+
+def detect_format(path):
+    with open(path, "rb") as f:
+        head = f.read(4)
+    for magic, fmt in MAGIC.items():
+        if head.startswith(magic):
+            return fmt
+    return "csv"
+
+
+def _read_csv(path, compression, nrows, columns):
+    if nrows is not None:
+        return pd.read_csv(path, compression=compression, nrows=nrows)
+    if columns is not None:
+        # The Arrow reader needs a column list, so resolve it from the header first
+        header = pd.read_csv(path, compression=compression, nrows=0).columns
+        columns = [c for c in header if c in columns]
+    # Arrow's reader is multithreaded and columnar
+    return pd.read_csv(path, compression=compression, engine="pyarrow", usecols=columns)
+
+
+def _read_parquet(path, nrows, columns):
+    parquet = pq.ParquetFile(path)
+    if columns is not None:
+        columns = [c for c in parquet.schema_arrow.names if c in columns]
+    if nrows is not None:
+        batch = next(parquet.iter_batches(batch_size=nrows, columns=columns), None)
+        if batch is not None:
+            return batch.to_pandas()
+    return parquet.read(columns=columns, use_pandas_metadata=True).to_pandas()
+
+
+def parse_file(path, nrows=None, columns=None):
+    # columns prunes the read to those headers; nrows stops after that many rows
+    started = time.perf_counter()
+    fmt = detect_format(path)
+    if fmt == "xlsx":
+        # openpyxl is opened read-only here, so nrows stops the row stream early
+        usecols = None if columns is None else (lambda c: str(c) in columns)
+        df = pd.read_excel(path, engine="openpyxl", nrows=nrows, usecols=usecols)
+    elif fmt == "parquet":
+        df = _read_parquet(path, nrows, columns)
+    else:
+        df = _read_csv(path, "gzip" if fmt == "csv.gz" else None, nrows, columns)
+
+    # Text headers and Arrow-compatible columns, so a frame reads back from the
+    # shared parsed store exactly as it was first parsed
+    df.columns = [str(c) for c in df.columns]
+    df = arrow_safe(df)
+    logger.info("Parsed %s in %.2fs: %d rows x %d columns", fmt, time.perf_counter() - started,
+                len(df), len(df.columns))
+    return df
+
+
+def upload_key(upload):
+    # Content hash of a completed upload, as recorded by the upload route
+    return uploads.status(upload["id"])["sha256"]
+
+
+def _columns_name(columns):
+    return "upload-" + hashlib.sha256("\0".join(sorted(columns)).encode()).hexdigest()[:16]
+
+
+def _stored_name(upload, columns):
+    # Name read_upload keeps a parse under, and the columns that parse reads.
+    # openpyxl walks every cell whatever is selected, so one full xlsx parse is
+    # cheaper than one per column set.
+    if columns is None or detect_format(uploads.path(upload["id"])) == "xlsx":
+        return "upload", None
+    columns = sorted(set(columns))
+    return _columns_name(columns), columns
+
+
+def read_upload(upload, columns=None):
+    # Cached frames are shared between callbacks, so treat them as read-only.
+    # With columns, only those headers are parsed (missing ones are skipped).
+    key = upload_key(upload)
+    full = parsed_frames.get(key)
+    name, parse_columns = _stored_name(upload, columns)
+    if full is None and name == "upload" and columns is not None:
+        # A full parse kept on disk: convert only the columns asked for
+        subset = (key, _columns_name(columns))
+        df = parsed_frames.get(subset)
+        if df is None:
+            df = parsed_store.get_frame(key, name, columns=columns)
+            if df is not None:
+                parsed_frames.put(subset, df)
+        if df is not None:
+            return df
+    if full is None and name == "upload":
+        full = parsed_store.get_frame(key, name)
+        if full is None:
+            full = parse_file(uploads.path(upload["id"]))
+            parsed_store.put_frame(key, name, full)
+        parsed_frames.put(key, full)
+    if full is not None:
+        return full if columns is None else full[[c for c in full.columns if c in columns]]
+
+    df = parsed_frames.get((key, name))
+    if df is None:
+        df = parsed_store.get_frame(key, name)
+        if df is None:
+            df = parse_file(uploads.path(upload["id"]), columns=parse_columns)
+            parsed_store.put_frame(key, name, df)
+        parsed_frames.put((key, name), df)
+    return df
+
+
+PARSE_SLOTS_DIR = os.path.join(DATA_DIR, "parse-slots")
+
+
+@contextlib.contextmanager
+def parse_slots(wanted):
+    # Claims up to `wanted` of the PARSE_WORKERS slot files without waiting and
+    # yields how many it got. Background jobs each run in their own process, so
+    # slots rather than a per-process pool bound the parse processes server-wide;
+    # the kernel drops a slot's lock if its holder dies.
+    os.makedirs(PARSE_SLOTS_DIR, exist_ok=True)
+    held = []
+    try:
+        for i in range(PARSE_WORKERS):
+            if len(held) == wanted:
+                break
+            slot = open(os.path.join(PARSE_SLOTS_DIR, str(i)), "w")
+            try:
+                fcntl.flock(slot, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                slot.close()
+                continue
+            held.append(slot)
+        yield len(held)
+    finally:
+        for slot in held:
+            slot.close()
+
+
+def _parse_into_store(path, key, name, columns):
+    # Runs in a parse process. The frame goes to the shared parsed store and
+    # only its name comes back, so the caller memory-maps the Feather file
+    # instead of unpickling the frame.
+    parsed_store.put_frame(key, name, parse_file(path, columns=columns))
+    return name
+
+
+def read_uploads(*requests):
+    # read_upload for several (upload, columns) pairs, with the uploads that
+    # still need parsing parsed side by side in separate processes
+    pending = {}
+    for upload, columns in requests:
+        key = upload_key(upload)
+        name, parse_columns = _stored_name(upload, columns)
+        if (key in parsed_frames or (key, name) in parsed_frames
+                or parsed_store.has_frame(key, name)):
+            continue
+        pending[(key, name)] = (uploads.path(upload["id"]), key, name, parse_columns)
+
+    # A single parse, or a single core, gains nothing from another process.
+    # The pool lives for this call only, sized by the slots free right now;
+    # with fewer than two free, the parses run here one after another.
+    if len(pending) > 1 and PARSE_WORKERS > 1:
+        with parse_slots(len(pending)) as slots:
+            if slots > 1:
+                with ProcessPoolExecutor(max_workers=slots) as pool:
+                    for future in [pool.submit(_parse_into_store, *task) for task in pending.values()]:
+                        future.result()
+    return [read_upload(upload, columns=columns) for upload, columns in requests]
+
+
+def _xlsx_chunks(path, columns, chunk_rows):
+    # openpyxl's read-only mode streams the sheet XML, so only one chunk of
+    # cell values is held at a time
+    # Uploads are stored without an extension, which openpyxl rejects by name
+    f = open(path, "rb")
+    workbook = openpyxl.load_workbook(f, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(c) for c in next(rows, ())]
+        keep = [i for i, c in enumerate(header) if columns is None or c in columns]
+        names = [header[i] for i in keep]
+        chunk = []
+        for row in rows:
+            chunk.append([row[i] if i < len(row) else None for i in keep])
+            if len(chunk) == chunk_rows:
+                yield pd.DataFrame(chunk, columns=names)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=names)
+    finally:
+        workbook.close()
+        f.close()
+
+
+def iter_chunks(path, columns=None, chunk_rows=CHUNK_ROWS):
+    # parse_file in chunks of rows, for files too large to hold in memory at once
+    fmt = detect_format(path)
+    if fmt == "xlsx":
+        chunks = _xlsx_chunks(path, columns, chunk_rows)
+    elif fmt == "parquet":
+        parquet = pq.ParquetFile(path)
+        if columns is not None:
+            columns = [c for c in parquet.schema_arrow.names if c in columns]
+        chunks = (batch.to_pandas() for batch in parquet.iter_batches(batch_size=chunk_rows, columns=columns))
+    else:
+        compression = "gzip" if fmt == "csv.gz" else None
+        if columns is not None:
+            header = pd.read_csv(path, compression=compression, nrows=0).columns
+            columns = [c for c in header if c in columns]
+        chunks = pd.read_csv(path, compression=compression, usecols=columns, chunksize=chunk_rows)
+
+    for df in chunks:
+        df.columns = [str(c) for c in df.columns]
+        yield arrow_safe(df)
+
+
+def is_large_upload(upload):
+    return uploads.status(upload["id"])["size"] >= OUT_OF_CORE_BYTES
+
+
+def iter_upload_chunks(upload, columns=None):
+    # Chunks of a large upload. The first full pass keeps each chunk in the
+    # parsed store, so later passes memory-map them instead of parsing again.
+    # A pass whose chunks would take more than half the store's budget stops
+    # keeping them, rather than evicting other uploads to make room.
+    key = upload_key(upload)
+    name = "chunks" if columns is None else _columns_name(columns) + "-chunks"
+    meta = parsed_store.get_meta(key, name)
+    if meta is not None and all(parsed_store.has_frame(key, f"{name}-{i}") for i in range(meta["chunks"])):
+        for i in range(meta["chunks"]):
+            yield parsed_store.get_frame(key, f"{name}-{i}")
+        return
+
+    count = 0
+    stashed = last = 0
+    for df in iter_chunks(uploads.path(upload["id"]), columns=columns):
+        # The next chunk is taken to be about the size of the last one
+        if stashed is not None and stashed + last > parsed_store.max_bytes // 2:
+            for i in range(count):
+                parsed_store.drop(key, f"{name}-{i}")
+            stashed = None
+        if stashed is not None:
+            parsed_store.put_frame(key, f"{name}-{count}", df)
+            last = parsed_store.frame_bytes(key, f"{name}-{count}")
+            stashed += last
+        count += 1
+        yield df
+    if stashed is not None:
+        parsed_store.put_meta(key, name, {"chunks": count})
+
+
+def prefetch_upload(upload, columns):
+    # Parse the given columns on a background thread, so a report started
+    # soon after finds them in the parsed store
+    def run():
+        try:
+            read_upload(upload, columns=columns)
+        except Exception:
+            logger.exception("Prefetching %s failed", upload.get("filename"))
+
+    thread = threading.Thread(target=run, name="prefetch", daemon=True)
+    thread.start()
+    return thread
+
+
+def sniff_upload(upload, nrows=PREVIEW_ROWS):
+    # Header and a few typed rows only, for the column-mapping dropdowns
+    df = parsed_frames.get(upload_key(upload))
+    if df is not None:
+        return df.columns.tolist(), df.head(nrows)
+    preview = parse_file(uploads.path(upload["id"]), nrows=nrows)
+    return preview.columns.tolist(), preview
@@ -0,0 +1,208 @@
+import difflib
+import functools
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+
+from utils.inventory import INVENTORY_COLUMNS
+from utils.loaders import sniff_upload
+from utils.store import DATA_DIR
+from utils.tb import TB_COLUMNS
+from utils.trace import GL_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.path.join(DATA_DIR, "profiles")
+
+# Canonical columns each kind of file is mapped onto
+KIND_COLUMNS = {
+    "gl": GL_COLUMNS,
+    "tb": TB_COLUMNS,
+    "inventory": INVENTORY_COLUMNS,
+}
+
+# Lowest score at which a header is suggested for a canonical column
+MATCH_CUTOFF = 0.6
+# Lowest similarity at which a misspelt word, or a header written as one word, still matches
+WORD_CUTOFF = 0.85
+# Abbreviations and synonyms ERP exports use in headers, expanded before matching
+ABBREVIATIONS = {
+    "acc": "account", "acct": "account", "amt": "amount", "bal": "amount", "balance": "amount",
+    "desc": "description", "doc": "document", "qty": "quantity", "sku": "item code",
+    "trans": "transaction", "txn": "transaction",
+}
+# Words that say what a column holds about its subject: an identifier or a
+# description. "Acc No" and "Account Description" share a subject but never a role.
+ROLES = {
+    "code": "<id>", "id": "<id>", "no": "<id>", "nr": "<id>", "num": "<id>", "number": "<id>",
+    "description": "<name>", "name": "<name>", "title": "<name>",
+}
+
+
+def normalize_header(name):
+    # "Account_Code ", "ACCOUNT CODE" and "account-code" are the same header
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", str(name).casefold()).split())
+
+
+def _match_key(name):
+    # Words of a header with abbreviations expanded; "AccountCode" is two words
+    name = re.sub(r"(?<=[a-z])(?=[A-Z])", " ", str(name))
+    words = " ".join(ABBREVIATIONS.get(word, word) for word in normalize_header(name).split())
+    return " ".join(ROLES.get(word, word) for word in words.split())
+
+
+def _role(words):
+    roles = {word for word in words if word in ROLES.values()}
+    return roles.pop() if len(roles) == 1 else None
+
+
+@functools.lru_cache(maxsize=4096)
+def _word_ratio(a, b):
+    return difflib.SequenceMatcher(None, a, b, autojunk=False).ratio()
+
+
+def _word_matches(word, words):
+    # Role words match exactly; other words may be misspelt
+    if word in ROLES.values():
+        return word in words
+    return any(_word_ratio(word, other) >= WORD_CUTOFF for other in words if other not in ROLES.values())
+
+
+def score_header(header_key, canonical_key):
+    # Shared words as a share of both the header's and the canonical column's.
+    # A header with a role only matches a column with the same role, so "Acc No"
+    # is never an account name nor "Txn No" a transaction date.
+    header, canonical = header_key.split(), canonical_key.split()
+    role = _role(header)
+    if role is not None and role != _role(canonical):
+        return 0.0
+    shared = sum(_word_matches(word, canonical) for word in header)
+    score = (shared / len(header) + shared / len(canonical)) / 2 if header else 0.0
+    # Headers run together into one word, e.g. "TRANSACTIONDATE"
+    glued = _word_ratio(header_key.replace(" ", ""), canonical_key.replace(" ", ""))
+    return max(score, glued if glued >= WORD_CUTOFF else 0.0)
+
+
+def header_fingerprint(columns):
+    # The normalized header row, in order, identifies an export layout
+    return hashlib.sha256("\0".join(normalize_header(c) for c in columns).encode()).hexdigest()[:32]
+
+
+class MappingProfiles:
+    """Confirmed column mappings, one JSON file per kind and header layout.
+
+    A profile maps each canonical column to the uploaded header it came from.
+    Profiles are small and meant to outlive sessions, so they are never evicted.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, kind, columns):
+        if kind not in KIND_COLUMNS:
+            raise ValueError(f"Unknown mapping kind: {kind}")
+        return os.path.join(self.root, f"{kind}-{header_fingerprint(columns)}.json")
+
+    def get(self, kind, columns):
+        try:
+            with open(self._path(kind, columns)) as f:
+                mapping = json.load(f)
+        except FileNotFoundError:
+            return None
+        # Normalized headers match, so map to this file's own spelling of them
+        by_normal = {normalize_header(c): c for c in columns}
+        mapping = {canonical: by_normal.get(normalize_header(source)) for canonical, source in mapping.items()}
+        if set(mapping) != set(KIND_COLUMNS[kind]) or None in mapping.values():
+            return None
+        return mapping
+
+    def put(self, kind, columns, mapping):
+        path = self._path(kind, columns)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with self._lock:
+            with open(tmp, "w") as f:
+                json.dump(mapping, f)
+            os.replace(tmp, path)
+        logger.info("Saved %s mapping profile", kind, extra={"fields": {"path": path}})
+
+
+profiles = MappingProfiles(PROFILE_DIR)
+
+
+class ColumnMatcher:
+    """Matches headers to canonical columns.
+
+    Headers equal to a canonical name once normalized are taken as they are.
+    The rest are scored word by word with score_header, and each header is
+    suggested for at most one column, best scores first.
+    """
+
+    def __init__(self, canonical, cutoff=MATCH_CUTOFF):
+        self.canonical = list(canonical)
+        self.cutoff = cutoff
+        self._keys = [_match_key(col) for col in self.canonical]
+
+    def match(self, columns):
+        names = [_match_key(c) for c in columns]
+        mapping = dict.fromkeys(self.canonical)
+        used = set()
+        exact = {name: j for j, name in reversed(list(enumerate(names)))}
+        for col, key in zip(self.canonical, self._keys):
+            j = exact.get(key)
+            if j is not None and j not in used:
+                mapping[col] = columns[j]
+                used.add(j)
+
+        scores = []
+        for i, key in enumerate(self._keys):
+            if mapping[self.canonical[i]] is not None:
+                continue
+            for j, name in enumerate(names):
+                if j in used:
+                    continue
+                score = score_header(name, key)
+                if score >= self.cutoff:
+                    scores.append((-score, i, j))
+
+        # Best pairs first, with each uploaded column used for one canonical column only.
+        # On a tie the earlier canonical column wins, so a bare "Account" is the code.
+        for _, i, j in sorted(scores):
+            if mapping[self.canonical[i]] is None and j not in used:
+                mapping[self.canonical[i]] = columns[j]
+                used.add(j)
+        return mapping
+
+
+MATCHERS = {kind: ColumnMatcher(columns) for kind, columns in KIND_COLUMNS.items()}
+
+
+@functools.lru_cache(maxsize=1024)
+def _fuzzy_mapping(kind, columns):
+    return MATCHERS[kind].match(columns)
+
+
+def suggest_mapping(kind, columns):
+    # Saved profile for this header layout, else the fuzzy matcher's best guess.
+    # Returns {canonical column: uploaded column or None} and whether it was saved.
+    columns = tuple(columns)
+    mapping = profiles.get(kind, columns)
+    if mapping is not None:
+        return mapping, True
+    return dict(_fuzzy_mapping(kind, columns)), False
+
+
+def save_mapping(kind, columns, mapping):
+    # Called once a report ran with this mapping, so only mappings that worked are kept
+    if profiles.get(kind, columns) != mapping:
+        profiles.put(kind, columns, mapping)
+
+
+def remember_mapping(kind, upload, selected):
+    # selected holds the uploaded column for each canonical column of the kind, in order
+    columns, _ = sniff_upload(upload)
+    save_mapping(kind, columns, dict(zip(KIND_COLUMNS[kind], selected)))
@@ -0,0 +1,270 @@
+import fcntl
+import json
+import logging
+import os
+import re
+import resource
+import threading
+import uuid
+
+import psutil
+
+from utils.store import DATA_DIR
+
+METRICS_DIR = os.path.join(DATA_DIR, "metrics")
+
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BYTE_BUCKETS = (2**20, 10 * 2**20, 50 * 2**20, 100 * 2**20, 250 * 2**20, 500 * 2**20, 2**30, 2 * 2**30)
+
+HELP = {
+    "moore_callback_duration_seconds": ("histogram", "Wall time of Dash callback requests"),
+    "moore_callback_upload_bytes": ("histogram", "Size of the uploads a callback request referenced"),
+    "moore_callback_errors_total": ("counter", "Callback requests that did not return 200"),
+    "moore_job_duration_seconds": ("histogram", "Wall time of background report jobs"),
+    "moore_job_stage_duration_seconds": ("histogram", "Wall time of each background job stage"),
+    "moore_job_rows_total": ("counter", "Input rows read by background jobs"),
+    "moore_jobs_total": ("counter", "Finished background jobs by outcome"),
+    "moore_process_peak_rss_bytes": ("gauge", "Highest peak RSS of any worker or job process"),
+}
+
+metrics_logger = logging.getLogger("moore.metrics")
+
+
+class JsonFormatter(logging.Formatter):
+    # One JSON object per line; fields passed as extra={"fields": {...}} are merged in
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "pid": record.process,
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level=None):
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level or os.environ.get("MOORE_LOG_LEVEL", "INFO"))
+
+
+def peak_rss_bytes():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def rss_bytes():
+    return psutil.Process().memory_info().rss
+
+
+def _key(name, labels):
+    return json.dumps([name, sorted(labels.items())])
+
+
+class MetricsRegistry:
+    """Counters, histograms and max-gauges for one process, shared through files.
+
+    Gunicorn workers and background job processes each flush their own file
+    under METRICS_DIR; a scrape sums them. Files of processes that have exited
+    are folded into a single archive file so they don't pile up.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self._pid = None
+        os.makedirs(root, exist_ok=True)
+
+    def _own(self):
+        # A forked child starts from empty values under its own file
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._token = uuid.uuid4().hex[:8]
+            self._values = {}
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            self._own()
+            key = _key(name, labels)
+            self._values[key] = self._values.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets=DURATION_BUCKETS):
+        with self._lock:
+            self._own()
+            key = _key(name, labels)
+            hist = self._values.setdefault(key, {"buckets": [0] * len(buckets), "sum": 0, "count": 0})
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    hist["buckets"][i] += 1
+            hist["sum"] += value
+            hist["count"] += 1
+
+    def set_max(self, name, labels, value):
+        with self._lock:
+            self._own()
+            key = _key(name, labels)
+            self._values[key] = {"max": max(value, self._values.get(key, {}).get("max", 0))}
+
+    def flush(self):
+        with self._lock:
+            self._own()
+            path = os.path.join(self.root, f"{self._pid}-{self._token}.json")
+            tmp = path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self._values, f)
+            os.replace(tmp, path)
+
+    def _fold_exited(self):
+        # Runs under an exclusive file lock, so each file is archived exactly once
+        archive_path = os.path.join(self.root, "archive.data")
+        with open(os.path.join(self.root, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            archive = _read_values(archive_path)
+            folded = []
+            for entry in os.scandir(self.root):
+                if not entry.name.endswith(".json") or psutil.pid_exists(int(entry.name.split("-")[0])):
+                    continue
+                _merge(archive, _read_values(entry.path))
+                folded.append(entry.path)
+            if folded:
+                with open(archive_path + ".tmp", "w") as f:
+                    json.dump(archive, f)
+                os.replace(archive_path + ".tmp", archive_path)
+                for path in folded:
+                    os.remove(path)
+
+    def collect(self):
+        self.flush()
+        self._fold_exited()
+        merged = _read_values(os.path.join(self.root, "archive.data"))
+        for entry in os.scandir(self.root):
+            if entry.name.endswith(".json"):
+                _merge(merged, _read_values(entry.path))
+        return merged
+
+
+def _read_values(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _merge(into, values):
+    for key, value in values.items():
+        current = into.get(key)
+        if current is None:
+            into[key] = value
+        elif isinstance(value, dict) and "max" in value:
+            current["max"] = max(current["max"], value["max"])
+        elif isinstance(value, dict):
+            current["buckets"] = [a + b for a, b in zip(current["buckets"], value["buckets"])]
+            current["sum"] += value["sum"]
+            current["count"] += value["count"]
+        else:
+            into[key] = current + value
+
+
+def _labels(pairs, extra=None):
+    pairs = list(pairs) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def render_prometheus(values):
+    # Prometheus text exposition format, version 0.0.4
+    by_name = {}
+    for key, value in values.items():
+        name, labels = json.loads(key)
+        by_name.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name in sorted(by_name):
+        kind, help_text = HELP.get(name, ("untyped", name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        buckets = BYTE_BUCKETS if name.endswith("_bytes") and kind == "histogram" else DURATION_BUCKETS
+        for labels, value in sorted(by_name[name], key=lambda item: item[0]):
+            if isinstance(value, dict) and "max" in value:
+                lines.append(f"{name}{_labels(labels)} {value['max']}")
+            elif isinstance(value, dict):
+                for bound, count in zip(buckets, value["buckets"]):
+                    lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {value['count']}")
+                lines.append(f"{name}_sum{_labels(labels)} {value['sum']}")
+                lines.append(f"{name}_count{_labels(labels)} {value['count']}")
+            else:
+                lines.append(f"{name}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def callback_name(payload):
+    # "..a.children...b.data@<hash>.." -> "a.children,b.data"
+    output = re.sub(r"@[0-9a-f]+", "", payload.get("output", ""))
+    return ",".join(part for part in output.strip(".").split("...") if part)
+
+
+def upload_refs(payload):
+    # Upload references ({id, filename, size}) among a callback's inputs and states
+    refs = []
+    for item in (payload.get("inputs") or []) + (payload.get("state") or []):
+        for entry in item if isinstance(item, list) else [item]:
+            value = entry.get("value") if isinstance(entry, dict) else None
+            if isinstance(value, dict) and {"id", "filename", "size"} <= value.keys():
+                refs.append(value)
+    return refs
+
+
+def record_callback(payload, page, status_code, seconds, poll=False):
+    # One Dash callback request, as seen by the Flask hooks in app.py
+    callback = callback_name(payload)
+    labels = {"callback": callback, "page": page}
+    upload_bytes = sum(int(ref.get("size") or 0) for ref in upload_refs(payload))
+
+    # Background callbacks are polled until done; polls are timed separately
+    registry.observe("moore_callback_duration_seconds", dict(labels, kind="poll" if poll else "request"), seconds)
+    if upload_bytes and not poll:
+        registry.observe("moore_callback_upload_bytes", labels, upload_bytes, BYTE_BUCKETS)
+    if status_code != 200:
+        registry.inc("moore_callback_errors_total", dict(labels, status=str(status_code)))
+    peak = peak_rss_bytes()
+    registry.set_max("moore_process_peak_rss_bytes", {}, peak)
+    registry.flush()
+
+    if not poll:
+        metrics_logger.info("callback", extra={"fields": {
+            "callback": callback, "page": page, "status": status_code, "seconds": round(seconds, 4),
+            "upload_bytes": upload_bytes, "rss_bytes": rss_bytes(), "peak_rss_bytes": peak,
+        }})
+
+
+def record_job(job, state, seconds, stages, rows):
+    # One finished background job, reported by utils.jobs.JobProgress
+    for stage, stage_seconds in stages.items():
+        registry.observe("moore_job_stage_duration_seconds", {"job": job, "stage": stage}, stage_seconds)
+    registry.observe("moore_job_duration_seconds", {"job": job}, seconds)
+    registry.inc("moore_jobs_total", {"job": job, "state": state})
+    if rows:
+        registry.inc("moore_job_rows_total", {"job": job}, rows)
+    peak = peak_rss_bytes()
+    registry.set_max("moore_process_peak_rss_bytes", {}, peak)
+    registry.flush()
+
+    metrics_logger.info("job", extra={"fields": {
+        "job": job, "state": state, "seconds": round(seconds, 4),
+        "stages": {name: round(value, 4) for name, value in stages.items()},
+        "rows": rows, "rss_bytes": rss_bytes(), "peak_rss_bytes": peak,
+    }})
+
+
+registry = MetricsRegistry(METRICS_DIR)
+
@@ -0,0 +1,54 @@
+import hashlib
+import json
+import os
+
+from utils.store import DATA_DIR, SESSION_TTL_SECONDS, DatasetStore
+
+# Byte budget for memoized trace results shared by every worker and background job
+RESULT_CACHE_BYTES = int(os.environ.get("MOORE_RESULT_CACHE_MB", "512")) * 1024 * 1024
+
+# Frame names, in the order trace_lead_pair returns them
+TRACE_RESULTS = ["existence_found", "existence_not_found", "completeness_found", "completeness_not_found"]
+
+
+class TraceResultCache:
+    """Trace results keyed by upload content hash, column mapping and lead pair.
+
+    Tracing a -> b gives the same four frames as b -> a with existence and
+    completeness swapped, so results are stored once under the sorted pair.
+    Exported files differ by sheet order and are kept per direction and format.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def _entry(self, upload_hash, mapping, lead_a, lead_b):
+        lead_a, lead_b = int(lead_a), int(lead_b)
+        key = json.dumps({"upload": upload_hash, "mapping": mapping, "leads": sorted([lead_a, lead_b])})
+        return hashlib.sha256(key.encode()).hexdigest(), lead_a > lead_b
+
+    def get(self, upload_hash, mapping, lead_a, lead_b):
+        entry, swapped = self._entry(upload_hash, mapping, lead_a, lead_b)
+        frames = [self.store.get_frame(entry, name) for name in TRACE_RESULTS]
+        if any(frame is None for frame in frames):
+            return None
+        return frames[2:] + frames[:2] if swapped else frames
+
+    def put(self, upload_hash, mapping, lead_a, lead_b, frames):
+        entry, swapped = self._entry(upload_hash, mapping, lead_a, lead_b)
+        if swapped:
+            frames = frames[2:] + frames[:2]
+        for name, frame in zip(TRACE_RESULTS, frames):
+            self.store.put_frame(entry, name, frame)
+
+    def export_path(self, upload_hash, mapping, lead_a, lead_b, fmt):
+        entry, swapped = self._entry(upload_hash, mapping, lead_a, lead_b)
+        return self.store.blob_path(entry, f"{fmt}_ba" if swapped else f"{fmt}_ab")
+
+    def put_export(self, upload_hash, mapping, lead_a, lead_b, fmt, write):
+        entry, swapped = self._entry(upload_hash, mapping, lead_a, lead_b)
+        self.store.write_blob(entry, f"{fmt}_ba" if swapped else f"{fmt}_ab", write)
+
+
+trace_results = TraceResultCache(
+    DatasetStore(os.path.join(DATA_DIR, "results"), SESSION_TTL_SECONDS, RESULT_CACHE_BYTES))
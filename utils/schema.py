@@ -0,0 +1,108 @@
+import logging
+
+from utils.lazy import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+logger = logging.getLogger(__name__)
+
+# Amounts are held as integer cents so sums are exact
+AMOUNT_SCALE = 100
+
+# How each canonical (mapped) column is stored
+KEY_COLUMNS = [
+    "ACCOUNT CODE", "ACCOUNT NAME", "LEAD SHEET NUMBER", "TRANSACTION SOURCE",
+    "TRANSACTION NUMBER", "DOCUMENT NUMBER", "ITEM CODE", "ITEM NAME"
+]
+AMOUNT_COLUMNS = ["AMOUNT"]
+QUANTITY_COLUMNS = ["QUANTITY"]
+DATE_COLUMNS = ["TRANSACTION DATE"]
+
+# Result columns derived from amounts, converted back with from_minor_units
+RESULT_AMOUNT_MARKERS = ("AMOUNT", "DIFFERENCE", "VARIANCE")
+
+
+def _compact_key(series):
+    if pd.api.types.is_integer_dtype(series):
+        return pd.to_numeric(series, downcast="integer")
+    if pd.api.types.is_float_dtype(series):
+        # Whole-number keys read as float because of blanks
+        if series.dropna().mod(1).eq(0).all():
+            return series.astype("Int64")
+        return series
+    if series.dtype == object and series.nunique(dropna=True) < 0.5 * len(series):
+        return series.astype("category")
+    return series
+
+
+def _compact_quantity(series):
+    values = pd.to_numeric(series, errors="coerce")
+    if values.notna().all() and values.mod(1).eq(0).all():
+        return pd.to_numeric(values.astype("int64"), downcast="integer")
+    return values
+
+
+def to_minor_units(series):
+    values = pd.to_numeric(series, errors="coerce")
+    return np.round(values * AMOUNT_SCALE).astype("Int64")
+
+
+def from_minor_units(frame):
+    # Amount columns of a result frame back to currency units, ready to display or export
+    frame = frame.copy()
+    for col in frame.columns:
+        if isinstance(col, str) and any(marker in col for marker in RESULT_AMOUNT_MARKERS) \
+                and pd.api.types.is_integer_dtype(frame[col]):
+            frame[col] = frame[col].astype("float64") / AMOUNT_SCALE
+    return frame
+
+
+def key_text(values):
+    # Join keys as text, so 1001, 1001.0 and "1001 " from different files all match
+    series = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(series) and series.dropna().mod(1).eq(0).all():
+        return series.astype("Int64").astype(str).values
+    return series.astype(str).str.strip().values
+
+
+def totals_by_key(df, key, name, value, label):
+    # Name, value total and line count per key, indexed by key text, with the
+    # result columns prefixed by label. One groupby per file, then the (much
+    # smaller) per-key result is re-keyed.
+    grouped = df.groupby(key, observed=True, sort=False)[value]
+    agg = pd.DataFrame({value: grouped.sum(), "LINES": grouped.size()})
+    # groupby "first" falls back to a slow path on categorical names
+    names = df.drop_duplicates(key).set_index(key)[name]
+    agg.insert(0, "NAME", names.reindex(agg.index).values)
+    agg.index = pd.Index(key_text(agg.index), name=key)
+    if agg.index.has_duplicates:
+        agg = agg.groupby(level=0).agg({"NAME": "first", value: "sum", "LINES": "sum"})
+    return agg.add_prefix(f"{label} ")
+
+
+def memory_bytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def compact(df, label="frame"):
+    # Canonical columns re-typed for memory: repeated keys as categories,
+    # numerics downcast, amounts as integer cents and dates parsed once
+    before = memory_bytes(df)
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        if col in KEY_COLUMNS:
+            series = _compact_key(series)
+        elif col in AMOUNT_COLUMNS:
+            series = to_minor_units(series)
+        elif col in QUANTITY_COLUMNS:
+            series = _compact_quantity(series)
+        elif col in DATE_COLUMNS and not pd.api.types.is_datetime64_any_dtype(series):
+            series = pd.to_datetime(series, errors="coerce")
+        columns[col] = series
+    compacted = pd.DataFrame(columns, index=df.index)
+
+    after = memory_bytes(compacted)
+    logger.info("Compacted %s: %.1f MB -> %.1f MB (%d rows)", label, before / 1e6, after / 1e6, len(df))
+    return compacted
@@ -0,0 +1,187 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+from utils.lazy import lazy_import
+
+pa = lazy_import("pyarrow")
+feather = lazy_import("pyarrow.feather")
+
+# Session datasets live on local disk so every gunicorn worker can read them
+DATA_DIR = os.environ.get("MOORE_DATA_DIR", os.path.join(tempfile.gettempdir(), "mooreinfinity"))
+SESSION_TTL_SECONDS = int(os.environ.get("MOORE_SESSION_TTL_MINUTES", "120")) * 60
+STORE_MAX_BYTES = int(os.environ.get("MOORE_STORE_MAX_MB", "2048")) * 1024 * 1024
+
+# Session ids are uuid4 hex; content-addressed stores key on sha256 hex
+SESSION_ID = re.compile(r"^[0-9a-f]{32}([0-9a-f]{32})?$")
+NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def arrow_safe(df):
+    # Excel columns often mix numbers and text; store those as text rather than fail
+    mixed = []
+    for col in df.columns[df.dtypes == object]:
+        try:
+            pa.array(df[col], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            mixed.append(col)
+    if not mixed:
+        return df
+    df = df.copy()
+    for col in mixed:
+        df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def _arrow_table(df):
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.Table.from_pandas(arrow_safe(df), preserve_index=False)
+
+
+class DatasetStore:
+    """Per-session frames stored as uncompressed Feather files.
+
+    Uncompressed Feather can be memory-mapped, so a worker that did not write
+    a dataset reads it back without parsing it. Converting to pandas still
+    copies the columns read into the worker's own memory, so callers that need
+    only some columns should name them and the rest are never touched.
+    Sessions expire after the TTL and the oldest are dropped once the store
+    grows past its byte budget.
+    """
+
+    def __init__(self, root, ttl_seconds, max_bytes):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, session_id, name, ext):
+        if not session_id or not SESSION_ID.match(session_id):
+            raise ValueError("Invalid session id")
+        if not NAME.match(name):
+            raise ValueError(f"Invalid dataset name: {name}")
+        return os.path.join(self.root, session_id, f"{name}.{ext}")
+
+    def _write(self, path, write):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so readers in other workers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        os.close(fd)
+        try:
+            write(tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def put_frame(self, session_id, name, df, meta=None):
+        path = self._path(session_id, name, "feather")
+        table = _arrow_table(df)
+        self._write(path, lambda tmp: feather.write_feather(table, tmp, compression="uncompressed"))
+        if meta is not None:
+            self.put_meta(session_id, name, meta)
+        self.evict(keep=session_id)
+
+    def get_frame(self, session_id, name, columns=None):
+        # With columns, only those (of the ones stored) are converted to pandas
+        path = self._path(session_id, name, "feather")
+        try:
+            table = feather.read_table(path, memory_map=True)
+        except FileNotFoundError:
+            return None
+        self._touch(session_id)
+        if columns is not None:
+            table = table.select([c for c in table.column_names if c in columns])
+        return table.to_pandas()
+
+    def has_frame(self, session_id, name):
+        return os.path.exists(self._path(session_id, name, "feather"))
+
+    def frame_bytes(self, session_id, name):
+        try:
+            return os.path.getsize(self._path(session_id, name, "feather"))
+        except FileNotFoundError:
+            return 0
+
+    def put_meta(self, session_id, name, meta):
+        path = self._path(session_id, name, "json")
+
+        def write(tmp):
+            with open(tmp, "w") as f:
+                json.dump(meta, f)
+        self._write(path, write)
+
+    def get_meta(self, session_id, name):
+        try:
+            with open(self._path(session_id, name, "json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put_blob(self, session_id, name, data):
+        def write(tmp):
+            with open(tmp, "wb") as f:
+                f.write(data)
+        self.write_blob(session_id, name, write)
+
+    def write_blob(self, session_id, name, write):
+        # write(path) produces the file itself, so large results are never held in memory
+        self._write(self._path(session_id, name, "bin"), write)
+        self.evict(keep=session_id)
+
+    def blob_path(self, session_id, name):
+        path = self._path(session_id, name, "bin")
+        return path if os.path.exists(path) else None
+
+    def drop(self, session_id, name):
+        for ext in ("feather", "json", "bin"):
+            path = self._path(session_id, name, ext)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _touch(self, session_id):
+        try:
+            os.utime(os.path.join(self.root, session_id))
+        except FileNotFoundError:
+            pass
+
+    def _sessions(self):
+        sessions = []
+        for entry in os.scandir(self.root):
+            if not entry.is_dir() or not SESSION_ID.match(entry.name):
+                continue
+            size = 0
+            for f in os.scandir(entry.path):
+                try:
+                    size += f.stat().st_size
+                except FileNotFoundError:
+                    pass
+            sessions.append((entry.stat().st_mtime, size, entry.path))
+        return sorted(sessions)
+
+    def evict(self, keep=None):
+        # keep is the session being written, which is never dropped by its own write
+        with self._lock:
+            now = time.time()
+            sessions = self._sessions()
+            total = sum(size for _, size, _ in sessions)
+            for mtime, size, path in sessions:
+                if keep is not None and os.path.basename(path) == keep:
+                    continue
+                if now - mtime > self.ttl_seconds or total > self.max_bytes:
+                    shutil.rmtree(path, ignore_errors=True)
+                    total -= size
+
+
+datasets = DatasetStore(DATA_DIR, SESSION_TTL_SECONDS, STORE_MAX_BYTES)
+
+# Parsed uploads keyed by content hash, shared by every worker and background job
+parsed_store = DatasetStore(os.path.join(DATA_DIR, "parsed"), SESSION_TTL_SECONDS, STORE_MAX_BYTES)
@@ -0,0 +1,82 @@
+import math
+
+from utils.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+# DataTable filter operators, longest first so "<=" is not read as "<"
+FILTER_OPERATORS = [
+    ("ge", ">="), ("le", "<="), ("lt", "<"), ("gt", ">"), ("ne", "!="), ("eq", "="),
+    ("contains", None), ("datestartswith", None),
+]
+
+
+def _filter_value(text):
+    text = text.strip()
+    if len(text) > 1 and text[0] == text[-1] and text[0] in "'\"`":
+        return text[1:-1]
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def split_filter_part(part):
+    # "{AMOUNT} s> 100" -> ("AMOUNT", "gt", 100.0, True); None when the part can't be read.
+    # Operators may carry DataTable's case prefix: "s" sensitive, "i" insensitive,
+    # and none for the default (None), e.g. "scontains", "icontains", "i=", "ile".
+    for name, symbol in FILTER_OPERATORS:
+        for prefix, case in (("", None), ("s", True), ("i", False)):
+            for token in (name, symbol):
+                if token is None or f" {prefix}{token} " not in f" {part} ":
+                    continue
+                column, value = f" {part} ".split(f" {prefix}{token} ", 1)
+                column = column.strip()
+                if column.startswith("{") and column.endswith("}"):
+                    return column[1:-1], name, _filter_value(value), case
+    return None
+
+
+def _apply_filter(df, column, operator, value, case=None):
+    series = df[column]
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype(object)
+    if operator == "contains":
+        # Without a prefix, contains ignores case as it always has
+        return df[series.astype(str).str.contains(str(value), case=bool(case), regex=False, na=False)]
+    if operator == "datestartswith":
+        return df[series.astype(str).str.startswith(str(value), na=False)]
+    if isinstance(value, float) and not pd.api.types.is_numeric_dtype(series):
+        # Numbers typed against a text column compare as text, e.g. transaction numbers
+        value = str(int(value)) if value.is_integer() else str(value)
+        series = series.astype(str)
+    if case is False and isinstance(value, str):
+        value = value.casefold()
+        series = series.where(series.isna(), series.astype(str).str.casefold())
+    compare = {"eq": series.eq, "ne": series.ne, "lt": series.lt,
+               "le": series.le, "gt": series.gt, "ge": series.ge}[operator]
+    try:
+        return df[compare(value).fillna(False).astype(bool)]
+    except TypeError:
+        return df.iloc[:0]
+
+
+def query_frame(df, filter_query="", sort_by=None, page_current=0, page_size=20):
+    # Server side of a DataTable in custom paging, sorting and filtering mode:
+    # returns the visible page as records and the page count after filtering
+    for part in (filter_query or "").split(" && "):
+        parsed = split_filter_part(part) if part.strip() else None
+        if parsed and parsed[0] in df.columns:
+            df = _apply_filter(df, *parsed)
+
+    if sort_by:
+        sort_by = [s for s in sort_by if s["column_id"] in df.columns]
+        if sort_by:
+            df = df.sort_values([s["column_id"] for s in sort_by],
+                                ascending=[s["direction"] == "asc" for s in sort_by],
+                                kind="stable", na_position="last")
+
+    page_current = page_current or 0
+    start = page_current * page_size
+    page = df.iloc[start:start + page_size]
+    return page.to_dict("records"), max(1, math.ceil(len(df) / page_size))
@@ -0,0 +1,119 @@
+from utils.lazy import lazy_import
+from utils.schema import compact, totals_by_key
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+TB_COLUMNS = ["ACCOUNT CODE", "ACCOUNT NAME", "AMOUNT"]
+
+ROLLS_FORWARD = "Rolls forward"
+VARIANCE = "Variance"
+NEW_ACCOUNT = "New account"
+DROPPED_ACCOUNT = "Dropped account"
+GL_ONLY = "GL movement only"
+
+
+def check_tb_columns(df, label):
+    missing = [col for col in TB_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns in {label}: {missing}")
+
+
+def map_tb_columns(df, account_code, account_name, amount, label):
+    # Uploaded columns renamed to the canonical TB columns, then compacted
+    df = df.rename(columns={account_code: "ACCOUNT CODE",
+                            account_name: "ACCOUNT NAME",
+                            amount: "AMOUNT"}, copy=False)
+    check_tb_columns(df, label)
+    return compact(df[TB_COLUMNS], label)
+
+
+def _by_account(df, label):
+    return totals_by_key(df, "ACCOUNT CODE", "ACCOUNT NAME", "AMOUNT", label)
+
+
+def _normalized_name(names):
+    return names.astype("string").str.strip().str.casefold()
+
+
+def account_movement(gl):
+    # GL name, amount and line count per account, indexed by account code text
+    check_tb_columns(gl, "general ledger")
+    return _by_account(gl, "GL")
+
+
+def combine_movement(movements):
+    # Per-account movements of parts of one ledger added together
+    return pd.concat(movements).groupby(level=0, sort=False).agg(
+        {"GL NAME": "first", "GL AMOUNT": "sum", "GL LINES": "sum"})
+
+
+def gl_movement(chunks):
+    # GL movement per account from mapped GL chunks, holding only one chunk and
+    # the running per-account totals at a time
+    movement = None
+    for chunk in chunks:
+        part = account_movement(chunk)
+        if movement is not None:
+            part = combine_movement([movement, part])
+        movement = part
+    if movement is None:
+        raise ValueError("The general ledger has no rows")
+    return movement
+
+
+def tb_rollforward(curr_tb, prior_tb, gl):
+    # prior + GL movement = current, per account. Frames hold the canonical TB
+    # columns; amounts are summed as given (integer cents for compacted frames).
+    return _rollforward(curr_tb, prior_tb, account_movement(gl))
+
+
+def tb_rollforward_chunked(curr_tb, prior_tb, gl_chunks):
+    # tb_rollforward for a ledger streamed in chunks that won't fit in memory at once
+    return _rollforward(curr_tb, prior_tb, gl_movement(gl_chunks))
+
+
+def _rollforward(curr_tb, prior_tb, movement):
+    check_tb_columns(curr_tb, "current TB")
+    check_tb_columns(prior_tb, "prior TB")
+
+    curr = _by_account(curr_tb, "CURRENT")
+    prior = _by_account(prior_tb, "PRIOR")
+
+    # Index joins are hash joins on the account key
+    rf = curr.join(prior, how="outer").join(movement, how="outer").sort_index()
+
+    in_curr = rf["CURRENT AMOUNT"].notna()
+    in_prior = rf["PRIOR AMOUNT"].notna()
+    for col in ("CURRENT AMOUNT", "PRIOR AMOUNT", "GL AMOUNT"):
+        rf[col] = rf[col].fillna(0)
+    rf["GL LINES"] = rf["GL LINES"].fillna(0).astype("int64")
+
+    rf["EXPECTED AMOUNT"] = rf["PRIOR AMOUNT"] + rf["GL AMOUNT"]
+    rf["VARIANCE"] = rf["CURRENT AMOUNT"] - rf["EXPECTED AMOUNT"]
+    # Amounts may be nullable integers, so compare as plain bool arrays
+    balanced = (rf["VARIANCE"] == 0).to_numpy(dtype=bool, na_value=False)
+    in_curr, in_prior = in_curr.to_numpy(), in_prior.to_numpy()
+    rf["STATUS"] = np.select(
+        [in_curr & ~in_prior, ~in_curr & in_prior, ~in_curr & ~in_prior, balanced],
+        [NEW_ACCOUNT, DROPPED_ACCOUNT, GL_ONLY, ROLLS_FORWARD],
+        default=VARIANCE
+    )
+
+    # GL names are often narrative, so only the two trial balances are compared
+    mismatch = _normalized_name(rf["CURRENT NAME"]) != _normalized_name(rf["PRIOR NAME"])
+    rf["NAME MISMATCH"] = mismatch.fillna(False).astype(bool)
+
+    rf = rf.reset_index()[[
+        "ACCOUNT CODE", "CURRENT NAME", "PRIOR NAME", "GL NAME",
+        "PRIOR AMOUNT", "GL AMOUNT", "EXPECTED AMOUNT", "CURRENT AMOUNT", "VARIANCE",
+        "STATUS", "NAME MISMATCH", "GL LINES"
+    ]]
+
+    return {
+        "Roll Forward": rf,
+        "Variances": rf[rf["STATUS"] != ROLLS_FORWARD],
+        "New Accounts": rf[rf["STATUS"] == NEW_ACCOUNT],
+        "Dropped Accounts": rf[rf["STATUS"] == DROPPED_ACCOUNT],
+        "Name Mismatches": rf[rf["NAME MISMATCH"]],
+    }
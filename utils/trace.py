@@ -0,0 +1,341 @@
+import logging
+
+from utils.lazy import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+GL_COLUMNS = [
+    "ACCOUNT CODE", "ACCOUNT NAME", "TRANSACTION DATE", "TRANSACTION SOURCE",
+    "LEAD SHEET NUMBER", "AMOUNT", "TRANSACTION NUMBER", "DOCUMENT NUMBER"
+]
+
+LEAD = "LEAD SHEET NUMBER"
+TXN = "TRANSACTION NUMBER"
+
+logger = logging.getLogger(__name__)
+
+
+def check_gl_columns(df):
+    for col in GL_COLUMNS:
+        if col not in df.columns:
+            raise ValueError(f"Missing column: {col}")
+
+
+def map_gl_columns(df, selected):
+    # selected holds the uploaded column chosen for each entry of GL_COLUMNS, in order
+    mapping = dict(zip(selected, GL_COLUMNS))
+
+    # Remove entries with None as keys (unselected dropdowns)
+    clean_mapping = {k: v for k, v in mapping.items() if k is not None}
+
+    logger.debug("Mapping GL columns", extra={"fields": {
+        "columns": df.columns.tolist(), "mapping": clean_mapping}})
+
+    # Rename using the cleaned mapping (relabels the cached frame without copying its data)
+    df = df.rename(columns=clean_mapping, copy=False)
+
+    # Check that all required columns exist
+    missing = [col for col in GL_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f"❌ Missing columns after renaming: {missing}")
+
+    # Select only the required columns
+    return df[GL_COLUMNS]
+
+
+def _postings(rows):
+    # observed=True keeps categorical keys from expanding to every combination;
+    # pandas then no longer sorts multi-key results, hence the sort_index
+    return rows.groupby([TXN, LEAD], observed=True).agg({
+        "DOCUMENT NUMBER": "count",
+        "AMOUNT": "sum"
+    }).sort_index()
+
+
+def lead_postings(df, leads):
+    # One groupby over (transaction, lead) for the rows posted to the given leads
+    return _postings(df.loc[df[LEAD].isin(leads), [TXN, LEAD, "DOCUMENT NUMBER", "AMOUNT"]])
+
+
+def gl_postings(df):
+    # Record count and amount per (transaction, lead) over the whole ledger
+    check_gl_columns(df)
+    return _postings(df[[TXN, LEAD, "DOCUMENT NUMBER", "AMOUNT"]])
+
+
+def _lead_pivot(postings, lead):
+    if lead not in postings.index.get_level_values(LEAD):
+        return postings.iloc[:0].droplevel(LEAD)
+    return postings.xs(lead, level=LEAD)
+
+
+def _trace_found(postings, lead_from, lead_to):
+    pivot_from = _lead_pivot(postings, lead_from).copy()
+    matched = _lead_pivot(postings, lead_to).reindex(pivot_from.index, fill_value=0)
+
+    pivot_from[f'AMOUNT_CL_SUM_{lead_to}'] = matched["AMOUNT"]
+    pivot_from[f'NO_OF_RECS_{lead_to}'] = matched["DOCUMENT NUMBER"]
+    pivot_from['DIFFERENCE'] = pivot_from["AMOUNT"] + pivot_from[f'AMOUNT_CL_SUM_{lead_to}']
+    return pivot_from
+
+
+def _not_found_summary(rows, pivot_from, lead_from, lead_to):
+    not_found_txns = pivot_from.index[pivot_from[f'NO_OF_RECS_{lead_to}'] == 0]
+    not_found_frame = rows[rows[TXN].isin(not_found_txns) & (rows[LEAD] != lead_from)]
+
+    return not_found_frame.groupby([LEAD, "ACCOUNT NAME"], observed=True).agg(
+        NUMBER_OF_RECORDS=("AMOUNT", "count"),
+        AMOUNT=("AMOUNT", "sum")
+    ).sort_index().reset_index()
+
+
+def _groups(values):
+    # Row positions grouped by value: positions[start:stop] are the rows of each key
+    codes, keys = pd.factorize(values, sort=True)
+    valid = np.flatnonzero(codes >= 0)
+    positions = valid[np.argsort(codes[valid], kind="stable")]
+    counts = np.bincount(codes[valid], minlength=len(keys))
+    stops = np.cumsum(counts)
+    return keys, positions, stops - counts, stops
+
+
+def _ranges(starts, stops):
+    # Concatenation of range(start, stop) for each pair, without a Python loop
+    lengths = stops - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(lengths.sum())
+
+
+def _plain_keys(frame):
+    # Plain keys: comparing categorical indexes rehashes every category of the whole GL
+    for col in (TXN, LEAD):
+        if isinstance(frame[col].dtype, pd.CategoricalDtype):
+            frame[col] = np.asarray(frame[col])
+    return frame
+
+
+class GLIndex:
+    """Aggregates built once per mapped GL, so a trace reads no GL rows.
+
+    postings holds the record count and amount per (transaction, lead), ordered
+    by lead, and totals the same per (transaction, lead, account name), ordered
+    by transaction; leads and txns give each key's slice of them. A lead pair
+    is traced from the postings of its two leads and the totals of its
+    untraced transactions, as GLLedger does for a GL split across files.
+    """
+
+    # Dataset names the index is stored under, in from_frames order
+    FRAMES = ["gl_leads", "gl_txns", "postings", "gl_totals"]
+
+    def __init__(self, leads, txns, postings, totals):
+        self.leads = leads
+        self.txns = txns
+        self.postings = postings
+        self.totals = totals
+        self._lead_keys = pd.Index(leads[LEAD])
+        self._txn_keys = pd.Index(txns[TXN])
+
+    @classmethod
+    def build(cls, df):
+        check_gl_columns(df)
+        lead_keys = pd.factorize(df[LEAD], sort=True)[1]
+
+        postings = gl_postings(df).reset_index()
+        posting_keys, by_posting, posting_starts, posting_stops = _groups(postings[LEAD])
+        postings = postings.take(by_posting).reset_index(drop=True)
+        # Leads with no postings (every row lacks a transaction number) get empty slices
+        at = pd.Index(posting_keys).get_indexer(lead_keys)
+        found = at >= 0
+        leads = pd.DataFrame({
+            LEAD: lead_keys,
+            "START": np.where(found, posting_starts[at], 0),
+            "STOP": np.where(found, posting_stops[at], 0),
+        })
+
+        totals = account_name_totals(df)
+        txn_keys, by_txn, txn_starts, txn_stops = _groups(totals[TXN])
+        totals = totals.take(by_txn).reset_index(drop=True)
+        txns = pd.DataFrame({TXN: txn_keys, "START": txn_starts, "STOP": txn_stops})
+        return cls(leads, txns, postings, totals)
+
+    def frames(self):
+        return dict(zip(self.FRAMES, (self.leads, self.txns, self.postings, self.totals)))
+
+    @classmethod
+    def from_frames(cls, frames):
+        return cls(*(frames[name] for name in cls.FRAMES))
+
+    def lead_values(self):
+        return self.leads[LEAD].tolist()
+
+    def lead_postings(self, leads):
+        at = self._lead_keys.get_indexer(pd.unique(np.asarray(leads)))
+        slices = self.leads.iloc[at[at >= 0]]
+        postings = _plain_keys(self.postings.take(_ranges(slices["START"].values, slices["STOP"].values)))
+        return postings.set_index([TXN, LEAD]).sort_index()
+
+    def all_postings(self):
+        return self.postings.set_index([TXN, LEAD]).sort_index()
+
+    def txn_totals(self, txns):
+        # Account name totals of the given transactions
+        at = self._txn_keys.get_indexer(txns)
+        slices = self.txns.iloc[at[at >= 0]]
+        return _plain_keys(self.totals.take(_ranges(slices["START"].values, slices["STOP"].values)))
+
+    def trace(self, lead_a, lead_b):
+        # trace_lead_pair from the index alone
+        lead_a = int(lead_a)
+        lead_b = int(lead_b)
+
+        postings = self.lead_postings([lead_a, lead_b])
+        exist = _trace_found(postings, lead_a, lead_b)
+        comp = _trace_found(postings, lead_b, lead_a)
+
+        untraced = exist.index[exist[f'NO_OF_RECS_{lead_b}'] == 0].union(
+            comp.index[comp[f'NO_OF_RECS_{lead_a}'] == 0])
+        totals = self.txn_totals(untraced)
+
+        return (
+            exist.reset_index(), _not_found_totals(totals, exist, lead_a, lead_b),
+            comp.reset_index(), _not_found_totals(totals, comp, lead_b, lead_a)
+        )
+
+
+def trace_lead_pair(df, lead_a, lead_b):
+    # Existence (a -> b) and completeness (b -> a) from a single groupby and a
+    # single scan for the rows of untraced transactions
+    lead_a = int(lead_a)
+    lead_b = int(lead_b)
+    check_gl_columns(df)
+
+    postings = lead_postings(df, [lead_a, lead_b])
+    exist = _trace_found(postings, lead_a, lead_b)
+    comp = _trace_found(postings, lead_b, lead_a)
+
+    untraced = exist.index[exist[f'NO_OF_RECS_{lead_b}'] == 0].union(
+        comp.index[comp[f'NO_OF_RECS_{lead_a}'] == 0])
+    rows = df.loc[df[TXN].isin(untraced), [TXN, LEAD, "ACCOUNT NAME", "AMOUNT"]]
+
+    return (
+        exist.reset_index(), _not_found_summary(rows, exist, lead_a, lead_b),
+        comp.reset_index(), _not_found_summary(rows, comp, lead_b, lead_a)
+    )
+
+
+def _combine(partials, by):
+    # Running totals: partial (count, sum) aggregates of earlier chunks add up
+    return pd.concat(partials).groupby(level=by, observed=True).sum()
+
+
+def trace_lead_pair_chunked(read_chunks, lead_a, lead_b):
+    # trace_lead_pair for a GL streamed in chunks, holding only one chunk and
+    # the running aggregates at a time. read_chunks() returns a fresh iterator
+    # of mapped GL chunks: one pass finds the untraced transactions, a second
+    # summarises their rows.
+    lead_a = int(lead_a)
+    lead_b = int(lead_b)
+
+    postings = []
+    for chunk in read_chunks():
+        check_gl_columns(chunk)
+        postings.append(lead_postings(chunk, [lead_a, lead_b]))
+        # Transactions span chunks, so partials are combined as they arrive
+        postings = [_combine(postings, [TXN, LEAD])]
+    if not postings:
+        raise ValueError("The general ledger has no rows")
+    postings = postings[0].sort_index()
+
+    exist = _trace_found(postings, lead_a, lead_b)
+    comp = _trace_found(postings, lead_b, lead_a)
+
+    summaries = {"exist": [], "comp": []}
+    for chunk in read_chunks():
+        rows = chunk[[TXN, LEAD, "ACCOUNT NAME", "AMOUNT"]]
+        summaries["exist"].append(_not_found_summary(rows, exist, lead_a, lead_b).set_index([LEAD, "ACCOUNT NAME"]))
+        summaries["comp"].append(_not_found_summary(rows, comp, lead_b, lead_a).set_index([LEAD, "ACCOUNT NAME"]))
+        summaries = {k: [_combine(v, [LEAD, "ACCOUNT NAME"])] for k, v in summaries.items()}
+
+    return (
+        exist.reset_index(), summaries["exist"][0].sort_index().reset_index(),
+        comp.reset_index(), summaries["comp"][0].sort_index().reset_index()
+    )
+
+
+def account_name_totals(df):
+    # Record count and amount per (transaction, lead, account name): all a
+    # not-found summary needs from the rows of an untraced transaction
+    check_gl_columns(df)
+    return df.groupby([TXN, LEAD, "ACCOUNT NAME"], observed=True).agg(
+        NUMBER_OF_RECORDS=("AMOUNT", "count"),
+        AMOUNT=("AMOUNT", "sum")
+    ).reset_index()
+
+
+def _not_found_totals(totals, pivot_from, lead_from, lead_to):
+    # _not_found_summary over account_name_totals rather than GL rows
+    not_found_txns = pivot_from.index[pivot_from[f'NO_OF_RECS_{lead_to}'] == 0]
+    not_found = totals[totals[TXN].isin(not_found_txns) & (totals[LEAD] != lead_from)]
+    return not_found.groupby([LEAD, "ACCOUNT NAME"], observed=True)[["NUMBER_OF_RECORDS", "AMOUNT"]].sum() \
+        .sort_index().reset_index()
+
+
+def trace_lead_pair_totals(postings, totals, lead_a, lead_b):
+    # trace_lead_pair over per-file aggregates of a GL split across files:
+    # gl_postings and account_name_totals of each file, as flat frames. Only
+    # the aggregates of the pair's leads and untraced transactions are read.
+    lead_a = int(lead_a)
+    lead_b = int(lead_b)
+
+    pair = [frame[frame[LEAD].isin([lead_a, lead_b])].set_index([TXN, LEAD]) for frame in postings]
+    pair = _combine(pair, [TXN, LEAD]).sort_index()
+    exist = _trace_found(pair, lead_a, lead_b)
+    comp = _trace_found(pair, lead_b, lead_a)
+
+    untraced = exist.index[exist[f'NO_OF_RECS_{lead_b}'] == 0].union(
+        comp.index[comp[f'NO_OF_RECS_{lead_a}'] == 0])
+    rows = pd.concat([frame[frame[TXN].isin(untraced)] for frame in totals])
+
+    return (
+        exist.reset_index(), _not_found_totals(rows, exist, lead_a, lead_b),
+        comp.reset_index(), _not_found_totals(rows, comp, lead_b, lead_a)
+    )
+
+
+def trace_transactions_between_leads(df, lead_from, lead_to):
+    lead_to = int(lead_to)
+    lead_from = int(lead_from)
+    check_gl_columns(df)
+
+    postings = lead_postings(df, [lead_from, lead_to])
+    pivot_from = _trace_found(postings, lead_from, lead_to)
+
+    untraced = pivot_from.index[pivot_from[f'NO_OF_RECS_{lead_to}'] == 0]
+    rows = df.loc[df[TXN].isin(untraced), [TXN, LEAD, "ACCOUNT NAME", "AMOUNT"]]
+    return pivot_from.reset_index(), _not_found_summary(rows, pivot_from, lead_from, lead_to)
+
+
+def trace_matrix(postings):
+    # Sparse matrix in coordinate form: one row per ordered (from, to) lead pair
+    # that shares at least one traced transaction. Amounts and the difference
+    # cover the shared transactions only.
+    flat = postings.reset_index()
+    pairs = flat.merge(flat, on=TXN, suffixes=("_FROM", "_TO"))
+    pairs = pairs[(pairs[f"{LEAD}_FROM"] != pairs[f"{LEAD}_TO"]) & (pairs["DOCUMENT NUMBER_TO"] > 0)]
+
+    matrix = pairs.groupby([f"{LEAD}_FROM", f"{LEAD}_TO"], observed=True).agg(
+        TRANSACTIONS=(TXN, "size"),
+        AMOUNT=("AMOUNT_FROM", "sum"),
+        AMOUNT_CL_SUM=("AMOUNT_TO", "sum"),
+        NO_OF_RECS=("DOCUMENT NUMBER_TO", "sum")
+    ).sort_index()
+    matrix["DIFFERENCE"] = matrix["AMOUNT"] + matrix["AMOUNT_CL_SUM"]
+    matrix.index.names = ["LEAD FROM", "LEAD TO"]
+    return matrix
+
+
+def trace_cell(postings, lead_from, lead_to):
+    # Matched transactions behind one cell of the trace matrix
+    found = _trace_found(postings, lead_from, lead_to)
+    return found[found[f'NO_OF_RECS_{lead_to}'] > 0].reset_index()
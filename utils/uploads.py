@@ -0,0 +1,152 @@
+import fcntl
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+
+from dash import dcc, html
+
+from utils.store import DATA_DIR, SESSION_TTL_SECONDS
+
+UPLOAD_DIR = os.path.join(DATA_DIR, "uploads")
+# Largest chunk the upload route accepts in one request
+MAX_CHUNK_BYTES = 8 * 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.environ.get("MOORE_MAX_UPLOAD_MB", "2048")) * 1024 * 1024
+# File types utils.loaders can parse, as a dcc.Upload accept string
+UPLOAD_ACCEPT = ".csv,.txt,.gz,.xlsx,.parquet"
+
+UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+
+UPLOAD_STYLE = {
+    'width': '48%',
+    'height': '60px',
+    'lineHeight': '60px',
+    'borderWidth': '1px',
+    'borderStyle': 'dashed',
+    'borderRadius': '5px',
+    'textAlign': 'center',
+    'margin': '10px'
+}
+
+
+def upload_box(upload_id, label, ref_id, status_id, multiple=False):
+    # A drop zone whose files assets/chunked_upload.js slices and streams to the
+    # upload route; the reference (or list of references) lands in ref_id's data
+    return html.Div(
+        dcc.Upload(id=upload_id, children=html.Div([label]), style=UPLOAD_STYLE,
+                   accept=UPLOAD_ACCEPT, multiple=multiple),
+        **{"data-upload-ref": ref_id, "data-upload-status": status_id, "data-upload-accept": UPLOAD_ACCEPT,
+           "data-upload-max-bytes": str(MAX_UPLOAD_BYTES), "data-upload-multiple": str(multiple).lower()}
+    )
+
+
+class UploadError(ValueError):
+    pass
+
+
+class UploadStore:
+    """Uploads streamed to local disk in chunks and referenced by id.
+
+    Chunks must arrive in order: a chunk is only appended when its offset
+    equals the bytes received so far, so a client that lost a response can
+    ask for the status and resume from the reported offset.
+    """
+
+    def __init__(self, root, ttl_seconds):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(root, exist_ok=True)
+
+    def _paths(self, upload_id):
+        if not upload_id or not UPLOAD_ID.match(upload_id):
+            raise UploadError("Invalid upload id")
+        base = os.path.join(self.root, upload_id)
+        return base + ".part", base + ".json"
+
+    def _read_meta(self, upload_id):
+        _, meta_path = self._paths(upload_id)
+        try:
+            with open(meta_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadError("Unknown upload id")
+
+    def _write_meta(self, upload_id, meta):
+        _, meta_path = self._paths(upload_id)
+        tmp = meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, meta_path)
+
+    def create(self, filename, size):
+        size = int(size)
+        if size < 0 or size > MAX_UPLOAD_BYTES:
+            raise UploadError("File is too large")
+        self.evict()
+        upload_id = uuid.uuid4().hex
+        data_path, _ = self._paths(upload_id)
+        open(data_path, "wb").close()
+        self._write_meta(upload_id, {"id": upload_id, "filename": os.path.basename(filename or ""),
+                                     "size": size, "sha256": None})
+        return self.status(upload_id)
+
+    def status(self, upload_id):
+        meta = self._read_meta(upload_id)
+        data_path, _ = self._paths(upload_id)
+        meta["received"] = os.path.getsize(data_path)
+        meta["complete"] = meta["sha256"] is not None
+        return meta
+
+    def append(self, upload_id, offset, chunk):
+        if len(chunk) > MAX_CHUNK_BYTES:
+            raise UploadError("Chunk is too large")
+        data_path, _ = self._paths(upload_id)
+        try:
+            part = open(data_path, "r+b")
+        except FileNotFoundError:
+            raise UploadError("Unknown upload id")
+        # Requests for one upload may reach different workers, so the check,
+        # the write and the hash run under an exclusive lock on the .part file
+        with part:
+            fcntl.flock(part, fcntl.LOCK_EX)
+            meta = self.status(upload_id)
+            if meta["complete"]:
+                return meta
+            # Out-of-order or repeated chunks are ignored; the client resumes from "received"
+            if offset != meta["received"] or offset + len(chunk) > meta["size"]:
+                return meta
+            part.seek(0, os.SEEK_END)
+            part.write(chunk)
+            part.flush()
+            if offset + len(chunk) == meta["size"]:
+                self._finish(upload_id)
+        return self.status(upload_id)
+
+    def _finish(self, upload_id):
+        data_path, _ = self._paths(upload_id)
+        digest = hashlib.sha256()
+        with open(data_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        meta = self._read_meta(upload_id)
+        meta["sha256"] = digest.hexdigest()
+        self._write_meta(upload_id, meta)
+
+    def path(self, upload_id):
+        if not self.status(upload_id)["complete"]:
+            raise UploadError("Upload is not complete")
+        return self._paths(upload_id)[0]
+
+    def evict(self):
+        now = time.time()
+        for entry in os.scandir(self.root):
+            try:
+                if now - entry.stat().st_mtime > self.ttl_seconds:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+uploads = UploadStore(UPLOAD_DIR, SESSION_TTL_SECONDS)